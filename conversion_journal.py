@@ -0,0 +1,89 @@
+# conversion_journal.py
+import os
+import json
+import logging
+
+# Journal of the running conversion, next to output-unsorted.csv
+JOURNAL_PATH = "convert_csv.journal"
+
+
+class ResumeError(Exception):
+    """Raised when a journal doesn't belong to the conversion that should be resumed."""
+
+
+class ConversionJournal:
+    """Write-ahead journal of a conversion, one JSON line per completed month.
+
+    The first line describes the run: input hashes and options, and the invoice counter it started
+    with. Invoice numbers are planned from the statement up front and the fee sums are closed at
+    the end of every month, so a month boundary needs nothing else to continue: each checkpoint
+    holds the number of completed months, the size of output-unsorted.csv after them and the
+    warnings, validation results and quarantined rows so far. The CSV is synced to disk and buffered invoices are
+    written before the checkpoint, so a checkpoint never points at output that isn't there.
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.file = None
+
+    def load(self, run):
+        """Returns the header and the last checkpoint of a journal written for the same run.
+
+        Returns (None, None) if there is no journal.
+        """
+        if not os.path.exists(self.path):
+            logging.info("No journal %s, starting from the first month", self.path)
+            return None, None
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break  # A checkpoint cut off by the crash
+        if not entries or entries[0].get("run") != json.loads(json.dumps(run)):
+            raise ResumeError(f"The journal {self.path} was written for other input files or options, "
+                              "run the conversion without --resume")
+        return entries[0], entries[-1] if len(entries) > 1 else None
+
+    def start(self, run, start_counter, checkpoint=None):
+        """Opens the journal for a new run, or for a resumed run at its last checkpoint.
+
+        The new journal replaces the old one in a single rename, so there is always a complete one.
+        """
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            for entry in [{"run": run, "start_counter": start_counter}] + ([checkpoint] if checkpoint else []):
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            sync_file(f)
+        os.replace(self.path + ".tmp", self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def checkpoint(self, months_done, month, csv_offset, unmapped, failures, validated, quarantine=()):
+        entry = {"months_done": months_done, "month": list(month), "csv_offset": csv_offset,
+                 "unmapped": dict(unmapped), "failures": failures, "validated": validated,
+                 "quarantine": [[list(row), error] for row, error in quarantine]}
+        self._write(entry)
+        return entry
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def finish(self):
+        """Removes the journal after a completed conversion."""
+        self.file.close()
+        os.remove(self.path)
+
+    def close(self):
+        """Keeps the journal of a failed conversion for --resume."""
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+
+def sync_file(file):
+    """Flushes a file to disk and returns its size."""
+    file.flush()
+    os.fsync(file.fileno())
+    return file.tell()
@@ -0,0 +1,249 @@
+# csv_ingest.py
+import os
+import io
+import csv
+import gc
+import bz2
+import gzip
+import lzma
+import glob
+import fnmatch
+import zipfile
+import logging
+import warnings
+import functools
+import contextlib
+from datetime import datetime
+import numpy
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.compute as pa_compute
+except ImportError:  # pyarrow is optional, the pandas and csv backends work without it
+    pa = None
+
+BACKENDS = ("auto", "pyarrow", "pandas", "csv")
+
+# Date format of the Etsy statement, e.g. "September 10, 2024"
+STATEMENT_DATE_FORMAT = "%B %d, %Y"
+
+# Compressed files are decompressed while reading, picked by the file extension
+DECOMPRESSORS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# Separates a ZIP archive from a member in a path, e.g. "etsy.zip::EtsySoldOrders2024.csv"
+ZIP_MEMBER_SEPARATOR = "::"
+
+
+def archive_path(filepath):
+    """Returns the file on disk for a path that may name a ZIP member. File hashes are taken of it."""
+    return filepath.partition(ZIP_MEMBER_SEPARATOR)[0]
+
+
+def is_plain_file(filepath):
+    """True for an uncompressed file, which can be memory-mapped."""
+    extension = os.path.splitext(archive_path(filepath))[1].lower()
+    return extension != ".zip" and extension not in DECOMPRESSORS
+
+
+def _single_csv_member(archive, filepath):
+    members = [name for name in archive.namelist() if name.lower().endswith(".csv")]
+    if len(members) != 1:
+        raise ValueError(f"{filepath} contains {len(members)} CSV files, "
+                         f"name one as {filepath}{ZIP_MEMBER_SEPARATOR}<member>: {', '.join(members)}")
+    return members[0]
+
+
+@contextlib.contextmanager
+def open_binary(filepath):
+    """Opens a CSV file for reading as bytes, decompressing .gz, .bz2, .xz and ZIP members on the fly.
+
+    A .zip path reads its only CSV member, "archive.zip::member.csv" a specific one.
+    """
+    path, _, member = filepath.partition(ZIP_MEMBER_SEPARATOR)
+    extension = os.path.splitext(path)[1].lower()
+    with contextlib.ExitStack() as stack:
+        if extension == ".zip":
+            archive = stack.enter_context(zipfile.ZipFile(path))
+            stream = stack.enter_context(archive.open(member or _single_csv_member(archive, path)))
+        elif extension in DECOMPRESSORS:
+            stream = stack.enter_context(DECOMPRESSORS[extension](path, "rb"))
+        else:
+            stream = stack.enter_context(open(path, "rb"))
+        yield stream
+
+
+@contextlib.contextmanager
+def open_text(filepath):
+    """Opens a CSV file like open_binary, as text for the csv module."""
+    with open_binary(filepath) as stream:
+        yield io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def find_csv_files(directory, pattern):
+    """Finds CSV files matching pattern (e.g. "EtsySoldOrders*"), compressed or inside ZIP archives.
+
+    Returns the paths sorted by name, ZIP members as "archive.zip::member.csv".
+    """
+    filenames = []
+    for extension in [".csv"] + [".csv" + suffix for suffix in DECOMPRESSORS]:
+        filenames += glob.glob(os.path.join(directory, pattern + extension))
+    for zip_filename in glob.glob(os.path.join(directory, "*.zip")):
+        try:
+            with zipfile.ZipFile(zip_filename) as archive:
+                filenames += [zip_filename + ZIP_MEMBER_SEPARATOR + name for name in archive.namelist()
+                              if fnmatch.fnmatch(os.path.basename(name), pattern + ".csv")]
+        except zipfile.BadZipFile as e:
+            logging.warning("Skipped %s: %s", zip_filename, e)
+    return sorted(filenames)
+
+
+def resolve_backend(backend="auto"):
+    """Picks the fastest available backend for 'auto' and checks explicit choices."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown CSV backend '{backend}', use one of {', '.join(BACKENDS)}")
+    if backend == "auto":
+        return "pyarrow" if pa is not None else "pandas"
+    if backend == "pyarrow" and pa is None:
+        raise ImportError("The pyarrow CSV backend requires pyarrow (pip install pyarrow)")
+    return backend
+
+
+@functools.lru_cache(maxsize=None)
+def parse_statement_date(value):
+    """Parses a statement date. Cached, since a statement only has a few distinct dates."""
+    return datetime.strptime(value.strip('"'), STATEMENT_DATE_FORMAT)
+
+
+def sort_rows_by_date(rows):
+    """Sorts statement rows by date, oldest first. The sort is stable, so same-day rows keep their order."""
+    return sorted(rows, key=lambda row: parse_statement_date(row[0]))
+
+
+@contextlib.contextmanager
+def gc_paused():
+    """Pauses the cyclic garbage collector while building many row lists, which contain no cycles."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def read_header(filepath):
+    """Reads only the header row of a CSV file."""
+    with open_text(filepath) as file:
+        return next(csv.reader(file), [])
+
+
+def _normalize_rows(rows, width):
+    """Pads short rows with empty strings, so every backend yields rows of the header width."""
+    return [row + [""] * (width - len(row)) if len(row) < width else row for row in rows]
+
+
+def _read_csv_module(filepath, columns=None, sort_by_date=False, where=None):
+    with open_text(filepath) as file, gc_paused():
+        reader = csv.reader(file)
+        header = next(reader, [])
+        if where is not None:
+            # Streams the file and only keeps the matching rows
+            index, values = header.index(where[0]), where[1]
+            rows = _normalize_rows([row for row in reader if len(row) > index and row[index] in values],
+                                   len(header))
+        else:
+            rows = _normalize_rows([row for row in reader if row], len(header))
+    if sort_by_date:
+        rows = sort_rows_by_date(rows)
+    if columns is not None:
+        indexes = [header.index(column) for column in columns]
+        rows = [[row[i] for i in indexes] for row in rows]
+        header = list(columns)
+    return header, rows
+
+
+def _read_pandas(filepath, columns=None, memory_map=False, sort_by_date=False, where=None):
+    # index_col=False keeps a first row with more fields than the header from moving the first
+    # column into the index; pandas only warns about it, which is turned into an error here
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.ParserWarning)
+        if is_plain_file(filepath):
+            df = pd.read_csv(filepath, dtype=str, na_filter=False, encoding='utf-8-sig', engine='c',
+                             usecols=columns, index_col=False, memory_map=memory_map)
+        else:
+            with open_binary(filepath) as stream:
+                df = pd.read_csv(stream, dtype=str, na_filter=False, encoding='utf-8-sig', engine='c',
+                                 usecols=columns, index_col=False)
+    df = df.fillna("")
+    if where is not None:
+        df = df[df[where[0]].isin(where[1])]
+    if sort_by_date:
+        dates = pd.to_datetime(df.iloc[:, 0].str.strip('"'), format=STATEMENT_DATE_FORMAT)
+        df = df.iloc[numpy.argsort(dates.values, kind="stable")]
+    if columns is not None:
+        df = df[list(columns)]
+    values = [df[column].tolist() for column in df.columns]
+    with gc_paused():
+        return list(df.columns), list(map(list, zip(*values)))
+
+
+def _read_pyarrow(filepath, columns=None, memory_map=False, sort_by_date=False, where=None):
+    header = read_header(filepath)
+    convert_options = pa_csv.ConvertOptions(
+        column_types={name: pa.string() for name in header},
+        strings_can_be_null=False,
+        include_columns=list(columns) if columns is not None and not sort_by_date else None,
+    )
+    if is_plain_file(filepath):
+        source = pa.memory_map(filepath) if memory_map else filepath
+        table = pa_csv.read_csv(source, convert_options=convert_options)
+    else:
+        with open_binary(filepath) as stream:
+            table = pa_csv.read_csv(stream, convert_options=convert_options)
+    if where is not None:
+        # Filtered before any Python object is created for the rows that are dropped
+        table = table.filter(pa_compute.is_in(table.column(where[0]), value_set=pa.array(list(where[1]), pa.string())))
+    if sort_by_date:
+        # Parse each distinct date once, vectorized; sort_indices is a stable sort like sorted()
+        encoded = table.column(0).combine_chunks().dictionary_encode()
+        dates = pa_compute.strptime(encoded.dictionary, format=STATEMENT_DATE_FORMAT, unit="s").take(encoded.indices)
+        table = table.take(pa_compute.sort_indices(dates))
+    if columns is not None:
+        table = table.select(list(columns))
+    with gc_paused():
+        values = [column.to_pylist() for column in table.columns]
+        return table.column_names, list(map(list, zip(*values)))
+
+
+def read_csv_rows(filepath, columns=None, backend="auto", memory_map=False, sort_by_date=False, where=None):
+    """Reads a CSV file into (header, rows) with every cell as a string.
+
+    All backends return the same normalized rows: lists of strings, padded with empty strings to the
+    header width; a row with more fields than the header keeps them. If columns is given, only
+    those columns are returned, in that order. With sort_by_date the rows are sorted by the
+    statement date in the first column. where is a (column, values) pair, only rows whose value in
+    that column is in values are kept. Compressed files and ZIP members are read directly (see
+    open_binary). The pyarrow backend falls back to pandas for files it cannot parse, e.g. rows with
+    fewer fields than the header, and pandas to the csv module, e.g. for rows with more fields.
+    """
+    backend = resolve_backend(backend)
+    if backend == "pyarrow":
+        try:
+            return _read_pyarrow(filepath, columns, memory_map, sort_by_date, where)
+        except pa.ArrowException as e:
+            logging.warning("pyarrow could not parse %s, falling back to pandas: %s", filepath, e)
+            backend = "pandas"
+    if backend == "pandas":
+        try:
+            return _read_pandas(filepath, columns, memory_map, sort_by_date, where)
+        except (pd.errors.ParserError, pd.errors.ParserWarning) as e:
+            logging.warning("pandas could not parse %s, falling back to the csv module: %s", filepath, e)
+    return _read_csv_module(filepath, columns, sort_by_date, where)
+
+
+def read_statement_rows(filepath, backend="auto", memory_map=False):
+    """Reads the Etsy statement and returns its data rows without the header, sorted by date."""
+    _, rows = read_csv_rows(filepath, backend=backend, memory_map=memory_map, sort_by_date=True)
+    return rows
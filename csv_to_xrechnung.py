@@ -5,9 +5,39 @@ from datetime import datetime
 from decimal import Decimal
 
 # Import functions from xrechnung_generator.py
-from xrechnung_generator import generate_xrechnung_lxml, load_country_codes
+from xrechnung_generator import InvoiceSpec, generate_xrechnungen, load_country_codes
 
-def process_csv_to_xrechnung(csv_filepath, output_dir):
+
+def read_invoice_specs(df):
+    """Yields an InvoiceSpec (with reverse charge) for every row of the invoice CSV."""
+    for index, row in df.iterrows():
+        # Extract data from CSV (adjust column names as needed)
+        invoice_number = row['Invoice Number']
+        order_info = row['Order Info']
+        amount = Decimal(row['Amount'])
+        date_str = row['Date']
+        date = datetime.strptime(date_str, "%Y-%m-%d")  # Adjust date format if needed
+        buyer = row['Buyer']
+        buyer_vat_id = row['VATID']
+
+        # Create address details dictionary
+        address_details = {
+            "Street 1": row['Street 1'],
+            "Street 2": row['Street 2'],
+            "Ship City": row['City'],
+            "Ship Zipcode": str(row['Zipcode']),
+            "Ship Country": row['Country']
+        }
+
+        # Handle optional cancellation data
+        is_cancellation = row.get('Is Cancellation', False)  # Use .get() for optional columns
+        original_invoice_number = row.get('Original Invoice Number', None)
+
+        yield InvoiceSpec(invoice_number, order_info, amount, date, buyer, address_details, is_cancellation,
+                          original_invoice_number, True, buyer_vat_id)
+
+
+def process_csv_to_xrechnung(csv_filepath, output_dir, workers=1):
     """
     Reads invoice data from a CSV file, generates XRechnung XML files,
     and saves them to the specified output directory.
@@ -20,40 +50,16 @@ def process_csv_to_xrechnung(csv_filepath, output_dir):
         # Read CSV into a pandas DataFrame
         df = pd.read_csv(csv_filepath)
 
-        # Iterate through rows and generate XRechnung for each invoice
-        for index, row in df.iterrows():
-            # Extract data from CSV (adjust column names as needed)
-            invoice_number = row['Invoice Number']
-            order_info = row['Order Info']
-            amount = Decimal(row['Amount'])
-            date_str = row['Date']
-            date = datetime.strptime(date_str, "%Y-%m-%d")  # Adjust date format if needed
-            buyer = row['Buyer']
-            buyer_vat_id = row['VATID']
-
-            # Create address details dictionary
-            address_details = {
-                "Street 1": row['Street 1'],
-                "Street 2": row['Street 2'],
-                "Ship City": row['City'],
-                "Ship Zipcode": str(row['Zipcode']),
-                "Ship Country": row['Country']
-            }
-
-            print(address_details.get("Street 1", ""))
-
-            # Handle optional cancellation data
-            is_cancellation = row.get('Is Cancellation', False)  # Use .get() for optional columns
-            original_invoice_number = row.get('Original Invoice Number', None)
-
-            # Generate XRechnung XML
-            generate_xrechnung_lxml(
-                invoice_number, order_info, amount, date, buyer,
-                address_details, country_codes, is_cancellation,
-                original_invoice_number, output_dir, True, buyer_vat_id
-            )
-
-            print(f"Generated XRechnung for invoice: {invoice_number}")
+        # Generate all invoices in one batch, a failing invoice doesn't stop the others
+        failed = 0
+        for result in generate_xrechnungen(read_invoice_specs(df), country_codes, output_dir, workers=workers):
+            if result.error:
+                failed += 1
+                print(f"Error: XRechnung for invoice {result.invoice_number} failed: {result.error}")
+            else:
+                print(f"Generated XRechnung for invoice: {result.invoice_number}")
+        if failed:
+            sys.exit(1)
 
     except FileNotFoundError:
         print(f"Error: CSV file not found at {csv_filepath}")
@@ -4,13 +4,36 @@ import logging
 import hashlib
 import argparse
 import os
-import glob
+import re
+import sys
+import contextlib
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
+from typing import NamedTuple
 from dotenv import load_dotenv
 import pandas as pd
 from lxml import etree
 from xrechnung_generator import generate_xrechnung_lxml
-from xrechnung_generator import load_country_codes
+from xrechnung_generator import load_country_codes, UNMAPPED_COUNTRIES, INVOICE_FORMATS
+from lexoffice_upload import upload_invoices, print_upload_summary
+from ledger_export import ledger_record, write_ledger, monthly_totals, format_monthly_totals
+from xrechnung_validator import ValidatingInvoiceWriter
+from csv_ingest import (BACKENDS, read_csv_rows, read_statement_rows, parse_statement_date, find_csv_files,
+                        archive_path, sort_rows_by_date, read_header)
+from conversion_journal import ConversionJournal, ResumeError, sync_file
+from invoice_numbering import NUMBERING_SCHEMES, format_invoice_number, plan_invoice_numbers
+from statement_shards import split_month_shards, build_order_index, shard_context, referenced_order
+from ledger_store import LEDGER_STORE_PATH, open_store, store_records
+import ledger_store
+from vat_report import VAT_REPORT_PERIODS, VatReportSink, aggregate_vat, write_vat_report
+from statement_dedupe import SqliteFingerprintStore, dedupe_rows, format_dedupe_stats, row_fingerprint
+from exchange_rates import EXCHANGE_RATES_PATH, convert_rows, original_currency, original_amount
+from memory_report import MemoryReport, estimate_size, format_bytes
+from order_store import OrderStore
+from pipeline import (StatementRecord, EventRecorder, CsvSink, LedgerSink, XRechnungSink, AuditLogSink,
+                      dispatch_event, run_pipeline, close_sinks)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,15 +41,6 @@ load_dotenv()
 # Global dictionary to store invoice_number to order_number mapping
 invoice_order_mapping = {}
 
-# Configuration for EU countries and VAT rates
-EU_COUNTRIES = {
-    "AT": "Austria", "BE": "Belgium", "BG": "Bulgaria", "CY": "Cyprus", "CZ": "Czech Republic",
-    "DE": "Germany", "DK": "Denmark", "EE": "Estonia", "ES": "Spain", "FI": "Finland", "FR": "France",
-    "GR": "Greece", "HR": "Croatia", "HU": "Hungary", "IE": "Ireland", "IT": "Italy", "LT": "Lithuania",
-    "LU": "Luxembourg", "LV": "Latvia", "MT": "Malta", "NL": "Netherlands", "PL": "Poland",
-    "PT": "Portugal", "RO": "Romania", "SE": "Sweden", "SI": "Slovenia", "SK": "Slovakia"
-}
-
 # Sender address from .env file
 SENDER_COMPANY_NAME = os.getenv("SENDER_COMPANY_NAME")
 SENDER_NAME = os.getenv("SENDER_NAME")
@@ -44,9 +58,9 @@ INVOICE_COUNTER = 0
 
 
 def calculate_file_hash(filepath):
-    """Calculates the SHA-256 hash of a file."""
+    """Calculates the SHA-256 hash of a file. For a ZIP member, the hash of the whole archive is taken."""
     sha256_hash = hashlib.sha256()
-    with open(filepath, "rb") as f:
+    with open(archive_path(filepath), "rb") as f:
         for byte_block in iter(lambda: f.read(4096), b""):
             sha256_hash.update(byte_block)
     return sha256_hash.hexdigest()
@@ -58,11 +72,23 @@ def get_datetime_filename():
     return now.strftime("%Y%m%d_%H%M%S")
 
 
+def get_last_day_of_month(year, month):
+    """Returns the last day of a month, the booking date of its fee summary."""
+    return datetime(year, month, 1) + pd.offsets.MonthEnd(0)
+
+
 def configure_logging(filename):
-    """Configures logging to write to the specified file."""
+    """Configures logging to write to the specified file.
+
+    Without a filename, only warnings and errors are shown on the console and no log file is written.
+    """
     for handler in logging.getLogger().handlers[:]:
         logging.getLogger().removeHandler(handler)
 
+    if filename is None:
+        logging.getLogger().setLevel(logging.WARNING)
+        return
+
     file_handler = logging.FileHandler(filename)
     file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 
@@ -70,12 +96,13 @@ def configure_logging(filename):
     logging.getLogger().setLevel(logging.INFO)
 
 
-def process_deposit(row, writer):
+def process_deposit(row, writer, ledger=None):
     """Processes a deposit row from the CSV."""
     try:
         logging.info("Processing deposit: %s", row)
         date = datetime.strptime(row[0].strip('"'), "%B %d, %Y").date()
         amount = float(row[2].split('€')[1].strip().split(' ')[0].replace(',', '.'))
+        currency, exchange_rate = original_currency(row)
 
         output_row = [
             date.strftime("%d.%m.%Y"),
@@ -86,47 +113,108 @@ def process_deposit(row, writer):
         ]
         writer.writerow(output_row)
         logging.info("Wrote row to CSV: %s", output_row)
+        if ledger is not None:
+            ledger.append(ledger_record(date, "Auszahlung", -amount, buyer="Etsy Ireland UC",
+                                        description="Geldtransit/Umbuchung/Auszahlung", currency=currency,
+                                        exchange_rate=exchange_rate, source=row_fingerprint(row)))
     except Exception as e:  # Catching a too general exception is ok in this context since we log the error.
         logging.error("Error processing deposit row: %s. Error: %s", row, e)
         raise
 
 
-def load_orders_file(orders_directory="."):
-    """Load the orders CSV file and return a dictionary with Order ID as keys."""
-    orders_dict = {}
-    for filename in glob.glob(os.path.join(orders_directory, "EtsySoldOrders*.csv")):
+# Columns of the orders export that are kept per order
+ORDER_FIELDS = ("Full Name", "Street 1", "Street 2", "Ship City", "Ship State", "Ship Zipcode", "Ship Country")
+ORDER_FIELD_INDEX = {field: index for index, field in enumerate(ORDER_FIELDS)}
+
+# Period in the name of an orders export, e.g. EtsySoldOrders2024-9.csv or EtsySoldOrders2024.csv.gz
+ORDERS_FILE_PATTERN = re.compile(r"EtsySoldOrders(\d{4})(?:-(\d{1,2}))?\.csv(?:\.gz|\.bz2|\.xz)?$")
+
+
+class OrderRecord(tuple):
+    """Compact record of one order with the values of ORDER_FIELDS.
+
+    Looks up fields like the dict it replaces, record.get("Full Name"), and has the same repr,
+    so the texts built from the address stay the same.
+    """
+    __slots__ = ()
+
+    def get(self, field, default=None):
+        index = ORDER_FIELD_INDEX.get(field)
+        return default if index is None else self[index]
+
+    def __repr__(self):
+        return repr(dict(zip(ORDER_FIELDS, self)))
+
+
+def get_referenced_orders(rows):
+    """Returns the order numbers of all Sale and Refund rows of the statement."""
+    return {order_info for order_info in map(referenced_order, rows) if order_info is not None}
+
+
+def get_orders_files(orders_directory="."):
+    """Returns the orders exports and whether they are ordered newest first.
+
+    Compressed exports and exports inside ZIP archives are included (see csv_ingest.find_csv_files).
+    The files can only be ordered if every file name contains its period (see ORDERS_FILE_PATTERN),
+    otherwise they are returned in name order.
+    """
+    filenames = find_csv_files(orders_directory, "EtsySoldOrders*")
+    periods = [ORDERS_FILE_PATTERN.search(os.path.basename(filename)) for filename in filenames]
+    if not all(periods):
+        return filenames, False
+    # A yearly export sorts like the December export of that year
+    newest_first = sorted(zip(filenames, periods), reverse=True,
+                          key=lambda item: (int(item[1].group(1)), int(item[1].group(2) or 12)))
+    return [filename for filename, _ in newest_first], True
+
+
+def load_orders_file(orders_directory=".", backend="auto", order_ids=None, orders=None):
+    """Load the orders CSV file and return a dictionary with Order ID as keys.
+
+    With order_ids, only those orders are kept, and if the files can be visited newest first,
+    the loading stops as soon as all of them are found. An order in several files is then taken
+    from the newest one. orders is the mapping the orders are loaded into, e.g. an OrderStore,
+    a new dict by default.
+    """
+    orders_dict = {} if orders is None else orders
+    filenames, newest_first = get_orders_files(orders_directory)
+    where = ("Order ID", order_ids) if order_ids is not None else None
+    missing = set(order_ids or ())
+
+    for filename in filenames:
+        if newest_first and where and not missing:
+            logging.info("Skipped orders file %s, all referenced orders are loaded", filename)
+            continue
         try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    orders_dict[row["Order ID"]] = {
-                        "Full Name": row["Full Name"],
-                        "Street 1": row["Street 1"],
-                        "Street 2": row["Street 2"],
-                        "Ship City": row["Ship City"],
-                        "Ship State": row["Ship State"],
-                        "Ship Zipcode": row["Ship Zipcode"],
-                        "Ship Country": row["Ship Country"]
-                    }
-            logging.info("Loaded orders from: %s", filename)
-            logging.info(f"Input file hash: {calculate_file_hash(filename)}")
+            _, rows = read_csv_rows(filename, columns=("Order ID",) + ORDER_FIELDS, backend=backend, where=where)
+            for row in rows:
+                if newest_first and row[0] in orders_dict:
+                    continue
+                orders_dict[row[0]] = OrderRecord(row[1:])
+                missing.discard(row[0])
+            logging.info("Loaded %d orders from: %s", len(rows), filename)
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info(f"Input file hash: {calculate_file_hash(filename)}")
         except Exception as e:
             logging.error("Error loading orders from %s: %s", filename, e)
+
+    if missing:
+        logging.info("%d referenced orders are not in the orders files", len(missing))
     return orders_dict
 
 def generate_invoice_number(date, is_cancellation=False):
     """Generates a unique invoice number based on the date, with an optional -STORNO suffix."""
     global INVOICE_COUNTER
     INVOICE_COUNTER += 1
-    year = str(date.year)[-2:]
-    month = str(date.month).zfill(2)
-    invoice_number = f"ETSY-{year}{month}-{INVOICE_COUNTER:04}"
-    if is_cancellation:
-        invoice_number += "-STORNO"
-    return invoice_number
-
-def process_sale(row, rows, writer, orders_dict, country_codes):
-    """Processes a sale row from the CSV."""
+    return format_invoice_number(date, INVOICE_COUNTER, is_cancellation)
+
+def process_sale(row, rows, writer, orders_dict, country_codes, ledger=None, invoice_generator=None,
+                 invoice_number=None):
+    """Processes a sale row from the CSV.
+
+    invoice_generator replaces generate_xrechnung_lxml, e.g. to validate the invoices before writing.
+    invoice_number is the number planned by plan_invoice_numbers, otherwise the next number is drawn.
+    """
     try:
         logging.info("Processing sale: %s", row)
         date = datetime.strptime(row[0].strip('"'), "%B %d, %Y").date()
@@ -145,9 +233,14 @@ def process_sale(row, rows, writer, orders_dict, country_codes):
                     tax_row = r
                     break
 
+            fees_taxes_value = 0.0
+            # The invoice of a converted row shows the amount of the statement in its currency
+            currency_amount = original_amount(row, 7)
             if tax_row:
                 fees_taxes_value = float(tax_row[6].replace('-', '').replace('€', '').replace(',', '.'))
                 amount -= fees_taxes_value
+                if currency_amount is not None:
+                    currency_amount -= abs(original_amount(tax_row, 6, original_currency(row)[1]))
                 calculation_details = f"({row[7].strip()} € - {fees_taxes_value:.2f} € (US-Sales Taxes paid by Etsy))"
             else:
                 calculation_details = f"({row[7].strip()} €)"
@@ -160,8 +253,12 @@ def process_sale(row, rows, writer, orders_dict, country_codes):
             calculation_details += f" | Address: {address}"
             calculation_details = calculation_details.replace(',', ';')
 
-            # Generate Invoice Number
-            invoice_number = generate_invoice_number(date)
+            # Generate Invoice Number, unless it was planned up front
+            if invoice_number is None:
+                invoice_number = generate_invoice_number(date)
+
+            # Rows in other currencies were converted to euro, the invoice is in the original currency
+            currency, exchange_rate = original_currency(row)
 
             # Store invoice number to order number mapping
             invoice_order_mapping[order_info] = invoice_number
@@ -176,9 +273,17 @@ def process_sale(row, rows, writer, orders_dict, country_codes):
             ]
             writer.writerow(output_row)
             logging.info("Wrote row to CSV: %s", output_row)
+            if ledger is not None:
+                ledger.append(ledger_record(date, "Verkauf", amount, order_info, invoice_number, buyer,
+                                            address_details.get("Ship Country"), tax=fees_taxes_value,
+                                            currency=currency, exchange_rate=exchange_rate,
+                                            source=row_fingerprint(row)))
 
             # Generate XRechnung
-            invoice_filename = generate_xrechnung_lxml(invoice_number, f"Etsy Bestellung #{order_info}", amount, date, buyer, address_details, country_codes)
+            invoice_generator = invoice_generator or generate_xrechnung_lxml
+            invoice_filename = invoice_generator(invoice_number, f"Etsy Bestellung #{order_info}", amount, date, buyer, address_details, country_codes,
+                                                 currency=currency, exchange_rate=exchange_rate,
+                                                 currency_amount=currency_amount)
             logging.info("Generated XRechnung: %s", invoice_filename)
             
 
@@ -187,8 +292,13 @@ def process_sale(row, rows, writer, orders_dict, country_codes):
         raise
 
 
-def process_refund(row, rows, writer, orders_dict, country_codes):
-    """Processes a refund row from the CSV."""
+def process_refund(row, rows, writer, orders_dict, country_codes, ledger=None, invoice_generator=None,
+                   invoice_number=None, original_invoice_number=None):
+    """Processes a refund row from the CSV.
+
+    invoice_number and original_invoice_number are the numbers planned by plan_invoice_numbers.
+    Without them, the original invoice is looked up in invoice_order_mapping.
+    """
     try:
         logging.info("Processing refund: %s", row)
         date = datetime.strptime(row[0].strip('"'), "%B %d, %Y").date()
@@ -207,6 +317,8 @@ def process_refund(row, rows, writer, orders_dict, country_codes):
                 refund_amount = 0.0
         else:
             refund_amount = float(row[6].replace('€', '').replace(',', '.').strip())
+        # The invoice of a converted row shows the amount of the statement in its currency
+        currency_amount = original_amount(row, 7 if row[6] == '--' else 6)
 
         fee_credit_rows = []
         for r in rows:
@@ -220,11 +332,14 @@ def process_refund(row, rows, writer, orders_dict, country_codes):
 
             if "Credit for processing fee" in fee_credit_row[2] or "Credit for transaction fee" in fee_credit_row[2]:
                 refund_amount += fee_credit_amount
+                if currency_amount is not None:
+                    currency_amount += original_amount(fee_credit_row, 7, original_currency(row)[1])
                 logging.info("Adjusting refund amount by +%.2f EUR for fee credit: %s", fee_credit_amount,
                              fee_credit_row[2])
             else:
                 logging.warning("Fee credit type not handled: %s", fee_credit_row[2])
 
+        sales_tax_amount = 0.0
         sale_row = None
         for r in rows:
             if r[1] == "Sale" and "for Order" in r[2] and order_info in r[2]:
@@ -241,8 +356,6 @@ def process_refund(row, rows, writer, orders_dict, country_codes):
             sale_amount = float(sale_row[7].replace('€', '').replace(',', '.').strip())
             if tax_row:
                 sales_tax_amount = float(tax_row[6].replace('€', '').replace('-', '').strip())
-            else:
-                sales_tax_amount = 0.0
 
             amount = -(sale_amount - sales_tax_amount)
             logging.info("Setting refund amount to %.2f EUR (negating original sale amount minus sales tax)", amount)
@@ -253,8 +366,8 @@ def process_refund(row, rows, writer, orders_dict, country_codes):
             sale_amount_str = "N/A"
 
         # Extract original invoice number from sale row
-        original_invoice_number = None
-        original_invoice_number = invoice_order_mapping.get(order_info)
+        if invoice_number is None:
+            original_invoice_number = invoice_order_mapping.get(order_info)
         logging.info("Extracted original invoice number: %s", original_invoice_number)
 
         if "Partial" in row[2]:
@@ -268,9 +381,12 @@ def process_refund(row, rows, writer, orders_dict, country_codes):
         calculation_details = calculation_details.replace(',', ';')
 
         refund_amount = -abs(refund_amount)
+        currency, exchange_rate = original_currency(row)
 
         # Generate cancellation invoice number
-        if original_invoice_number is None:
+        if invoice_number is not None:
+            cancellation_invoice_number = invoice_number
+        elif original_invoice_number is None:
             cancellation_invoice_number = generate_invoice_number(date, is_cancellation=True)
         else:
             cancellation_invoice_number = original_invoice_number + "-STORNO"
@@ -285,11 +401,19 @@ def process_refund(row, rows, writer, orders_dict, country_codes):
 
         writer.writerow(output_row)
         logging.info("Wrote refund row to CSV: %s", output_row)
+        if ledger is not None:
+            ledger.append(ledger_record(date, "Rückerstattung", refund_amount, order_info, cancellation_invoice_number,
+                                        buyer, address_details.get("Ship Country"), tax=sales_tax_amount,
+                                        fee_credit=total_fee_credit, description=refund_type, currency=currency,
+                                        exchange_rate=exchange_rate, source=row_fingerprint(row)))
 
         # Generate XRechnung for cancellation invoice
-        invoice_filename = generate_xrechnung_lxml(cancellation_invoice_number, f"Etsy Bestellung #{order_info}", -refund_amount, date, buyer,
+        invoice_generator = invoice_generator or generate_xrechnung_lxml
+        invoice_filename = invoice_generator(cancellation_invoice_number, f"Etsy Bestellung #{order_info}", -refund_amount, date, buyer,
                                 address_details, country_codes, is_cancellation=True,
-                                original_invoice_number=original_invoice_number)
+                                original_invoice_number=original_invoice_number, currency=currency,
+                                exchange_rate=exchange_rate,
+                                currency_amount=None if currency_amount is None else abs(currency_amount))
         logging.info("Generated XRechnung: %s", invoice_filename)
         logging.info("Generated XRechnung for cancellation invoice: %s", cancellation_invoice_number)
 
@@ -298,20 +422,21 @@ def process_refund(row, rows, writer, orders_dict, country_codes):
         raise
 
 
-def process_fee(row, data, current_month, writer, next_listing_fee_is_renew):
+def process_fee(row, data, current_month, writer, next_listing_fee_is_renew, ledger=None):
     """Processes a fee row from the CSV."""
     try:
         logging.info("Processing fee: %s", row)
         date = datetime.strptime(row[0].strip('"'), "%B %d, %Y").date()
 
+        # Close the previous month with its own last day; current_month is (year, month)
+        if current_month and current_month != (date.year, date.month):
+            write_summarized_data(data, get_last_day_of_month(*current_month), writer, ledger)
+            data.clear()
+        current_month = (date.year, date.month)
+
         if "Etsy Ireland UC" not in data:
             data["Etsy Ireland UC"] = {}
 
-        if current_month and current_month != date.month:
-            write_summarized_data(data, datetime(date.year, date.month, 1) + pd.offsets.MonthEnd(0), writer)
-            data.clear()
-        current_month = date.month
-
         title = row[2]
         fees_taxes = row[6]
         credit = False
@@ -359,7 +484,7 @@ def update_fees(data, recipient, fee_type, fees_taxes):
             data[recipient][fee_type] -= fees_taxes_value
             logging.info(f"Subtracted {fees_taxes_value:.2f} EUR from {fee_type} for {recipient} (new sum: {data[recipient][fee_type]:.2f} EUR)")
 
-def write_summarized_data(data, last_day_of_month, writer):
+def write_summarized_data(data, last_day_of_month, writer, ledger=None):
     logging.info(f"Writing summarized data for {last_day_of_month}")
     for recipient, fees in data.items():
         for fee_type, amount in fees.items():
@@ -383,73 +508,595 @@ def write_summarized_data(data, last_day_of_month, writer):
             if output_row:
                 writer.writerow(output_row)
                 logging.info(f"Wrote row to CSV: {output_row}")
+                if ledger is not None:
+                    ledger.append(ledger_record(last_day_of_month.date(), output_row[1], -amount, buyer=recipient,
+                                                description=fee_type))
 
-def convert_csv(input_file, output_file):
-    """Converts the input CSV to the output CSV with the specified transformations."""
-    filename_prefix = "convert_csv"
-    datetime_part = get_datetime_filename()
-    log_filename = f"{filename_prefix}_{datetime_part}.log"
+# Handler of each statement row type. Rows of other types (e.g. Tax) are only looked up by the handlers.
+ROW_KINDS = {"Deposit": "deposit", "Sale": "sale", "Refund": "refund", "Fee": "fee", "Marketing": "fee"}
 
-    configure_logging(log_filename)
 
-    logging.info(f"Input file: {input_file}")
-    logging.info(f"Input file hash: {calculate_file_hash(input_file)}")
+def normalize_rows(rows):
+    """Pipeline stage: wraps every statement row with its position and month."""
+    for index, row in enumerate(rows):
+        date = parse_statement_date(row[0])
+        yield StatementRecord(index, row, (date.year, date.month))
+
+
+def classify_rows(records):
+    """Pipeline stage: picks the handler of every row and drops the rows without one."""
+    for record in records:
+        kind = ROW_KINDS.get(record.row[1])
+        if kind is not None:
+            yield record._replace(kind=kind)
+
+
+def enrich_rows(records, numbers):
+    """Pipeline stage: adds the planned invoice numbers, numbers is aligned with the statement rows."""
+    for record in records:
+        invoice_number, original_invoice_number = numbers[record.index]
+        yield record._replace(invoice_number=invoice_number, original_invoice_number=original_invoice_number)
 
-    # Load country codes at the beginning
-    country_codes = load_country_codes()
 
-    orders_dict = {}
-    orders_dict = load_orders_file()
+def emit_events(records, context, orders_dict, country_codes, quarantine=None):
+    """Pipeline stage: converts every row with its handler and yields the resulting events.
 
+    The handlers write to an EventRecorder instead of the outputs, so every Booking and
+    InvoiceRequest is passed on to the sinks. After the last row the month is closed with its fee
+    summary. context holds the rows the handlers search for tax, sale and fee credit rows.
+
+    If quarantine is a list, a row whose handler fails is appended to it as (row, error) with none
+    of its output, and the conversion continues. Otherwise the error is raised.
+    """
+    recorder = EventRecorder()
     data = {}
     current_month = None
     next_listing_fee_is_renew = False
 
-    with open(input_file, 'r', encoding='utf-8-sig') as infile, \
-            open('output-unsorted.csv', 'w', newline='', encoding='utf-8') as outfile_unsorted:
-        reader = csv.reader(infile)
-        writer_unsorted = csv.writer(outfile_unsorted, delimiter=',')
-        writer_unsorted.writerow(['BUCHUNGSDATUM', 'ZUSATZINFO', 'AUFTRAGGEBER/EMPFÄNGER', 'VERWENDUNGSZWECK', 'BETRAG'])
-
-        # Skip the header row
-        next(reader, None)  # Read and discard the header
-
-        # Sort rows by date, oldest first
-        rows = sorted(list(reader), key=lambda row: datetime.strptime(row[0].strip('"'), "%B %d, %Y"))
-        logging.info(f"Read and sorted {len(rows)} rows from input file {input_file}")
-
-        for row in rows:
-            input_type = row[1]
-            if input_type == "Deposit":
-                process_deposit(row, writer_unsorted)
-            elif input_type == "Sale":
-                process_sale(row, rows, writer_unsorted, orders_dict, country_codes)
-            elif input_type == "Refund":
-                process_refund(row, rows, writer_unsorted, orders_dict, country_codes)
-            elif input_type in ("Fee", "Marketing"):
-                data, current_month, next_listing_fee_is_renew = process_fee(row, data, current_month,
-                                                                          writer_unsorted, next_listing_fee_is_renew)
-
-        last_row_date = datetime.strptime(rows[-1][0].strip('"'), "%B %d, %Y").date()
-        write_summarized_data(data, datetime(last_row_date.year, last_row_date.month, 1) + pd.offsets.MonthEnd(0), writer_unsorted)
-
-    with open('output-unsorted.csv', 'r', encoding='utf-8') as outfile_unsorted, \
-            open(output_file, 'w', newline='', encoding='utf-8') as outfile:
-        reader_unsorted = csv.reader(outfile_unsorted)
-        writer = csv.writer(outfile, delimiter=',')
-        header = next(reader_unsorted)
-        writer.writerow(header)
-
-        for row in reader_unsorted:
-            writer.writerow(row)
-
-    logging.info(f"Conversion complete. Output saved to {output_file}")
-    logging.info(f"Output file hash: {calculate_file_hash(output_file)}") # Moved outside the with block
+    for record in records:
+        row = record.row
+        recorder.row = row
+        try:
+            if record.kind == "deposit":
+                process_deposit(row, recorder, recorder)
+            elif record.kind == "sale":
+                process_sale(row, context, recorder, orders_dict, country_codes, recorder, recorder,
+                             record.invoice_number)
+            elif record.kind == "refund":
+                process_refund(row, context, recorder, orders_dict, country_codes, recorder, recorder,
+                               record.invoice_number, record.original_invoice_number)
+            elif record.kind == "fee":
+                data, current_month, next_listing_fee_is_renew = process_fee(row, data, current_month, recorder,
+                                                                          next_listing_fee_is_renew, recorder)
+        except Exception as e:
+            if quarantine is None:
+                raise
+            recorder.drain()  # Drop whatever the handler wrote before it failed
+            quarantine.append((row, f"{type(e).__name__}: {e}"))
+            logging.error("Quarantined row %s: %s", row, e)
+            continue
+        yield from recorder.drain()
+
+    if current_month:
+        write_summarized_data(data, get_last_day_of_month(*current_month), recorder, recorder)
+        yield from recorder.drain()
+
+
+def month_events(rows, context, numbers, orders_dict, country_codes, quarantine=None):
+    """Chains the pipeline stages for the rows of one calendar month (see statement_shards)."""
+    records = enrich_rows(classify_rows(normalize_rows(rows)), numbers)
+    return emit_events(records, context, orders_dict, country_codes, quarantine)
+
+
+def _init_month_worker(log_filename):
+    """Lets a worker process log into the log file of the conversion."""
+    configure_logging(log_filename)
+    # A forked worker inherits the tracing of a memory report, which only covers the parent process
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _convert_month_worker(task):
+    """Converts one month in a worker process.
+
+    The XRechnungen are generated in the worker, all events are returned to the parent process,
+    which passes them to the other sinks in date order.
+    """
+    rows, context, numbers, orders_dict, write_invoices, validate, invoice_formats, continue_on_error = task
+    UNMAPPED_COUNTRIES.clear()
+    country_codes = load_country_codes()
+    # The month already runs in its own process, so the validation does not start another pool
+    validator = ValidatingInvoiceWriter(max_workers=1, formats=invoice_formats) if validate else None
+    quarantine = [] if continue_on_error else None
+    sinks = ([XRechnungSink(country_codes, validator, formats=invoice_formats, quarantine=quarantine)]
+             if write_invoices else [])
+
+    events = []
+    for event in month_events(rows, context, numbers, orders_dict, country_codes, quarantine):
+        dispatch_event(event, sinks)
+        events.append(event)
+    close_sinks(sinks)
+
+    failures, total = {}, 0
+    if validator:
+        failures, total = validator.failures, validator.total
+    return events, Counter(UNMAPPED_COUNTRIES), failures, total, quarantine or []
+
+
+# Rows that failed with --continue-on-error
+QUARANTINE_PATH = "quarantine.csv"
+
+
+def write_quarantine(quarantine, header, filepath=QUARANTINE_PATH):
+    """Writes the quarantined rows with their error, so they can be fixed and converted again."""
+    with open(filepath, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header + ["Error"])
+        for row, error in quarantine:
+            writer.writerow(row + [error])
+    logging.warning(f"Wrote {len(quarantine)} quarantined row(s) to {filepath}")
+
+
+class ConversionOptions(NamedTuple):
+    """Options of a conversion, see convert_csv."""
+    ledger_file: str = None
+    validate: bool = False
+    backend: str = "auto"
+    memory_map: bool = False
+    numbering: str = "global"
+    workers: int = 1
+    write_csv: bool = True
+    write_invoices: bool = True
+    dry_run: bool = False
+    invoice_formats: tuple = ("ubl",)
+    seen_rows: str = None
+    vat_report: tuple = ()
+    vat_period: str = "quarter"
+    store_file: str = None
+    resume: bool = False
+    continue_on_error: bool = False
+    exchange_rates: str = EXCHANGE_RATES_PATH
+    max_memory: int = None
+    memory_report: bool = False
+
+
+class Conversion:
+    """One run of convert_csv, from the statement files to the Lexoffice CSV and the other outputs.
+
+    The constructor sets up everything the months need: the journal, the statement rows and
+    orders, and the sinks. run() converts the months and writes the outputs.
+    """
+
+    def __init__(self, input_files, output_file, options, sinks=()):
+        self.input_files = input_files
+        self.output_file = output_file
+        self.options = options
+        if options.dry_run:
+            self.log_filename = None
+        else:
+            filename_prefix = "convert_csv"
+            datetime_part = get_datetime_filename()
+            self.log_filename = f"{filename_prefix}_{datetime_part}.log"
+
+        configure_logging(self.log_filename)
+        self.memory = MemoryReport() if options.memory_report else None
+        # Set by _read_inputs (plan) and _month_tasks (shards, order_index)
+        self.plan = None
+        self.shards = None
+        self.order_index = None
+        self._open_journal()
+
+        # Load country codes at the beginning
+        self.country_codes = load_country_codes()
+        UNMAPPED_COUNTRIES.clear()
+
+        self.ledger = [] if options.ledger_file or options.store_file or options.dry_run else None
+        self.validator = (ValidatingInvoiceWriter(formats=options.invoice_formats)
+                          if options.validate and options.write_invoices else None)
+        self._read_inputs()
+        self._create_sinks(sinks)
+
+    def _open_journal(self):
+        """Hashes the input files and loads the checkpoint to resume from."""
+        options = self.options
+        input_hashes = []
+        for path in self.input_files:
+            logging.info(f"Input file: {path}")
+            if not options.dry_run:
+                input_hashes.append(calculate_file_hash(path))
+                logging.info(f"Input file hash: {input_hashes[-1]}")
+
+        # The journal only continues a run with the same inputs and options
+        self.journal = self.checkpoint = self.run_info = None
+        self.start_counter = INVOICE_COUNTER
+        if options.dry_run:
+            return
+        self.journal = ConversionJournal()
+        self.run_info = {
+            "input_files": [[str(path), file_hash] for path, file_hash in zip(self.input_files, input_hashes)],
+            "numbering": options.numbering, "write_csv": options.write_csv,
+            "write_invoices": options.write_invoices, "invoice_formats": list(options.invoice_formats),
+            "validate": options.validate, "seen_rows": options.seen_rows,
+            "continue_on_error": options.continue_on_error,
+            "exchange_rates": calculate_file_hash(options.exchange_rates)
+            if os.path.exists(archive_path(options.exchange_rates)) else None}
+        if options.resume:
+            header, self.checkpoint = self.journal.load(self.run_info)
+            if header is not None:
+                self.start_counter = header["start_counter"]
+            if self.checkpoint is not None:
+                logging.info(f"Resuming after {self.checkpoint['months_done']} month(s), the last one "
+                             f"{self.checkpoint['month'][0]}-{self.checkpoint['month'][1]:02d}")
+                if options.write_csv and not os.path.exists('output-unsorted.csv'):
+                    raise ResumeError("output-unsorted.csv of the interrupted run is missing")
+
+    def _read_inputs(self):
+        """Reads the statement rows and the orders they refer to."""
+        options, memory = self.options, self.memory
+
+        # Read the statement without its header row, sorted by date, oldest first
+        row_sets = [read_statement_rows(path, backend=options.backend, memory_map=options.memory_map)
+                    for path in self.input_files]
+        self.seen_store = self.fingerprint_counts = None
+        if len(row_sets) > 1 or options.seen_rows:
+            # A dry run looks at the rows booked before, but doesn't record its own
+            self.seen_store = (SqliteFingerprintStore(options.seen_rows, read_only=options.dry_run)
+                               if options.seen_rows else None)
+            rows, self.fingerprint_counts, dedupe_stats = dedupe_rows(row_sets, self.seen_store)
+            rows = sort_rows_by_date(rows)
+            logging.info(format_dedupe_stats(dedupe_stats))
+            if dedupe_stats.duplicates or dedupe_stats.already_booked:
+                print(format_dedupe_stats(dedupe_stats))
+        else:
+            rows = row_sets[0]
+        del row_sets
+
+        # Amounts in other currencies are converted to euro before any handler sees them
+        rows, currencies = convert_rows(rows, options.exchange_rates)
+        if currencies:
+            converted = ", ".join(f"{count} {currency}" for currency, count in sorted(currencies.items()))
+            logging.info(f"Converted rows to EUR with the rates of {options.exchange_rates}: {converted}")
+
+        rows_size = estimate_size(rows) if memory is not None or options.max_memory is not None else None
+        if memory is not None:
+            memory.add("Statement rows", rows_size, f"{len(rows)} rows")
+
+        # Only the orders the statement refers to are loaded, into a file above the memory budget
+        self.orders_store = None
+        if options.max_memory is not None:
+            orders_budget = options.max_memory * 2 ** 20 - rows_size
+            logging.info(f"Statement rows need ~{format_bytes(rows_size)}, "
+                         f"~{format_bytes(max(orders_budget, 0))} are left for the orders index")
+            if orders_budget <= 0:
+                logging.warning(f"The statement rows alone need ~{format_bytes(rows_size)}, more than --max-memory")
+            self.orders_store = OrderStore(max(orders_budget, 0))
+        orders_dict = load_orders_file(backend=options.backend, order_ids=get_referenced_orders(rows),
+                                       orders=self.orders_store)
+        if self.orders_store is not None and not self.orders_store.spilled:
+            orders_dict = self.orders_store.orders
+        self.rows, self.orders_dict = rows, orders_dict
+
+    def _create_sinks(self, sinks):
+        """Creates the outputs, the XRechnungen are generated in the worker processes if there are any."""
+        options = self.options
+        self.output_sinks = [LedgerSink(self.ledger)] if self.ledger is not None else []
+        self.vat_sink = (VatReportSink(self.country_codes, count_unmapped=not options.write_invoices)
+                         if options.vat_report else None)
+        self.output_sinks += [self.vat_sink] if self.vat_sink else []
+        self.output_sinks += [AuditLogSink(), *sinks]
+        self.quarantine = [] if options.continue_on_error else None
+        self.invoice_sinks = ([XRechnungSink(self.country_codes, self.validator, formats=options.invoice_formats,
+                                             quarantine=self.quarantine)]
+                              if options.write_invoices else [])
+
+    def run(self):
+        """Converts all months and writes the outputs. Returns the monthly totals of a dry run."""
+        global INVOICE_COUNTER
+        options, checkpoint = self.options, self.checkpoint
+        if checkpoint:
+            # Drop whatever the interrupted run wrote after its last checkpoint
+            if options.write_csv:
+                os.truncate('output-unsorted.csv', checkpoint["csv_offset"])
+            if self.validator:
+                self.validator.failures.update(checkpoint["failures"])
+                self.validator.total = checkpoint["validated"]
+
+        with (open('output-unsorted.csv', 'a' if checkpoint else 'w', newline='', encoding='utf-8')
+              if options.write_csv else contextlib.nullcontext()) as outfile_unsorted:
+            if options.write_csv:
+                writer_unsorted = csv.writer(outfile_unsorted, delimiter=',')
+                if not checkpoint:
+                    writer_unsorted.writerow(['BUCHUNGSDATUM', 'ZUSATZINFO', 'AUFTRAGGEBER/EMPFÄNGER', 'VERWENDUNGSZWECK', 'BETRAG'])
+                self.output_sinks.insert(0, CsvSink(writer_unsorted))
+            logging.info(f"Read and sorted {len(self.rows)} rows from input file(s) "
+                         f"{', '.join(map(str, self.input_files))}")
+
+            # Assign all invoice numbers up front, so they don't depend on the processing order
+            self.plan = plan_invoice_numbers(self.rows, self.orders_dict, options.numbering, start=self.start_counter,
+                                             known_invoices=invoice_order_mapping)
+            INVOICE_COUNTER = self.plan.last_counter
+            invoice_order_mapping.update(self.plan.by_order)
+
+            self._run_months(outfile_unsorted)
+        return self._finish()
+
+    def _month_tasks(self, first, last):
+        """Yields the rows, the context and the planned invoice numbers of the months first to last."""
+        for shard in self.shards[first:last]:
+            month_rows = [self.rows[index] for index in shard.indexes]
+            numbers = [self.plan.numbers.get(index, (None, None)) for index in shard.indexes]
+            yield month_rows, shard_context(self.rows, shard, self.order_index), numbers
+
+    def _run_months(self, outfile_unsorted):
+        """Converts every month on its own, the handlers only search the rows related to it.
+
+        After every month, a checkpoint is written to the journal. The months completed before an
+        interruption only run through the sinks kept in memory.
+        """
+        options, journal, validator = self.options, self.journal, self.validator
+        rows, orders_dict, country_codes, quarantine = self.rows, self.orders_dict, self.country_codes, self.quarantine
+        output_sinks, invoice_sinks = self.output_sinks, self.invoice_sinks
+        self.shards = shards = split_month_shards(rows)
+        self.order_index = build_order_index(rows)
+        logging.info(f"Converting {len(shards)} months with {options.workers} worker(s)")
+
+        def write_checkpoint(month_number):
+            if journal is None:
+                return
+            for sink in invoice_sinks:
+                sink.flush()
+            csv_offset = sync_file(outfile_unsorted) if options.write_csv else 0
+            journal.checkpoint(month_number + 1, shards[month_number].month, csv_offset, UNMAPPED_COUNTRIES,
+                               validator.failures if validator else {}, validator.total if validator else 0,
+                               quarantine or ())
+
+        months_done = self.checkpoint["months_done"] if self.checkpoint else 0
+        if journal is not None:
+            journal.start(self.run_info, self.start_counter, self.checkpoint)
+        try:
+            replay_sinks = [sink for sink in output_sinks if not isinstance(sink, CsvSink)]
+            for month_rows, context, numbers in self._month_tasks(0, months_done):
+                run_pipeline(month_events(month_rows, context, numbers, orders_dict, country_codes, quarantine),
+                             replay_sinks)
+            if self.checkpoint:
+                # Taken from the checkpoint, a replayed VAT report may have counted them again
+                UNMAPPED_COUNTRIES.clear()
+                UNMAPPED_COUNTRIES.update(self.checkpoint["unmapped"])
+                if quarantine is not None:
+                    # The replay skips the invoices, their failures are only in the checkpoint
+                    quarantine[:] = [(row, error) for row, error in self.checkpoint["quarantine"]]
+
+            if options.workers > 1 and len(shards) - months_done > 1:
+                with ProcessPoolExecutor(max_workers=options.workers, initializer=_init_month_worker,
+                                         initargs=(self.log_filename,)) as executor:
+                    tasks = ((month_rows, context, numbers,
+                              {order: orders_dict[order] for order in map(referenced_order, month_rows)
+                               if order in orders_dict},
+                              options.write_invoices, validator is not None, options.invoice_formats,
+                              options.continue_on_error)
+                             for month_rows, context, numbers in self._month_tasks(months_done, len(shards)))
+                    # map() returns the months in submission order, so the merge keeps the date order
+                    results = executor.map(_convert_month_worker, tasks)
+                    for month_number, (events, unmapped, failures, total, bad_rows) in enumerate(results, months_done):
+                        run_pipeline(events, output_sinks)
+                        UNMAPPED_COUNTRIES.update(unmapped)
+                        if quarantine is not None:
+                            quarantine.extend(bad_rows)
+                        if validator:
+                            validator.failures.update(failures)
+                            validator.total += total
+                        write_checkpoint(month_number)
+            else:
+                for month_number, (month_rows, context, numbers) in enumerate(
+                        self._month_tasks(months_done, len(shards)), months_done):
+                    run_pipeline(month_events(month_rows, context, numbers, orders_dict, country_codes, quarantine),
+                                 output_sinks + invoice_sinks)
+                    write_checkpoint(month_number)
+
+            close_sinks(output_sinks + invoice_sinks)
+            if self.memory is not None:
+                self.memory.measure("Orders index", orders_dict, f"{len(orders_dict)} orders" + (
+                    f", in {orders_dict.path}, {orders_dict.cache_size} cached"
+                    if orders_dict is self.orders_store else ""))
+        finally:
+            if journal is not None:
+                journal.close()
+            if self.orders_store is not None:
+                self.orders_store.close()
+
+    def _finish(self):
+        """Reports the warnings and writes the outputs kept until the end: the CSV, ledger, store and VAT report."""
+        options, ledger, validator, memory = self.options, self.ledger, self.validator, self.memory
+
+        # Only a completed conversion counts its rows as booked
+        if self.seen_store is not None:
+            self.seen_store.update(self.fingerprint_counts)
+            self.seen_store.close()
+
+        if UNMAPPED_COUNTRIES:
+            unmapped = ", ".join(f"{name} ({count}x)" for name, count in sorted(UNMAPPED_COUNTRIES.items()))
+            logging.warning("Countries without country code, invoiced as export: %s", unmapped)
+            print(f"Warning: countries without country code, invoiced as export: {unmapped}")
+
+        if validator:
+            report = validator.report()
+            logging.info(report)
+            print(report)
+
+        if self.quarantine:
+            write_quarantine(self.quarantine, read_header(self.input_files[0]))
+            print(f"Warning: {len(self.quarantine)} row(s) could not be converted, see {QUARANTINE_PATH}")
+
+        if memory is not None:
+            if ledger is not None:
+                memory.measure("Ledger records", ledger, f"{len(ledger)} records")
+            invoice_file = next((path for path in (os.path.join("Rechnungen", f"{number}.xml")
+                                                   for number in self.plan.by_order.values())
+                                 if os.path.exists(path)), None)
+            if options.write_invoices and invoice_file:
+                memory.measure_xml("XRechnung tree (lxml)", invoice_file, "per invoice, one at a time per process")
+            report = memory.report()
+            logging.info(report)
+            print(report)
+
+        if options.dry_run:
+            totals = monthly_totals(ledger)
+            print(format_monthly_totals(totals))
+            return totals
+
+        if options.write_csv:
+            with open('output-unsorted.csv', 'r', encoding='utf-8') as outfile_unsorted, \
+                    open(self.output_file, 'w', newline='', encoding='utf-8') as outfile:
+                reader_unsorted = csv.reader(outfile_unsorted)
+                writer = csv.writer(outfile, delimiter=',')
+                header = next(reader_unsorted)
+                writer.writerow(header)
+
+                for row in reader_unsorted:
+                    writer.writerow(row)
+
+            logging.info(f"Conversion complete. Output saved to {self.output_file}")
+            logging.info(f"Output file hash: {calculate_file_hash(self.output_file)}") # Moved outside the with block
+        else:
+            logging.info("Conversion complete. The Lexoffice CSV was skipped")
+
+        if options.ledger_file:
+            write_ledger(ledger, options.ledger_file)
+            logging.info(f"Ledger file hash: {calculate_file_hash(options.ledger_file)}")
+
+        if options.store_file:
+            connection = open_store(options.store_file)
+            try:
+                added = store_records(connection, ledger, self.input_files)
+            finally:
+                connection.close()
+            logging.info(f"Added {added} of {len(ledger)} ledger records to the ledger store {options.store_file}")
+
+        if self.vat_sink:
+            report = aggregate_vat(self.vat_sink.figures, options.vat_period)
+            for report_file in options.vat_report:
+                write_vat_report(report, report_file)
+
+        # Everything is written, a rerun starts from scratch
+        self.journal.finish()
+
+
+def convert_csv(input_file, output_file=None, ledger_file=None, validate=False, backend="auto", memory_map=False,
+                numbering="global", workers=1, write_lexoffice_csv=True, write_invoices=True, dry_run=False, sinks=(),
+                invoice_formats=("ubl",), seen_rows=None, vat_report=(), vat_period="quarter",
+                store_file=None, resume=False, continue_on_error=False, exchange_rates=EXCHANGE_RATES_PATH,
+                max_memory=None, memory_report=False):
+    """Converts the input CSV to the output CSV with the specified transformations.
+
+    input_file can also be a list of statement exports, e.g. with overlapping date ranges. Rows
+    repeated by overlapping exports are dropped (see statement_dedupe). With seen_rows, the
+    fingerprints of all converted rows are kept in that SQLite file, and rows converted by an
+    earlier run are dropped as well.
+
+    If a ledger_file (.parquet or .arrow) is given, the normalized ledger is written there as well.
+    With validate, every XRechnung is checked against the UBL schema before it is written.
+    invoice_formats selects UBL and/or CII XRechnungen (see xrechnung_generator.INVOICE_FORMATS),
+    the CII files are written to Rechnungen/CII.
+    backend selects the CSV reader for the statement and the orders files (see csv_ingest.BACKENDS).
+    numbering selects the invoice numbering scheme (see invoice_numbering.NUMBERING_SCHEMES).
+    With workers > 1, every calendar month is converted in its own process and the months are
+    merged into the output in date order. The output is the same as with a single process.
+
+    write_lexoffice_csv and write_invoices switch the Lexoffice CSV and the XRechnung stage off. A dry_run
+    skips both, writes no file at all (not even the log) and prints and returns the monthly totals.
+
+    The rows run through the stages of month_events; every output is a pipeline.Sink. Additional
+    sinks passed in sinks receive every Booking and InvoiceRequest in date order.
+
+    vat_report lists .csv and/or .json files for the VAT/OSS summary of all invoices per
+    vat_period (see vat_report.VAT_REPORT_PERIODS), destination country, VAT category and rate.
+
+    With store_file, the ledger records are added to that SQLite ledger store, where the query
+    subcommand looks them up by order, invoice number, buyer or date (see ledger_store).
+
+    Every completed month is checkpointed in a journal (see conversion_journal). After a crash,
+    resume continues after the last checkpoint with the same invoice numbers, and the output is
+    the same as that of an uninterrupted run. With continue_on_error, rows whose handler fails
+    are written to quarantine.csv with their error instead of stopping the conversion.
+
+    Rows in other currencies than euro are converted with the ECB reference rate of their date from
+    the exchange_rates file (see exchange_rates). The ledger keeps their original currency and
+    rate, and their XRechnungen are issued in the original currency with the VAT in euro.
+
+    With max_memory (in MB), the orders index is moved to a temporary SQLite file as soon as it
+    and the statement rows would need more (see order_store). The output stays the same.
+    memory_report traces the memory of the conversion and prints its peak and the estimated size
+    of the largest structures (see memory_report).
+    """
+    options = ConversionOptions(ledger_file, validate, backend, memory_map, numbering, workers, write_lexoffice_csv,
+                                write_invoices, dry_run, invoice_formats, seen_rows, vat_report, vat_period,
+                                store_file, resume, continue_on_error, exchange_rates, max_memory, memory_report)
+    if dry_run:
+        options = options._replace(write_csv=False, write_invoices=False, validate=False, ledger_file=None,
+                                   vat_report=(), store_file=None)
+    input_files = [input_file] if isinstance(input_file, (str, os.PathLike)) else list(input_file)
+    return Conversion(input_files, output_file, options, sinks).run()
 
 if __name__ == "__main__":
+    # python etsy_to_lexoffice.py query --order 1001
+    if len(sys.argv) > 1 and sys.argv[1] == "query":
+        sys.exit(ledger_store.main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(description='Convert Etsy CSV statement.')
-    parser.add_argument('-infile', '--input_file', required=True, help='Path to the input CSV file')
-    parser.add_argument('-outfile', '--output_file', required=True, help='Path to the output CSV file')
+    parser.add_argument('-infile', '--input_file', required=True, nargs='+',
+                        help='Path to the input CSV file, or several overlapping exports')
+    parser.add_argument('-outfile', '--output_file', help='Path to the output CSV file')
+    parser.add_argument('--seen-rows', help='SQLite file with the rows of earlier runs, which are skipped')
+    parser.add_argument('--ledger', help='Also write the normalized ledger to this .parquet or .arrow file')
+    parser.add_argument('--store', default=LEDGER_STORE_PATH,
+                        help='Ledger store for the query subcommand (default: %(default)s)')
+    parser.add_argument('--no-store', action='store_true', help="Don't add the bookings to the ledger store")
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted conversion after its last checkpoint')
+    parser.add_argument('--continue-on-error', action='store_true',
+                        help='Write rows that fail to quarantine.csv and convert the rest')
+    parser.add_argument('--vat-report', action='append', default=[],
+                        help='Write the VAT/OSS summary to this .csv or .json file, can be given more than once')
+    parser.add_argument('--vat-period', choices=VAT_REPORT_PERIODS, default='quarter',
+                        help='Period of the VAT/OSS summary (default: quarter)')
+    parser.add_argument('--validate', action='store_true', help='Validate the XRechnungen against the UBL schema')
+    parser.add_argument('--upload', action='store_true', help='Upload the generated XRechnungen to Lexoffice')
+    parser.add_argument('--reader', choices=BACKENDS, default='auto', help='CSV reader backend (default: fastest available)')
+    parser.add_argument('--mmap', action='store_true', help='Memory-map the statement file while reading')
+    parser.add_argument('--numbering', choices=NUMBERING_SCHEMES, default='global',
+                        help='Invoice numbering: one running counter or a counter per month')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Convert the months in this many parallel processes (default: 1)')
+    parser.add_argument('--exchange-rates', default=EXCHANGE_RATES_PATH,
+                        help='ECB reference rate CSV or ZIP for statements in other currencies (default: %(default)s)')
+    parser.add_argument('--max-memory', type=int, metavar='MB',
+                        help='Move the orders index to a temporary SQLite file above this many MB')
+    parser.add_argument('--memory-report', action='store_true',
+                        help='Trace the memory use and print its peak and the size of the largest structures')
+    parser.add_argument('--invoice-format', choices=INVOICE_FORMATS + ('both',), default='ubl',
+                        help='XRechnung syntax: UBL (default), CII in Rechnungen/CII, or both')
+    stages = parser.add_mutually_exclusive_group()
+    stages.add_argument('--no-invoices', action='store_true', help='Only write the Lexoffice CSV, no XRechnungen')
+    stages.add_argument('--invoices-only', action='store_true', help='Only write the XRechnungen, no Lexoffice CSV')
+    stages.add_argument('--dry-run', action='store_true',
+                        help='Print the monthly totals without writing any file')
     args = parser.parse_args()
 
-    convert_csv(args.input_file, args.output_file)
+    write_csv = not (args.invoices_only or args.dry_run)
+    if write_csv and not args.output_file:
+        parser.error("the following arguments are required: -outfile/--output_file")
+    if args.upload and (args.no_invoices or args.dry_run):
+        parser.error("--upload needs the XRechnungen, it can't be combined with --no-invoices or --dry-run")
+
+    convert_csv(args.input_file, args.output_file, ledger_file=args.ledger, validate=args.validate,
+                backend=args.reader, memory_map=args.mmap, numbering=args.numbering, workers=args.workers,
+                write_lexoffice_csv=write_csv, write_invoices=not args.no_invoices, dry_run=args.dry_run,
+                invoice_formats=INVOICE_FORMATS if args.invoice_format == 'both' else (args.invoice_format,),
+                seen_rows=args.seen_rows, vat_report=args.vat_report, vat_period=args.vat_period,
+                store_file=None if args.no_store else args.store, resume=args.resume,
+                continue_on_error=args.continue_on_error, exchange_rates=args.exchange_rates,
+                max_memory=args.max_memory, memory_report=args.memory_report)
+
+    if args.upload:
+        summary = upload_invoices()
+        print_upload_summary(summary)
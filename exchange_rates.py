@@ -0,0 +1,195 @@
+# exchange_rates.py
+import os
+import re
+import logging
+import functools
+from bisect import bisect_right
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+from csv_ingest import read_csv_rows, parse_statement_date, archive_path
+
+# ECB euro reference rates, e.g. eurofxref-hist.zip from
+# https://www.ecb.europa.eu/stats/eurofxref/eurofxref-hist.zip (also unzipped or the daily eurofxref.csv)
+EXCHANGE_RATES_PATH = os.getenv("EXCHANGE_RATES_PATH", "eurofxref-hist.csv")
+
+# Currency of the bookings and of the VAT
+BASE_CURRENCY = "EUR"
+
+# Rates are published on TARGET working days, a longer gap means the rate file is out of date
+MAX_RATE_AGE_DAYS = 7
+
+# Currency symbols in the amounts of the statement, used if the Currency column is empty
+CURRENCY_SYMBOLS = {"€": "EUR", "£": "GBP", "US$": "USD", "CA$": "CAD", "A$": "AUD", "NZ$": "NZD", "$": "USD",
+                    "¥": "JPY", "CHF": "CHF"}
+
+# An amount with its currency symbol, e.g. "€88.20", "-$5.50" or "CA$1,234.56"
+AMOUNT_PATTERN = re.compile(r"(-?)\s*(" + "|".join(map(re.escape, sorted(CURRENCY_SYMBOLS, key=len, reverse=True)))
+                            + r")\s*(-?)(\d[\d.,]*\d|\d)")
+
+# Statement columns with amounts: Amount, Fees & Taxes, Net. Deposits carry their amount in the Title.
+CURRENCY_COLUMN = 4
+AMOUNT_COLUMNS = (5, 6, 7)
+TITLE_COLUMN = 2
+
+
+class ExchangeRates:
+    """ECB reference rates as one date-sorted series per currency.
+
+    A rate is the amount of the currency per euro. rate() finds the rate of a booking date with a
+    binary search; on weekends and holidays the last published rate applies.
+    """
+
+    def __init__(self, series):
+        self.series = series  # {currency: (date ordinals, rates)}, sorted by date
+
+    def rate(self, currency, day):
+        if currency not in self.series:
+            raise ValueError(f"The exchange rate file has no rates for {currency}")
+        days, rates = self.series[currency]
+        position = bisect_right(days, day.toordinal()) - 1
+        if position < 0:
+            raise ValueError(f"The exchange rate file has no {currency} rate on or before {day:%Y-%m-%d}")
+        if day.toordinal() - days[position] > MAX_RATE_AGE_DAYS:
+            raise ValueError(f"The newest {currency} rate is from {date.fromordinal(days[position]):%Y-%m-%d}, "
+                             f"update the exchange rate file for {day:%Y-%m-%d}")
+        return rates[position]
+
+
+def _parse_rate_date(value):
+    # eurofxref-hist.csv uses 2024-09-13, the daily eurofxref.csv 13 September 2024
+    value = value.strip()
+    for date_format in ("%Y-%m-%d", "%d %B %Y"):
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Unknown date in the exchange rate file: {value}")
+
+
+@functools.lru_cache(maxsize=4)
+def _load_exchange_rates(filepath, _modified):
+    # _modified is only part of the cache key, so a changed file is read again
+    header, rows = read_csv_rows(filepath, backend="csv")
+    currencies = [name.strip() for name in header[1:]]
+    points = {currency: [] for currency in currencies if currency}
+    for row in rows:
+        day = _parse_rate_date(row[0]).toordinal()
+        for currency, value in zip(currencies, row[1:]):
+            value = value.strip()
+            if currency and value and value != "N/A":
+                points[currency].append((day, float(value)))
+    series = {currency: tuple(map(tuple, zip(*sorted(values)))) for currency, values in points.items() if values}
+    logging.info("Loaded exchange rates of %d currencies from %s", len(series), filepath)
+    return ExchangeRates(series)
+
+
+def load_exchange_rates(filepath=EXCHANGE_RATES_PATH):
+    """Loads an ECB reference rate CSV (also zipped) into an ExchangeRates index.
+
+    The file is parsed once per process and again only when it changes.
+    """
+    if not os.path.exists(archive_path(filepath)):
+        raise FileNotFoundError(f"The statement has amounts in other currencies than {BASE_CURRENCY}, but the "
+                                f"exchange rate file {filepath} does not exist")
+    return _load_exchange_rates(filepath, os.stat(archive_path(filepath)).st_mtime_ns)
+
+
+def detect_currency(row):
+    """Returns the currency of a statement row: its Currency column, or the symbol of its amounts."""
+    code = row[CURRENCY_COLUMN].strip().upper() if len(row) > CURRENCY_COLUMN else ""
+    if len(code) == 3 and code.isalpha():
+        return code
+    for column in AMOUNT_COLUMNS + (TITLE_COLUMN,):
+        match = AMOUNT_PATTERN.search(row[column]) if len(row) > column else None
+        if match:
+            return CURRENCY_SYMBOLS[match.group(2)]
+    return BASE_CURRENCY
+
+
+def parse_amount(number):
+    """Parses the digits of an amount. With both separators the last one is the decimal separator."""
+    if "," in number and "." in number:
+        thousands = "," if number.rfind(".") > number.rfind(",") else "."
+        number = number.replace(thousands, "")
+    return Decimal(number.replace(",", "."))
+
+
+class ConvertedRow(list):
+    """A statement row whose amounts were converted to euro, with its original values, currency and rate."""
+
+    def __init__(self, values, currency, exchange_rate, original):
+        super().__init__(values)
+        self.currency = currency
+        self.exchange_rate = exchange_rate
+        self.original = original
+
+
+def original_currency(row):
+    """Returns the original currency of a statement row and the rate it was converted with (None for euro)."""
+    if isinstance(row, ConvertedRow):
+        return row.currency, row.exchange_rate
+    return BASE_CURRENCY, None
+
+
+def original_amount(row, column, exchange_rate=None):
+    """Returns the amount of a column of a converted row in its original currency, None for euro rows.
+
+    An empty amount ("--") is zero. Invoices use it to show the amount of the statement instead
+    of the converted euro amount converted back. With exchange_rate, a euro row (e.g. a tax row
+    next to a converted sale) gives its amount converted with that rate instead of None.
+    """
+    if isinstance(row, ConvertedRow):
+        return _signed_amount(row.original[column])
+    if exchange_rate is None:
+        return None
+    return (_signed_amount(row[column]) * Decimal(str(exchange_rate))).quantize(Decimal("0.01"), ROUND_HALF_UP)
+
+
+def _signed_amount(text):
+    """Parses the amount in a statement column, zero if it is empty ("--")."""
+    match = AMOUNT_PATTERN.search(text)
+    if match is None:
+        return Decimal("0.00")
+    amount = parse_amount(match.group(4))
+    return -amount if match.group(1) or match.group(3) else amount
+
+
+def convert_row(row, currency, exchange_rate):
+    """Returns a row with every amount converted to euro and rounded to cents, in the format of a euro row."""
+    rate = Decimal(str(exchange_rate))
+
+    def to_euro(match):
+        amount = (parse_amount(match.group(4)) / rate).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        sign = "-" if match.group(1) or match.group(3) else ""
+        return f"{sign}€{amount}"
+
+    values = list(row)
+    values[CURRENCY_COLUMN] = BASE_CURRENCY
+    for column in AMOUNT_COLUMNS:
+        values[column] = AMOUNT_PATTERN.sub(to_euro, values[column])
+    if values[1] == "Deposit":
+        values[TITLE_COLUMN] = AMOUNT_PATTERN.sub(to_euro, values[TITLE_COLUMN], count=1)
+    return ConvertedRow(values, currency, exchange_rate, list(row))
+
+
+def convert_rows(rows, rates_file=EXCHANGE_RATES_PATH):
+    """Converts all statement rows that are not in euro, with the ECB rate of their booking date.
+
+    Returns the rows and the number of converted rows per currency. Euro rows are passed on as
+    they are, and the rate file is only read if there are other currencies. Every currency and
+    date is looked up once for all of its rows.
+    """
+    currencies = [detect_currency(row) for row in rows]
+    foreign = Counter(currency for currency in currencies if currency != BASE_CURRENCY)
+    if not foreign:
+        return rows, foreign
+
+    rates = load_exchange_rates(rates_file)
+    lookups = {(currency, parse_statement_date(row[0]).date()) for row, currency in zip(rows, currencies)
+               if currency != BASE_CURRENCY}
+    day_rates = {key: rates.rate(*key) for key in sorted(lookups)}
+    converted = [row if currency == BASE_CURRENCY
+                 else convert_row(row, currency, day_rates[currency, parse_statement_date(row[0]).date()])
+                 for row, currency in zip(rows, currencies)]
+    return converted, foreign
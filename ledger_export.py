@@ -0,0 +1,116 @@
+# ledger_export.py
+import os
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+except ImportError:  # pyarrow is only needed when a ledger file is requested
+    pa = None
+
+# Columns of the normalized ledger, one record per row of the Lexoffice CSV
+LEDGER_COLUMNS = ["date", "type", "order_id", "invoice_number", "buyer", "country",
+                  "gross", "tax", "fee_credit", "description", "currency", "exchange_rate"]
+
+# Record types shown in the monthly totals, in the order of the columns
+TOTAL_TYPES = ["Verkauf", "Rückerstattung", "Gebühr", "Marketing", "Auszahlung"]
+
+LEDGER_FORMATS = {
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".ipc": "arrow",
+    ".feather": "arrow",
+}
+
+
+def ledger_record(date, record_type, gross, order_id=None, invoice_number=None, buyer=None, country=None,
+                  tax=0.0, fee_credit=0.0, description=None, currency="EUR", exchange_rate=None, source=None):
+    """Creates a normalized ledger record with typed values instead of the formatted CSV text.
+
+    The amounts are in euro. currency is the original currency of the statement row and
+    exchange_rate its amount per euro, None for euro rows. source is the fingerprint of the
+    statement row (see statement_dedupe.row_fingerprint), None for the monthly fee sums. It is
+    kept by the ledger store, but not written to the ledger file.
+    """
+    return {
+        "date": date,
+        "type": record_type,
+        "order_id": order_id,
+        "invoice_number": invoice_number,
+        "buyer": buyer,
+        "country": country,
+        "gross": round(float(gross), 2),
+        "tax": round(float(tax), 2),
+        "fee_credit": round(float(fee_credit), 2),
+        "description": description,
+        "currency": currency,
+        "exchange_rate": exchange_rate,
+        "source": source,
+    }
+
+
+def ledger_schema():
+    """Returns the Arrow schema of the normalized ledger."""
+    return pa.schema([
+        ("date", pa.date32()),
+        ("type", pa.string()),
+        ("order_id", pa.string()),
+        ("invoice_number", pa.string()),
+        ("buyer", pa.string()),
+        ("country", pa.string()),
+        ("gross", pa.float64()),
+        ("tax", pa.float64()),
+        ("fee_credit", pa.float64()),
+        ("description", pa.string()),
+        ("currency", pa.string()),
+        ("exchange_rate", pa.float64()),
+    ])
+
+
+def get_ledger_format(filepath):
+    """Determines the output format from the file extension."""
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in LEDGER_FORMATS:
+        raise ValueError(f"Unsupported ledger file extension '{extension}', "
+                         f"use one of {', '.join(sorted(LEDGER_FORMATS))}")
+    return LEDGER_FORMATS[extension]
+
+
+def write_ledger(records, filepath):
+    """Writes the ledger records to a Parquet or Arrow IPC file, depending on the file extension."""
+    if pa is None:
+        raise ImportError("Writing a ledger file requires pyarrow (pip install pyarrow)")
+
+    ledger_format = get_ledger_format(filepath)
+    schema = ledger_schema()
+    columns = {column: [record[column] for record in records] for column in LEDGER_COLUMNS}
+    table = pa.Table.from_pydict(columns, schema=schema)
+
+    if ledger_format == "parquet":
+        pq.write_table(table, filepath)
+    else:
+        with pa.OSFile(filepath, "wb") as sink, ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+
+    logging.info("Wrote %d ledger records to %s", len(records), filepath)
+    return filepath
+
+
+def monthly_totals(records):
+    """Sums the gross amounts of the ledger records per month (YYYY-MM) and record type."""
+    totals = {}
+    for record in records:
+        month_totals = totals.setdefault(record["date"].strftime("%Y-%m"), dict.fromkeys(TOTAL_TYPES, 0.0))
+        month_totals[record["type"]] = round(month_totals.get(record["type"], 0.0) + record["gross"], 2)
+    return dict(sorted(totals.items()))
+
+
+def format_monthly_totals(totals):
+    """Formats the monthly totals as a table with one line per month and a sum line."""
+    lines = ["Monat   " + "".join(f"{record_type:>16}" for record_type in TOTAL_TYPES)]
+    for month, month_totals in totals.items():
+        lines.append(f"{month} " + "".join(f"{month_totals[record_type]:16.2f}" for record_type in TOTAL_TYPES))
+    sums = [sum(month_totals[record_type] for month_totals in totals.values()) for record_type in TOTAL_TYPES]
+    lines.append("Summe   " + "".join(f"{value:16.2f}" for value in sums))
+    return "\n".join(lines)
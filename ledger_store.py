@@ -0,0 +1,153 @@
+# ledger_store.py
+import os
+import sqlite3
+import argparse
+from collections import Counter
+from datetime import datetime
+from ledger_export import LEDGER_COLUMNS
+
+# Default location of the store, next to the converted files
+LEDGER_STORE_PATH = os.getenv("LEDGER_STORE_PATH", "ledger.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    input_files TEXT,
+    records INTEGER
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs (id),
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    order_id TEXT,
+    invoice_number TEXT,
+    buyer TEXT COLLATE NOCASE,
+    country TEXT,
+    gross REAL,
+    tax REAL,
+    fee_credit REAL,
+    description TEXT,
+    occurrence INTEGER NOT NULL DEFAULT 1,
+    currency TEXT,
+    exchange_rate REAL,
+    source BLOB
+);
+CREATE INDEX IF NOT EXISTS records_order_id ON records (order_id);
+CREATE INDEX IF NOT EXISTS records_invoice_number ON records (invoice_number);
+CREATE INDEX IF NOT EXISTS records_date ON records (date);
+CREATE INDEX IF NOT EXISTS records_buyer ON records (buyer);
+-- A record is identified by its statement row, never by the invoice number it was given
+CREATE UNIQUE INDEX IF NOT EXISTS records_identity ON records (
+    date, type, IFNULL(order_id, ''), gross, IFNULL(description, ''), IFNULL(source, X''), occurrence);
+"""
+
+# Columns shown by the query subcommand
+QUERY_COLUMNS = ["date", "type", "gross", "invoice_number", "order_id", "buyer", "country", "description",
+                 "currency", "exchange_rate"]
+
+
+def open_store(path=LEDGER_STORE_PATH):
+    """Opens the ledger store and creates its tables and indexes if needed."""
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def store_records(connection, records, input_files=()):
+    """Adds the ledger records of one conversion to the store and returns the number of new records.
+
+    Converting the same rows again doesn't add them twice, even if they got other invoice numbers
+    (e.g. from two overlapping statements): records are identified by date, type, order, amount,
+    description and the fingerprint of their statement row, and identical records of one conversion
+    (e.g. two equal deposits on one day) by their occurrence.
+    """
+    occurrences = Counter()
+    rows = []
+    for record in records:
+        values = [record[column] for column in LEDGER_COLUMNS]
+        values[0] = values[0].strftime("%Y-%m-%d")
+        key = (values[0], record["type"], record["order_id"], record["gross"], record["description"],
+               record.get("source"))
+        occurrences[key] += 1
+        rows.append(values + [key[-1], occurrences[key]])
+
+    with connection:
+        run_id = connection.execute(
+            "INSERT INTO runs (created, input_files, records) VALUES (?, ?, ?)",
+            (datetime.now().isoformat(timespec="seconds"), ", ".join(map(str, input_files)), len(rows))).lastrowid
+        before = connection.total_changes
+        connection.executemany(
+            f"INSERT OR IGNORE INTO records (run_id, {', '.join(LEDGER_COLUMNS)}, source, occurrence) "
+            f"VALUES ({run_id}, {', '.join('?' * (len(LEDGER_COLUMNS) + 2))})", rows)
+        return connection.total_changes - before
+
+
+def query_records(connection, order_id=None, invoice_number=None, buyer=None, date_from=None, date_to=None,
+                  record_type=None, limit=100):
+    """Finds ledger records by order, invoice number (including its cancellation), buyer and date range.
+
+    Every filter uses an index. buyer matches case-insensitively from the start of the name.
+    """
+    conditions, parameters = [], []
+    if order_id:
+        conditions.append("order_id = ?")
+        parameters.append(order_id.lstrip("#").strip())
+    if invoice_number:
+        conditions.append("invoice_number IN (?, ?)")
+        parameters += [invoice_number, f"{invoice_number}-STORNO"]
+    if buyer:
+        conditions.append("buyer LIKE ? ESCAPE '\\'")
+        parameters.append(buyer.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+    if date_from:
+        conditions.append("date >= ?")
+        parameters.append(date_from)
+    if date_to:
+        conditions.append("date <= ?")
+        parameters.append(date_to)
+    if record_type:
+        conditions.append("type = ?")
+        parameters.append(record_type)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return connection.execute(f"SELECT {', '.join(QUERY_COLUMNS)} FROM records {where} ORDER BY date, id LIMIT ?",
+                              parameters + [limit]).fetchall()
+
+
+def format_records(rows):
+    """Formats query results as one line per record, with the original currency of converted records."""
+    if not rows:
+        return "No records found."
+    return "\n".join(
+        f"{row['date']}  {row['type']:<15}{row['gross']:>10.2f}  {row['invoice_number'] or '-':<22}"
+        f"{row['order_id'] or '-':<12}{row['buyer'] or '-':<25}{row['country'] or '-':<16}{row['description'] or ''}"
+        + (f"  ({row['currency']} at {row['exchange_rate']:g})" if row['exchange_rate'] else "")
+        for row in rows)
+
+
+def main(argv=None):
+    """The query subcommand: python etsy_to_lexoffice.py query --order 1001"""
+    parser = argparse.ArgumentParser(prog='etsy_to_lexoffice.py query',
+                                     description='Look up converted bookings in the ledger store.')
+    parser.add_argument('--store', default=LEDGER_STORE_PATH, help='Ledger store (default: %(default)s)')
+    parser.add_argument('--order', help='Order number, e.g. 1001 or "#1001"')
+    parser.add_argument('--invoice', help='Invoice number, also finds its cancellation')
+    parser.add_argument('--buyer', help='Beginning of the buyer name, case-insensitive')
+    parser.add_argument('--from', dest='date_from', help='First date (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', help='Last date (YYYY-MM-DD)')
+    parser.add_argument('--type', help='Record type, e.g. Verkauf or Rückerstattung')
+    parser.add_argument('--limit', type=int, default=100, help='Maximum number of records (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.store):
+        parser.error(f"ledger store {args.store} does not exist, it is written by every conversion")
+    connection = open_store(args.store)
+    try:
+        rows = query_records(connection, args.order, args.invoice, args.buyer, args.date_from, args.date_to,
+                             args.type, args.limit)
+    finally:
+        connection.close()
+    print(format_records(rows))
+    return 0
@@ -0,0 +1,357 @@
+# lexoffice_upload.py
+import os
+import re
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from lxml import etree
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Lexoffice API configuration from .env file. The URL can point to a local mock server for testing.
+LEXOFFICE_API_URL = os.getenv("LEXOFFICE_API_URL", "https://api.lexoffice.io/v1")
+LEXOFFICE_API_KEY = os.getenv("LEXOFFICE_API_KEY")
+# Default booking category "Einnahmen" of the Lexoffice public API
+LEXOFFICE_CATEGORY_ID = os.getenv("LEXOFFICE_CATEGORY_ID", "8f8664a1-fd86-11e1-a21f-0800200c9a66")
+
+# Ledger of already uploaded invoices, keeps reruns from posting an invoice twice
+UPLOAD_LEDGER_FILE = "lexoffice_upload_ledger.json"
+
+# Lexoffice allows 2 requests per second per API key
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+
+# Booked euro amount in the note of an invoice in another currency (see xrechnung_generator.BOOKED_AMOUNT_NOTE)
+BOOKED_AMOUNT_PATTERN = re.compile(r"Gebuchter Betrag: (-?\d+\.\d{2}) EUR")
+
+NS = {
+    "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
+    "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+}
+
+
+class UploadError(Exception):
+    """Raised when an invoice could not be uploaded to Lexoffice."""
+
+
+class AmbiguousRequestError(UploadError):
+    """Raised when a request that must not be sent twice failed after it may have reached the server."""
+
+
+class RateLimiter:
+    """Spaces out requests across all upload threads to a fixed rate."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def create_session(api_key, pool_size=4):
+    """Creates one HTTP session whose connection pool is shared by all upload threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Authorization": f"Bearer {api_key}",
+        "Accept": "application/json",
+    })
+    return session
+
+
+def get_retry_after(response, attempt, backoff):
+    """Returns the seconds to wait before retrying, honoring a Retry-After header if present."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return backoff * (2 ** attempt)
+
+
+def is_connect_error(error):
+    """Returns True if a request failed before the connection was made, so the server never saw it."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)  # Also NewConnectionError, e.g. connection refused
+
+
+def request_with_retry(session, method, url, rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES,
+                       backoff=DEFAULT_BACKOFF, idempotent=True, **kwargs):
+    """Sends a request, retrying on 429, 5xx and connection errors with exponential backoff.
+
+    A request that is not idempotent, like creating a voucher, is only retried if the server
+    surely didn't process it: on 429 and when the connection could not be made. A 5xx response,
+    a timeout or a dropped connection raise AmbiguousRequestError instead.
+    """
+    for attempt in range(max_retries + 1):
+        if rate_limiter:
+            rate_limiter.wait()
+        response = None
+        try:
+            response = session.request(method, url, timeout=30, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if not idempotent and not is_connect_error(e):
+                raise AmbiguousRequestError(f"{method} {url} failed, it may have been processed: {e}") from e
+            logging.warning("Connection error on %s %s: %s", method, url, e)
+        else:
+            if response.status_code < 400:
+                return response
+            if response.status_code != 429 and response.status_code < 500:
+                raise UploadError(f"{method} {url} failed with {response.status_code}: {response.text}")
+            if response.status_code != 429 and not idempotent:
+                raise AmbiguousRequestError(f"{method} {url} failed with {response.status_code}, "
+                                            f"it may have been processed: {response.text}")
+
+        if attempt == max_retries:
+            break
+        delay = get_retry_after(response, attempt, backoff)
+        logging.info("Retrying %s %s in %.2f s (attempt %d)", method, url, delay, attempt + 1)
+        time.sleep(delay)
+
+    status = response.status_code if response is not None else "connection error"
+    raise UploadError(f"{method} {url} failed after {max_retries} retries ({status})")
+
+
+def load_upload_ledger(ledger_file=UPLOAD_LEDGER_FILE):
+    """Loads the invoice number to voucher ledger, or an empty ledger if none exists yet."""
+    if not os.path.exists(ledger_file):
+        return {}
+    with open(ledger_file, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_upload_ledger(ledger, ledger_file=UPLOAD_LEDGER_FILE):
+    """Writes the ledger atomically so an interrupted run never leaves a broken file behind."""
+    tmp_file = f"{ledger_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as file:
+        json.dump(ledger, file, indent=2, sort_keys=True)
+    os.replace(tmp_file, ledger_file)
+
+
+def voucher_from_xrechnung(xml_bytes, category_id=LEXOFFICE_CATEGORY_ID):
+    """Builds the Lexoffice voucher payload from the figures of a generated XRechnung.
+
+    Vouchers are booked in euro. For an invoice in another currency, the amounts are the booked
+    euro amount of its note and its VAT in euro (tax currency), not the amounts of the document.
+    """
+    root = etree.fromstring(xml_bytes)
+
+    def text(path):
+        return root.findtext(path, namespaces=NS)
+
+    is_cancellation = text("cbc:InvoiceTypeCode") == "381"
+    currency = text("cbc:DocumentCurrencyCode") or "EUR"
+    gross = abs(Decimal(text("cac:LegalMonetaryTotal/cbc:PayableAmount")))
+    tax = abs(Decimal(text("cac:TaxTotal/cbc:TaxAmount")))
+    rate = Decimal(text("cac:TaxTotal/cac:TaxSubtotal/cac:TaxCategory/cbc:Percent"))
+    buyer = text("cac:AccountingCustomerParty/cac:Party/cac:PartyLegalEntity/cbc:RegistrationName")
+    remark = f"{text('cac:InvoiceLine/cac:Item/cbc:Description')} - {buyer}"
+
+    if currency != "EUR":
+        notes = (BOOKED_AMOUNT_PATTERN.search(note.text or "") for note in root.findall("cbc:Note", namespaces=NS))
+        booked = next((match for match in notes if match), None)
+        euro_tax = text("cac:TaxTotal/cbc:TaxAmount[@currencyID='EUR']")
+        if booked is None or euro_tax is None:
+            raise UploadError(f"Invoice {text('cbc:ID')} in {currency} has no booked amount and VAT in EUR")
+        remark += f" ({gross} {currency})"
+        gross = abs(Decimal(booked.group(1)))
+        tax = abs(Decimal(euro_tax))
+
+    return {
+        "type": "salescreditnote" if is_cancellation else "salesinvoice",
+        "voucherNumber": text("cbc:ID"),
+        "voucherDate": text("cbc:IssueDate"),
+        "totalGrossAmount": float(gross),
+        "totalTaxAmount": float(tax),
+        "taxType": "gross",
+        "useCollectiveContact": True,
+        "remark": remark,
+        "voucherItems": [{
+            "amount": float(gross),
+            "taxAmount": float(tax),
+            "taxRatePercent": float(rate),
+            "categoryId": category_id,
+        }],
+    }
+
+
+def find_voucher(session, api_url, voucher_number, rate_limiter=None, **retry_options):
+    """Returns the ID of the voucher with this voucher number, or None if Lexoffice has none."""
+    response = request_with_retry(session, "GET", f"{api_url}/vouchers", rate_limiter,
+                                  params={"voucherNumber": voucher_number}, **retry_options)
+    vouchers = response.json().get("content") or []
+    return vouchers[0]["id"] if vouchers else None
+
+
+def has_files(session, api_url, voucher_id, rate_limiter=None, **retry_options):
+    """Returns True if files are attached to a voucher."""
+    response = request_with_retry(session, "GET", f"{api_url}/vouchers/{voucher_id}", rate_limiter, **retry_options)
+    return bool(response.json().get("files"))
+
+
+def _post_once(entry, step, post, arrived, max_retries, backoff):
+    """Sends a POST that must not arrive twice and returns its result, yielding entry before every attempt.
+
+    entry["pending"] marks the step while the POST is under way. If it is already marked, e.g. by
+    an interrupted run, or the POST fails ambiguously, arrived() asks Lexoffice whether it was
+    processed after all; its truthy result is returned instead of posting again.
+    """
+    for attempt in range(max_retries + 1):
+        if entry.get("pending") == step:
+            result = arrived()
+            if result:
+                return result
+        entry["pending"] = step
+        yield entry
+        try:
+            return post()
+        except AmbiguousRequestError as e:
+            if attempt == max_retries:
+                raise
+            logging.warning("%s, checking whether it arrived", e)
+            time.sleep(backoff * (2 ** attempt))
+
+
+def upload_invoice(session, api_url, xml_path, entry, rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES,
+                   backoff=DEFAULT_BACKOFF):
+    """Creates the voucher for one XRechnung and attaches the XML file to it.
+
+    `entry` is the ledger entry of this invoice from a previous run, so a voucher that was already
+    created only gets its missing file attached. The entry is updated and yielded after each completed
+    step, so the caller can persist the progress. Before each POST the entry is yielded as pending,
+    so a voucher is looked up by its number instead of being created twice (see _post_once).
+    """
+    retry_options = {"max_retries": max_retries, "backoff": backoff}
+    with open(xml_path, "rb") as file:
+        xml_bytes = file.read()
+
+    if not entry.get("voucher_id"):
+        payload = voucher_from_xrechnung(xml_bytes)
+        voucher_id = yield from _post_once(
+            entry, "voucher",
+            lambda: request_with_retry(session, "POST", f"{api_url}/vouchers", rate_limiter, idempotent=False,
+                                       json=payload, **retry_options).json()["id"],
+            lambda: find_voucher(session, api_url, payload["voucherNumber"], rate_limiter, **retry_options),
+            max_retries, backoff)
+        entry.pop("pending", None)
+        entry["voucher_id"] = voucher_id
+        entry["file_uploaded"] = False
+        yield entry
+
+    if not entry.get("file_uploaded"):
+        yield from _post_once(
+            entry, "file",
+            lambda: request_with_retry(session, "POST", f"{api_url}/vouchers/{entry['voucher_id']}/files",
+                                       rate_limiter, idempotent=False, **retry_options,
+                                       files={"file": (os.path.basename(xml_path), xml_bytes, "application/xml")}),
+            lambda: has_files(session, api_url, entry["voucher_id"], rate_limiter, **retry_options),
+            max_retries, backoff)
+        entry.pop("pending", None)
+        entry["file_uploaded"] = True
+        yield entry
+
+
+def upload_invoices(invoice_dir="Rechnungen", api_url=LEXOFFICE_API_URL, api_key=LEXOFFICE_API_KEY,
+                    ledger_file=UPLOAD_LEDGER_FILE, max_workers=4,
+                    requests_per_second=DEFAULT_REQUESTS_PER_SECOND, max_retries=DEFAULT_MAX_RETRIES,
+                    backoff=DEFAULT_BACKOFF):
+    """Uploads all XRechnungen of a directory to Lexoffice over one pooled session.
+
+    Invoices recorded as complete in the ledger are skipped, so a rerun never posts twice.
+    Returns a summary dict with the uploaded, skipped and failed invoice numbers.
+    """
+    if not api_key:
+        raise UploadError("LEXOFFICE_API_KEY is not set")
+
+    ledger = load_upload_ledger(ledger_file)
+    ledger_lock = threading.Lock()
+    summary = {"uploaded": [], "skipped": [], "failed": {}}
+
+    pending = []
+    for xml_path in sorted(glob.glob(os.path.join(invoice_dir, "*.xml"))):
+        invoice_number = os.path.splitext(os.path.basename(xml_path))[0]
+        if ledger.get(invoice_number, {}).get("file_uploaded"):
+            summary["skipped"].append(invoice_number)
+        else:
+            pending.append((invoice_number, xml_path))
+    logging.info("Uploading %d invoices to %s (%d already uploaded)", len(pending), api_url,
+                 len(summary["skipped"]))
+
+    rate_limiter = RateLimiter(requests_per_second)
+    api_url = api_url.rstrip("/")
+
+    def worker(invoice_number, xml_path):
+        entry = dict(ledger.get(invoice_number, {}))
+        for entry in upload_invoice(session, api_url, xml_path, entry, rate_limiter,
+                                    max_retries=max_retries, backoff=backoff):
+            with ledger_lock:
+                ledger[invoice_number] = dict(entry)
+                save_upload_ledger(ledger, ledger_file)
+        return entry
+
+    with create_session(api_key, pool_size=max_workers) as session, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(worker, number, path): number for number, path in pending}
+        for future in as_completed(futures):
+            invoice_number = futures[future]
+            try:
+                entry = future.result()
+                summary["uploaded"].append(invoice_number)
+                logging.info("Uploaded %s as voucher %s", invoice_number, entry["voucher_id"])
+            except Exception as e:  # One failed invoice must not stop the others, we report it.
+                summary["failed"][invoice_number] = str(e)
+                logging.error("Error uploading %s: %s", invoice_number, e)
+
+    summary["uploaded"].sort()
+    summary["skipped"].sort()
+    return summary
+
+
+def print_upload_summary(summary):
+    print(f"Uploaded: {len(summary['uploaded'])}, skipped: {len(summary['skipped'])}, "
+          f"failed: {len(summary['failed'])}")
+    for invoice_number, error in sorted(summary["failed"].items()):
+        print(f"  {invoice_number}: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Upload XRechnungen to Lexoffice.')
+    parser.add_argument('--invoice_dir', default="Rechnungen", help='Directory with the XRechnung XML files')
+    parser.add_argument('--url', default=LEXOFFICE_API_URL, help='Lexoffice API base URL')
+    parser.add_argument('--ledger', default=UPLOAD_LEDGER_FILE, help='Path to the upload ledger')
+    parser.add_argument('--workers', type=int, default=4, help='Number of concurrent uploads')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    upload_result = upload_invoices(args.invoice_dir, args.url, ledger_file=args.ledger, max_workers=args.workers)
+    print_upload_summary(upload_result)
+    sys.exit(1 if upload_result["failed"] else 0)
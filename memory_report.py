@@ -0,0 +1,117 @@
+# memory_report.py
+import sys
+import itertools
+import tracemalloc
+from lxml import etree
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, the report then shows no peak RSS
+    resource = None
+
+# Containers with more items are estimated from an evenly spaced sample of this many items
+SAMPLE_SIZE = 1000
+
+# Approximate libxml2 allocations on 64-bit systems: element or text node, attribute, namespace
+LIBXML_NODE_BYTES = 120
+LIBXML_ATTR_BYTES = 96
+LIBXML_NS_BYTES = 48
+
+
+def _sample(items, count, sample):
+    """Returns an evenly spaced sample of an iterable with count items, and the factor to extrapolate it."""
+    if count <= sample:
+        return items, 1.0
+    step = count // sample
+    return itertools.islice(items, 0, step * sample, step), count / sample
+
+
+def estimate_size(obj, sample=SAMPLE_SIZE):
+    """Estimates the memory of obj and everything it contains, in bytes.
+
+    Lists, tuples, sets and dicts with more than sample items are extrapolated from a sample, so the
+    rows of a large statement are measured in milliseconds. Objects referenced several times are
+    counted every time, so the estimate errs on the high side.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items, factor = _sample(obj.items(), len(obj), sample)
+        size += factor * sum(estimate_size(key, sample) + estimate_size(value, sample) for key, value in items)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items, factor = _sample(obj, len(obj), sample)
+        size += factor * sum(estimate_size(item, sample) for item in items)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += estimate_size(vars(obj), sample)
+    return int(size)
+
+
+def estimate_xml_tree(root):
+    """Estimates the native memory of an lxml tree, which tracemalloc doesn't see."""
+    size = LIBXML_NS_BYTES * len(root.nsmap)
+    for element in root.iter():
+        size += LIBXML_NODE_BYTES
+        if element.text:
+            size += LIBXML_NODE_BYTES + len(element.text.encode("utf-8")) + 1
+        for value in element.attrib.values():
+            size += LIBXML_ATTR_BYTES + LIBXML_NODE_BYTES + len(value.encode("utf-8")) + 1
+    return size
+
+
+def peak_rss():
+    """Returns the peak resident memory of this process in bytes, or None if it isn't known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_bytes(size):
+    return f"{size / 2 ** 20:.1f} MB" if size >= 2 ** 20 else f"{size / 2 ** 10:.1f} KB"
+
+
+class MemoryReport:
+    """Memory use of a conversion: the tracemalloc peak and estimates of its largest structures.
+
+    tracemalloc is started when the report is created and slows down every allocation, building
+    lxml trees many times over, so the report is only made on request. It sees the Python objects
+    of the main process, but neither worker processes, which stop tracing, nor the native memory
+    of lxml and pyarrow, which is part of the peak RSS.
+    """
+
+    def __init__(self):
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        self.structures = []  # (name, estimated bytes, detail)
+        self.peak = None
+
+    def add(self, name, size, detail=""):
+        self.structures.append((name, size, detail))
+
+    def measure(self, name, obj, detail=""):
+        """Adds the estimated size of a structure. Objects with an estimated_size() method report their own."""
+        size = obj.estimated_size() if hasattr(obj, "estimated_size") else estimate_size(obj)
+        self.add(name, size, detail)
+        return size
+
+    def measure_xml(self, name, filepath, detail=""):
+        """Adds the estimated size of the lxml tree of an XML file, as it is built in memory."""
+        root = etree.parse(filepath, etree.XMLParser(remove_blank_text=True)).getroot()
+        self.add(name, estimate_xml_tree(root), detail)
+
+    def stop(self):
+        """Stops tracing and keeps the peak of the traced memory."""
+        self.peak = tracemalloc.get_traced_memory()[1]
+        if self.started:
+            tracemalloc.stop()
+
+    def report(self):
+        if self.peak is None:
+            self.stop()
+        rss = peak_rss()
+        lines = [f"Memory: peak {format_bytes(self.peak)} traced by tracemalloc"
+                 + (f", peak RSS {format_bytes(rss)}" if rss else "")]
+        width = max((len(name) for name, _, _ in self.structures), default=0)
+        for name, size, detail in self.structures:
+            lines.append(f"  {name:<{width}}  ~{format_bytes(size):>10}" + (f"  ({detail})" if detail else ""))
+        return "\n".join(lines)
@@ -0,0 +1,107 @@
+# order_store.py
+import os
+import pickle
+import sqlite3
+import logging
+import weakref
+import tempfile
+from collections import OrderedDict
+from memory_report import estimate_size, format_bytes
+
+# Orders kept in memory in front of a spilled store
+ORDER_CACHE_SIZE = 1024
+
+
+def _remove_store(connection, path):
+    connection.close()
+    os.remove(path)
+
+
+class OrderStore:
+    """The orders of a conversion by order ID, used like the dict it replaces, within a memory budget.
+
+    The orders stay in a dict until their estimated size exceeds budget bytes. Then all of them are
+    moved to a temporary SQLite file, and every lookup goes through an LRU cache of cache_size
+    orders. An order stored after that only replaces its own cache entry. The records are pickled,
+    so a lookup returns a record equal to the one stored.
+    """
+
+    def __init__(self, budget, cache_size=ORDER_CACHE_SIZE):
+        self.budget = budget
+        self.cache_size = cache_size
+        self.orders = {}
+        self.size = 0
+        self.connection = None
+        self.path = None
+        self._finalizer = None
+        self.cache = OrderedDict()  # order ID -> record or None, least recently used first
+
+    @property
+    def spilled(self):
+        return self.connection is not None
+
+    def _spill(self):
+        fd, self.path = tempfile.mkstemp(prefix="orders-", suffix=".sqlite")
+        os.close(fd)
+        self.connection = sqlite3.connect(self.path)
+        self._finalizer = weakref.finalize(self, _remove_store, self.connection, self.path)
+        # A throwaway file: no journal, no syncing
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("CREATE TABLE orders (order_id TEXT PRIMARY KEY, record BLOB NOT NULL)")
+        self.connection.executemany("INSERT INTO orders VALUES (?, ?)",
+                                    ((order_id, pickle.dumps(record)) for order_id, record in self.orders.items()))
+        logging.info(f"Orders index exceeds {format_bytes(self.budget)}, moved {len(self.orders)} orders "
+                     f"({format_bytes(self.size)}) to {self.path}")
+        self.orders = {}
+
+    def _lookup(self, order_id):
+        if order_id in self.cache:
+            self.cache.move_to_end(order_id)
+            return self.cache[order_id]
+        row = self.connection.execute("SELECT record FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        record = self.cache[order_id] = None if row is None else pickle.loads(row[0])
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return record
+
+    def __setitem__(self, order_id, record):
+        # Estimated like the dict entry it is without spilling, a replaced order is counted twice
+        self.size += estimate_size(order_id) + estimate_size(record)
+        if self.spilled:
+            self.connection.execute("INSERT OR REPLACE INTO orders VALUES (?, ?)", (order_id, pickle.dumps(record)))
+            # A cached lookup of this order, e.g. a miss, is outdated now
+            self.cache.pop(order_id, None)
+            return
+        self.orders[order_id] = record
+        if self.size > self.budget:
+            self._spill()
+
+    def get(self, order_id, default=None):
+        record = self._lookup(order_id) if self.spilled else self.orders.get(order_id)
+        return default if record is None else record
+
+    def __getitem__(self, order_id):
+        record = self.get(order_id)
+        if record is None:
+            raise KeyError(order_id)
+        return record
+
+    def __contains__(self, order_id):
+        return self.get(order_id) is not None
+
+    def __len__(self):
+        if self.spilled:
+            return self.connection.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        return len(self.orders)
+
+    def estimated_size(self):
+        """Memory of the orders in the dict, or of the cached orders once they are spilled."""
+        if not self.spilled:
+            return self.size
+        return int(self.size / max(len(self), 1) * len(self.cache))
+
+    def close(self):
+        """Deletes the temporary file of a spilled store."""
+        if self._finalizer is not None:
+            self._finalizer()
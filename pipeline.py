@@ -0,0 +1,274 @@
+# pipeline.py
+import logging
+import queue
+import threading
+from collections import Counter
+from typing import NamedTuple
+from xrechnung_generator import InvoiceSpec, generate_xrechnungen
+
+
+class StatementRecord(NamedTuple):
+    """A statement row on its way through the conversion stages."""
+    index: int  # position of the row in its month
+    row: list  # the raw statement row
+    month: tuple  # (year, month) of the row date
+    kind: str = None  # handler that converts the row, set by the classify stage
+    invoice_number: str = None  # planned numbers, set by the enrich stage
+    original_invoice_number: str = None
+
+
+class Booking(NamedTuple):
+    """One booking of the Lexoffice CSV, with the same booking as normalized ledger record."""
+    row: list
+    record: dict = None
+
+
+class InvoiceRequest(NamedTuple):
+    """An XRechnung to generate, with the arguments of generate_xrechnung_lxml except the country codes."""
+    invoice_number: str
+    order_info: str
+    amount: float
+    date: object
+    buyer: str
+    address_details: dict
+    is_cancellation: bool = False
+    original_invoice_number: str = None
+    currency: str = "EUR"  # original currency of the statement row, amount is in euro
+    exchange_rate: float = None
+    currency_amount: object = None  # amount in the original currency, as on the statement
+    row: list = None  # the statement row the invoice was requested for
+
+
+class EventRecorder:
+    """Stands in for the writer, the ledger and the invoice generator of the row handlers.
+
+    The handlers write their output as before, the recorder turns it into events: every
+    writerow() starts a Booking, the following ledger append() completes it, and every invoice
+    call becomes an InvoiceRequest. drain() returns the events recorded since the last call.
+    row is the statement row being converted, the invoice requests carry it.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.row = None
+
+    def writerow(self, row):
+        self.events.append(Booking(row))
+
+    def append(self, record):
+        self.events[-1] = self.events[-1]._replace(record=record)
+
+    def __call__(self, invoice_number, order_info, amount, date, buyer, address_details, country_codes,
+                 is_cancellation=False, original_invoice_number=None, currency="EUR", exchange_rate=None,
+                 currency_amount=None):
+        self.events.append(InvoiceRequest(invoice_number, order_info, amount, date, buyer, address_details,
+                                          is_cancellation, original_invoice_number, currency, exchange_rate,
+                                          currency_amount, self.row))
+        return f"{invoice_number}.xml"
+
+    def drain(self):
+        events, self.events = self.events, []
+        return events
+
+
+class Sink:
+    """An output of the conversion. Subclasses override the events they are interested in."""
+
+    def booking(self, booking):
+        pass
+
+    def invoice(self, request):
+        pass
+
+    def close(self):
+        pass
+
+
+class CsvSink(Sink):
+    """Writes every booking as a row of the Lexoffice CSV."""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def booking(self, booking):
+        self.writer.writerow(booking.row)
+
+
+class LedgerSink(Sink):
+    """Collects the normalized ledger records of all bookings."""
+
+    def __init__(self, records=None):
+        self.records = [] if records is None else records
+
+    def booking(self, booking):
+        self.records.append(booking.record)
+
+
+class XRechnungSink(Sink):
+    """Generates an XRechnung for every invoice request.
+
+    Without a generator, the requests are collected and written in batches of batch_size with
+    xrechnung_generator.generate_xrechnungen. Otherwise generator has the signature of
+    generate_xrechnung_lxml, e.g. a ValidatingInvoiceWriter, and is called for every request.
+    flush() writes everything buffered so far, close() flushes as well.
+
+    If quarantine is a list, an invoice that can't be generated is appended to it as (row, error)
+    with the statement row it was requested for, and the other invoices are still written. The
+    booking of the row is already in the outputs at that point. Otherwise the error is raised.
+    """
+
+    def __init__(self, country_codes, generator=None, output_dir="Rechnungen", formats=("ubl",), batch_size=500,
+                 quarantine=None):
+        self.country_codes = country_codes
+        self.generator = generator
+        self.output_dir = output_dir
+        self.formats = formats
+        self.batch_size = batch_size
+        self.quarantine = quarantine
+        self.pending = []
+        self.pending_rows = []
+
+    def invoice(self, request):
+        if self.generator is None:
+            self.pending.append(InvoiceSpec(request.invoice_number, request.order_info, request.amount, request.date,
+                                            request.buyer, request.address_details, request.is_cancellation,
+                                            request.original_invoice_number, currency=request.currency,
+                                            exchange_rate=request.exchange_rate,
+                                            currency_amount=request.currency_amount))
+            self.pending_rows.append(request.row)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            return
+        try:
+            invoice_filename = self.generator(request.invoice_number, request.order_info, request.amount,
+                                              request.date, request.buyer, request.address_details,
+                                              self.country_codes, is_cancellation=request.is_cancellation,
+                                              original_invoice_number=request.original_invoice_number,
+                                              currency=request.currency, exchange_rate=request.exchange_rate,
+                                              currency_amount=request.currency_amount)
+        except Exception as e:
+            if self.quarantine is None:
+                raise
+            self._quarantine(request.row, request.invoice_number, f"{type(e).__name__}: {e}")
+            return
+        logging.info("Generated XRechnung: %s", invoice_filename)
+
+    def flush(self):
+        if self.pending:
+            # Failed invoices are reported in their results, once per format
+            rows = {spec.invoice_number: row for spec, row in zip(self.pending, self.pending_rows)}
+            for result in generate_xrechnungen(self.pending, self.country_codes, self.output_dir,
+                                               formats=self.formats, raise_errors=self.quarantine is None):
+                if result.error is None:
+                    logging.info("Generated XRechnung: %s", result.path)
+                elif result.invoice_number in rows:
+                    self._quarantine(rows.pop(result.invoice_number), result.invoice_number, result.error)
+            self.pending, self.pending_rows = [], []
+        if hasattr(self.generator, "flush"):
+            self.generator.flush()
+
+    def _quarantine(self, row, invoice_number, error):
+        self.quarantine.append((row, f"XRechnung {invoice_number}: {error}"))
+        logging.error("Quarantined row %s: XRechnung %s could not be generated", row, invoice_number)
+
+    def close(self):
+        self.flush()
+
+
+class AuditLogSink(Sink):
+    """Counts the bookings per type and the invoices, and logs the totals when closed."""
+
+    def __init__(self):
+        self.bookings = Counter()
+        self.amounts = Counter()
+        self.invoices = 0
+
+    def booking(self, booking):
+        if booking.record is not None:
+            self.bookings[booking.record["type"]] += 1
+            self.amounts[booking.record["type"]] += booking.record["gross"]
+
+    def invoice(self, request):
+        self.invoices += 1
+
+    def close(self):
+        for record_type in sorted(self.bookings):
+            logging.info("Audit: %d bookings of type %s, total %.2f EUR", self.bookings[record_type], record_type,
+                         self.amounts[record_type])
+        logging.info("Audit: %d XRechnungen requested", self.invoices)
+
+
+class ThreadedSink(Sink):
+    """Runs a slow sink in a background thread behind a bounded queue.
+
+    When maxsize events are waiting, booking() and invoice() block until the sink has caught up,
+    so a fast producer never runs further ahead than that. An error in the sink is raised on the
+    next event or on close().
+    """
+
+    _DONE = object()
+
+    def __init__(self, sink, maxsize=1000):
+        self.sink = sink
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is self._DONE:
+                return
+            if self.error is None:
+                try:
+                    dispatch_event(event, [self.sink])
+                except Exception as e:
+                    self.error = e
+
+    def _put(self, event):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(event)
+
+    def booking(self, booking):
+        self._put(booking)
+
+    def invoice(self, request):
+        self._put(request)
+
+    def close(self):
+        self.queue.put(self._DONE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        self.sink.close()
+
+
+def dispatch_event(event, sinks):
+    """Passes one event to every sink."""
+    if isinstance(event, Booking):
+        for sink in sinks:
+            sink.booking(event)
+    else:
+        for sink in sinks:
+            sink.invoice(event)
+
+
+def run_pipeline(events, sinks):
+    """Pulls the events through all sinks in one traversal.
+
+    The stages are generators, so a row is only read and converted when the sinks are ready for
+    its events. Returns the number of events.
+    """
+    count = 0
+    for event in events:
+        dispatch_event(event, sinks)
+        count += 1
+    return count
+
+
+def close_sinks(sinks):
+    """Closes all sinks, e.g. to flush buffered invoices."""
+    for sink in sinks:
+        sink.close()
@@ -0,0 +1,113 @@
+# statement_dedupe.py
+import hashlib
+import os
+import sqlite3
+from collections import Counter
+from typing import NamedTuple
+
+# Date, Type, Title, Info, Currency, Amount, Fees & Taxes, Net
+FINGERPRINT_COLUMNS = (0, 1, 2, 3, 4, 5, 6, 7)
+
+
+class DedupeStats(NamedTuple):
+    """Row counts of a dedupe run."""
+    files: int
+    rows: int  # rows in all input files
+    duplicates: int  # rows repeated by an overlapping file
+    already_booked: int  # rows booked by an earlier run, according to the fingerprint store
+
+    @property
+    def kept(self):
+        return self.rows - self.duplicates - self.already_booked
+
+
+def row_fingerprint(row):
+    """Returns a 16 byte fingerprint of the normalized date, type, texts and amounts of a statement row.
+
+    A row converted to euro (see exchange_rates.ConvertedRow) has the fingerprint of its original values.
+    """
+    row = getattr(row, "original", row)
+    fields = (row[column].strip().strip('"') if column < len(row) else "" for column in FINGERPRINT_COLUMNS)
+    return hashlib.blake2b("\x1f".join(fields).encode("utf-8"), digest_size=16).digest()
+
+
+class SqliteFingerprintStore:
+    """How often every fingerprint was booked by earlier runs, kept in an SQLite file.
+
+    Only the fingerprints of the current files are looked up, so the history never has to fit in
+    memory. With read_only, a missing file counts as empty and nothing is written.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.read_only = read_only
+        self.connection = None
+        if read_only and not os.path.exists(path):
+            return
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints (fingerprint BLOB PRIMARY KEY, count INTEGER NOT NULL)"
+            " WITHOUT ROWID")
+
+    def get_counts(self, fingerprints):
+        if self.connection is None:
+            return {}
+        fingerprints = list(fingerprints)
+        counts = {}
+        # Stay below SQLite's limit of host parameters per statement
+        for start in range(0, len(fingerprints), 500):
+            chunk = fingerprints[start:start + 500]
+            query = f"SELECT fingerprint, count FROM fingerprints WHERE fingerprint IN ({','.join('?' * len(chunk))})"
+            counts.update(self.connection.execute(query, chunk))
+        return counts
+
+    def update(self, counts):
+        if self.connection is None or self.read_only:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO fingerprints (fingerprint, count) VALUES (?, ?) "
+                "ON CONFLICT (fingerprint) DO UPDATE SET count = MAX(count, excluded.count)",
+                counts.items())
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+def dedupe_rows(row_sets, store=None):
+    """Drops the rows that overlapping exports repeat, across all files and against earlier runs.
+
+    Identical rows within one file are real (e.g. the same listing fee twice on one day), so a
+    fingerprint is kept as often as it occurs in the file that has it most often. The store holds
+    how often every fingerprint was booked before; only occurrences beyond that are kept.
+
+    Returns the kept rows in file order, the fingerprint counts to record in the store once the
+    conversion has succeeded, and the DedupeStats.
+    """
+    file_fingerprints = [[row_fingerprint(row) for row in rows] for rows in row_sets]
+    counts = Counter()
+    for fingerprints in file_fingerprints:
+        for fingerprint, count in Counter(fingerprints).items():
+            if count > counts[fingerprint]:
+                counts[fingerprint] = count
+
+    booked = store.get_counts(counts) if store is not None else {}
+    emitted = Counter()
+    kept = []
+    for rows, fingerprints in zip(row_sets, file_fingerprints):
+        for row, fingerprint in zip(rows, fingerprints):
+            if emitted[fingerprint] < counts[fingerprint]:
+                emitted[fingerprint] += 1
+                if emitted[fingerprint] > booked.get(fingerprint, 0):
+                    kept.append(row)
+
+    total = sum(len(rows) for rows in row_sets)
+    already_booked = sum(min(booked.get(fingerprint, 0), count) for fingerprint, count in counts.items())
+    duplicates = total - sum(counts.values())
+    return kept, counts, DedupeStats(len(row_sets), total, duplicates, already_booked)
+
+
+def format_dedupe_stats(stats):
+    """Summary line for the log and the console."""
+    return (f"Deduplicated {stats.rows} rows from {stats.files} file(s): {stats.kept} kept, "
+            f"{stats.duplicates} duplicates of overlapping exports, {stats.already_booked} booked in earlier runs")
@@ -0,0 +1,60 @@
+# statement_shards.py
+from typing import NamedTuple
+from csv_ingest import parse_statement_date
+
+
+class MonthShard(NamedTuple):
+    """The rows of one calendar month of a date-sorted statement."""
+    month: tuple  # (year, month)
+    indexes: list  # statement row indexes of the rows in this month
+
+
+def split_month_shards(rows):
+    """Splits a date-sorted statement into one shard per calendar month, oldest first."""
+    shards = []
+    for index, row in enumerate(rows):
+        date = parse_statement_date(row[0])
+        month = (date.year, date.month)
+        if not shards or shards[-1].month != month:
+            shards.append(MonthShard(month, []))
+        shards[-1].indexes.append(index)
+    return shards
+
+
+def referenced_order(row):
+    """Returns the order number of a row that process_sale or process_refund looks at, otherwise None."""
+    input_type = row[1]
+    try:
+        if (input_type == "Sale" and "for Order" in row[2]) or input_type == "Refund":
+            return row[2].split("#")[1].strip()
+        if input_type == "Tax" and row[3].startswith("Order #"):
+            return row[3].split("#")[1].strip()
+        if input_type == "Fee" and "Credit for" in row[2] and "Order #" in row[3]:
+            return row[3].split("#")[1].strip()
+    except IndexError:
+        pass
+    return None
+
+
+def build_order_index(rows):
+    """Maps every order number to the indexes of its sale, tax and fee credit rows."""
+    order_index = {}
+    for index, row in enumerate(rows):
+        if row[1] in ("Sale", "Tax", "Fee"):
+            order_info = referenced_order(row)
+            if order_info is not None:
+                order_index.setdefault(order_info, []).append(index)
+    return order_index
+
+
+def shard_context(rows, shard, order_index):
+    """Returns the rows a shard needs for its lookups: its own rows plus the related rows of its orders.
+
+    A refund in March still finds the sale, tax and fee credit rows of a January order, so the
+    shard converts exactly like the full statement would. The rows keep their statement order.
+    """
+    indexes = set(shard.indexes)
+    for index in shard.indexes:
+        if rows[index][1] in ("Sale", "Refund"):
+            indexes.update(order_index.get(referenced_order(rows[index]), ()))
+    return [rows[index] for index in sorted(indexes)]
@@ -0,0 +1,58 @@
+# helpers.py
+# Statement and orders fixtures and the temporary work folder shared by the conversion tests
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+STATEMENT_HEADER = 'Date,Type,Title,Info,Currency,Amount,"Fees & Taxes",Net,"Tax Details",Status,"Availability Date"'
+ORDERS_HEADER = "Order ID,Sale Date,Full Name,Street 1,Street 2,Ship City,Ship State,Ship Zipcode,Ship Country"
+
+# Order 1001 of Erika Musterfrau with its sales tax, the statement rows most tests start with
+SALE_1001 = '"September 15, 2024",Sale,"Payment for Order #1001",,EUR,€88.20,--,€88.20,--,--,--'
+TAX_1001 = '"September 15, 2024",Tax,"Sales tax paid by buyer","Order #1001",EUR,--,-€5.50,-€5.50,--,--,--'
+REFUND_1001 = '"October 2, 2024",Refund,"Refund to buyer for Order #1001",,EUR,--,-€88.20,-€88.20,--,--,--'
+
+ORDER_1001 = "1001,09/15/24,Erika Musterfrau,Hauptstr. 1,,Berlin,,10115,Germany"
+ORDER_1002 = "1002,09/20/24,Max Mustermann,Marktplatz 2,,Hamburg,,20095,Germany"
+
+
+def statement(*rows):
+    """Returns a statement export with the given rows."""
+    return "\n".join((STATEMENT_HEADER,) + rows) + "\n"
+
+
+def orders(*rows):
+    """Returns an orders export with the given rows, by default only order 1001."""
+    return "\n".join((ORDERS_HEADER,) + (rows or (ORDER_1001,))) + "\n"
+
+
+class WorkdirTestCase(unittest.TestCase):
+    """Runs every test in a temporary folder, because a conversion writes its outputs to the current folder."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        for handler in logging.getLogger().handlers[:]:
+            handler.close()
+            logging.getLogger().removeHandler(handler)
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def workdir(self, statement_text=None, orders_text=None, name="shop"):
+        """Creates a folder with the country codes, statement.csv and the orders export, and changes into it."""
+        path = os.path.join(self.tmpdir.name, name)
+        os.makedirs(path)
+        shutil.copy(os.path.join(REPO_DIR, "country_codes.csv"), path)
+        if statement_text is not None:
+            with open(os.path.join(path, "statement.csv"), "w", encoding="utf-8") as f:
+                f.write(statement_text)
+        with open(os.path.join(path, "EtsySoldOrders2024.csv"), "w", encoding="utf-8") as f:
+            f.write(orders() if orders_text is None else orders_text)
+        os.chdir(path)
+        return path
@@ -0,0 +1,124 @@
+import unittest
+import csv
+import os
+import sys
+from unittest.mock import patch
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import etsy_to_lexoffice  # Import after modifying sys.path
+from etsy_to_lexoffice import convert_csv
+from conversion_journal import JOURNAL_PATH, ResumeError
+from helpers import WorkdirTestCase, statement, orders, SALE_1001, TAX_1001, REFUND_1001, ORDER_1001, ORDER_1002
+
+STATEMENT = statement(
+    SALE_1001,
+    TAX_1001,
+    '"September 16, 2024",Fee,"Transaction fee: Mug",,EUR,--,-€1.50,-€1.50,--,--,--',
+    '"September 20, 2024",Sale,"Payment for Order #1002",,EUR,€40.00,--,€40.00,--,--,--',
+    REFUND_1001,
+    '"October 5, 2024",Fee,"Listing fee",,EUR,--,-€0.18,-€0.18,--,--,--',
+    '"November 3, 2024",Sale,"Payment for Order #1003",,EUR,€25.00,--,€25.00,--,--,--',
+)
+
+ORDERS = orders(ORDER_1001, ORDER_1002, "1003,11/03/24,Eva Beispiel,Ring 3,,Köln,,50667,Germany")
+
+
+class TestConversionJournal(WorkdirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.start_counter = etsy_to_lexoffice.INVOICE_COUNTER
+
+    def workdir(self, statement_text=STATEMENT, orders_text=ORDERS, name="shop"):
+        return super().workdir(statement_text, orders_text, name)
+
+    def outputs(self):
+        with open("output.csv", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        invoices = {}
+        for filename in sorted(os.listdir("Rechnungen")):
+            with open(os.path.join("Rechnungen", filename), encoding="utf-8") as f:
+                invoices[filename] = f.read()
+        return rows, invoices
+
+    def test_resume_matches_uninterrupted_run(self):
+        self.workdir(name="uninterrupted")
+        convert_csv("statement.csv", "output.csv")
+        expected = self.outputs()
+
+        # The same run again, crashing in October after September was checkpointed
+        etsy_to_lexoffice.INVOICE_COUNTER = self.start_counter
+        self.workdir(name="interrupted")
+        with patch.object(etsy_to_lexoffice, "process_refund", side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                convert_csv("statement.csv", "output.csv")
+        self.assertTrue(os.path.exists(JOURNAL_PATH))
+        self.assertEqual(len(os.listdir("Rechnungen")), 2)
+
+        # The counter of this process has moved on, the journal still knows where the run started
+        convert_csv("statement.csv", "output.csv", resume=True)
+        self.assertEqual(self.outputs(), expected)
+        self.assertFalse(os.path.exists(JOURNAL_PATH))
+
+    def test_resume_refuses_other_input(self):
+        self.workdir(name="changed")
+        with patch.object(etsy_to_lexoffice, "process_refund", side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                convert_csv("statement.csv", "output.csv")
+        with open("statement.csv", "a", encoding="utf-8") as f:
+            f.write('"November 4, 2024",Fee,"Listing fee",,EUR,--,-€0.18,-€0.18,--,--,--\n')
+        with self.assertRaises(ResumeError):
+            convert_csv("statement.csv", "output.csv", resume=True)
+
+    def test_continue_on_error_quarantines_bad_rows(self):
+        bad_sale = '"October 7, 2024",Sale,"Payment for Order 1004",,EUR,€10.00,--,€10.00,--,--,--\n'
+        self.workdir(STATEMENT + bad_sale, name="quarantine")
+        convert_csv("statement.csv", "output.csv", continue_on_error=True)
+        rows, invoices = self.outputs()
+        self.assertEqual(len([row for row in rows if row[1] == "Verkauf"]), 3)
+        self.assertEqual(len(invoices), 4)
+        with open("quarantine.csv", encoding="utf-8") as f:
+            quarantined = list(csv.reader(f))
+        self.assertEqual(quarantined[0][-1], "Error")
+        self.assertEqual(quarantined[1][:3], ["October 7, 2024", "Sale", "Payment for Order 1004"])
+        self.assertTrue(quarantined[1][-1].startswith("IndexError"))
+
+    def test_continue_on_error_quarantines_failed_invoices(self):
+        # The booking is converted, but the control character can't be written to the XRechnung
+        invalid_orders = ORDERS.replace("Max Mustermann", "Max\x01 Mustermann")
+        for workers in (1, 2):
+            self.workdir(orders_text=invalid_orders, name=f"invoice-{workers}")
+            convert_csv("statement.csv", "output.csv", workers=workers, continue_on_error=True)
+            rows, invoices = self.outputs()
+            self.assertEqual(len([row for row in rows if row[1] == "Verkauf"]), 3)
+            self.assertEqual(len(invoices), 3)
+            with open("quarantine.csv", encoding="utf-8") as f:
+                quarantined = list(csv.reader(f))
+            self.assertEqual(len(quarantined), 2)
+            self.assertEqual(quarantined[1][:3], ["September 20, 2024", "Sale", "Payment for Order #1002"])
+            self.assertRegex(quarantined[1][-1], r"^XRechnung ETSY-\S+: ValueError: All strings must be XML")
+
+        self.workdir(orders_text=invalid_orders, name="invoice-error")
+        with self.assertRaises(ValueError):
+            convert_csv("statement.csv", "output.csv")
+
+    def test_resume_keeps_quarantined_invoices(self):
+        # The invoice of September fails, the run is interrupted in October
+        invalid_orders = ORDERS.replace("Max Mustermann", "Max\x01 Mustermann")
+        self.workdir(orders_text=invalid_orders, name="quarantine-resume")
+        with patch.object(etsy_to_lexoffice, "process_refund", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                convert_csv("statement.csv", "output.csv", continue_on_error=True)
+        self.assertFalse(os.path.exists("quarantine.csv"))
+
+        # September is only replayed without its invoices, its quarantined row comes from the journal
+        convert_csv("statement.csv", "output.csv", resume=True, continue_on_error=True)
+        with open("quarantine.csv", encoding="utf-8") as f:
+            quarantined = list(csv.reader(f))
+        self.assertEqual(len(quarantined), 2)
+        self.assertEqual(quarantined[1][:3], ["September 20, 2024", "Sale", "Payment for Order #1002"])
+        self.assertRegex(quarantined[1][-1], r"^XRechnung ETSY-\S+: ValueError: All strings must be XML")
+
+
+if __name__ == '__main__':
+    unittest.main()
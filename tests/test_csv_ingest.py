@@ -0,0 +1,119 @@
+import unittest
+import os
+import sys
+import tempfile
+import gzip
+import bz2
+import lzma
+import zipfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from csv_ingest import (  # Import after modifying sys.path
+    read_csv_rows, read_statement_rows, resolve_backend, find_csv_files
+)
+
+STATEMENT = """﻿Date,Type,Title,Info,Currency,Amount,"Fees & Taxes",Net,"Tax Details",Status,"Availability Date"
+"September 10, 2024",Deposit,"€1,123.45 sent to your bank account",,EUR,--,--,--,--,--
+"September 15, 2024",Sale,"Payment for Order #1001",,EUR,€88.20,--,€88.20,--,--,--
+"September 2, 2024",Fee,"Listing fee",,EUR,--,-€0.18,-€0.18,--,--,--
+
+"September 15, 2024",Tax,"Sales tax paid by buyer","Order #1001",EUR,--,-€5.50,-€5.50,--,--,--
+"""
+
+ORDERS = """Order ID,Sale Date,Full Name,Street 1,Street 2,Ship City,Ship State,Ship Zipcode,Ship Country
+1001,09/15/24,Erika Musterfrau,Hauptstr. 1,,Berlin,,01067,Germany
+1002,09/16/24,"Doe, John",Main St 2,Apt 3,Springfield,IL,62701,United States
+"""
+
+
+class TestCsvIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.statement = os.path.join(self.tmpdir.name, "statement.csv")
+        self.orders = os.path.join(self.tmpdir.name, "orders.csv")
+        with open(self.statement, "w", encoding="utf-8") as f:
+            f.write(STATEMENT)
+        with open(self.orders, "w", encoding="utf-8") as f:
+            f.write(ORDERS)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_backends_return_same_statement_rows(self):
+        expected = read_statement_rows(self.statement, backend="csv")
+        self.assertEqual([row[1] for row in expected], ["Fee", "Deposit", "Sale", "Tax"])
+        self.assertEqual(expected[1], ["September 10, 2024", "Deposit", "€1,123.45 sent to your bank account", "",
+                                       "EUR", "--", "--", "--", "--", "--", ""])
+        for backend in ("pandas", "pyarrow"):
+            self.assertEqual(read_statement_rows(self.statement, backend=backend, memory_map=True), expected, backend)
+
+    def test_pyarrow_sorts_statement_by_date(self):
+        with open(self.statement, "w", encoding="utf-8") as f:
+            f.write(STATEMENT.replace(",--,--,--,--,--\n", ",--,--,--,--,--,\n").replace("\n\n", "\n"))
+        expected = read_statement_rows(self.statement, backend="csv")
+        self.assertEqual(read_statement_rows(self.statement, backend="pyarrow"), expected)
+
+    def test_backends_return_same_selected_columns(self):
+        columns = ("Order ID", "Full Name", "Street 2", "Ship Zipcode")
+        expected = read_csv_rows(self.orders, columns, backend="csv")
+        self.assertEqual(expected, (list(columns), [["1001", "Erika Musterfrau", "", "01067"],
+                                                    ["1002", "Doe, John", "Apt 3", "62701"]]))
+        for backend in ("pandas", "pyarrow"):
+            self.assertEqual(read_csv_rows(self.orders, columns, backend=backend), expected, backend)
+
+    def test_backends_read_ragged_rows(self):
+        # A first row with an extra field, a later one with two, and a short row
+        with open(self.orders, "w", encoding="utf-8") as f:
+            f.write(ORDERS.replace(",Germany\n", ",Germany,gift\n")
+                    + "1003,09/17/24,Eva Beispiel,Ring 3,,Köln,,50667,Germany,,note\n1004,09/18/24,Tom\n")
+        header, rows = read_csv_rows(self.orders, backend="csv")
+        self.assertEqual([len(row) for row in rows], [10, 9, 11, 9])
+        self.assertEqual(rows[0][-2:], ["Germany", "gift"])
+        self.assertEqual(rows[3], ["1004", "09/18/24", "Tom", "", "", "", "", "", ""])
+        columns = ("Order ID", "Full Name", "Ship Country")
+        selected = (list(columns), [[row[0], row[2], row[8]] for row in rows])
+        for backend in ("csv", "pandas", "pyarrow"):
+            self.assertEqual(read_csv_rows(self.orders, backend=backend), (header, rows), backend)
+            self.assertEqual(read_csv_rows(self.orders, columns, backend=backend), selected, backend)
+
+    def test_backends_keep_only_matching_rows(self):
+        columns = ("Order ID", "Full Name")
+        for backend in ("csv", "pandas", "pyarrow"):
+            self.assertEqual(read_csv_rows(self.orders, columns, backend=backend, where=("Order ID", {"1002", "9"})),
+                             (list(columns), [["1002", "Doe, John"]]), backend)
+
+    def test_compressed_and_zipped_files(self):
+        expected = read_statement_rows(self.statement, backend="csv")
+        data = STATEMENT.encode("utf-8")
+        paths = []
+        for suffix, opener in ((".gz", gzip.open), (".bz2", bz2.open), (".xz", lzma.open)):
+            paths.append(self.statement + suffix)
+            with opener(paths[-1], "wb") as f:
+                f.write(data)
+        with zipfile.ZipFile(os.path.join(self.tmpdir.name, "single.zip"), "w") as archive:
+            archive.writestr("statement.csv", data)
+        with zipfile.ZipFile(os.path.join(self.tmpdir.name, "export.zip"), "w") as archive:
+            archive.writestr("statement.csv", data)
+            archive.writestr("orders/EtsySoldOrders2024.csv", ORDERS)
+        paths += [os.path.join(self.tmpdir.name, "single.zip"),
+                  os.path.join(self.tmpdir.name, "export.zip") + "::statement.csv"]
+
+        for path in paths:
+            for backend in ("csv", "pandas", "pyarrow"):
+                self.assertEqual(read_statement_rows(path, backend=backend, memory_map=True), expected,
+                                 (path, backend))
+        with self.assertRaises(ValueError):
+            read_statement_rows(os.path.join(self.tmpdir.name, "export.zip"))
+
+        self.assertEqual(find_csv_files(self.tmpdir.name, "EtsySoldOrders*"),
+                         [os.path.join(self.tmpdir.name, "export.zip") + "::orders/EtsySoldOrders2024.csv"])
+
+    def test_resolve_backend(self):
+        self.assertEqual(resolve_backend("auto"), "pyarrow")
+        with self.assertRaises(ValueError):
+            resolve_backend("polars")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import csv
+import os
+import sys
+from datetime import date
+from decimal import Decimal
+from lxml import etree
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import after modifying sys.path
+from exchange_rates import (load_exchange_rates, convert_rows, convert_row, detect_currency, original_currency,
+                            original_amount)
+from etsy_to_lexoffice import convert_csv, process_sale
+from xrechnung_generator import build_invoice_model, load_country_codes
+from pipeline import EventRecorder, InvoiceRequest, LedgerSink
+from helpers import REPO_DIR, WorkdirTestCase, statement
+
+RATES = """Date,USD,JPY,GBP,
+2024-10-02,1.1074,159.08,0.83450,
+2024-10-01,1.1105,159.09,0.83350,
+2024-09-16,1.1115,156.50,0.84350,
+2024-09-13,1.1075,155.91,0.84310,
+2024-09-12,1.1023,155.70,N/A,
+"""
+
+STATEMENT = statement(
+    '"September 15, 2024",Sale,"Payment for Order #1001",,USD,$110.75,--,$110.75,--,--,--',
+    '"September 15, 2024",Tax,"Sales tax paid by buyer","Order #1001",USD,--,-$5.54,-$5.54,--,--,--',
+    '"September 16, 2024",Fee,"Transaction fee: Mug",,USD,--,-$1.50,-$1.50,--,--,--',
+    '"September 20, 2024",Deposit,"$1,111.50 sent to your bank account",,USD,--,--,--,--,--,--',
+)
+
+UBL = {"cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+       "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"}
+
+
+class TestExchangeRates(WorkdirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rates_file = os.path.join(self.tmpdir.name, "eurofxref-hist.csv")
+        with open(self.rates_file, "w", encoding="utf-8") as f:
+            f.write(RATES)
+
+    def test_rate_lookup(self):
+        rates = load_exchange_rates(self.rates_file)
+        self.assertEqual(rates.rate("USD", date(2024, 9, 13)), 1.1075)
+        # Weekends use the last published rate, a missing rate (N/A) is skipped
+        self.assertEqual(rates.rate("USD", date(2024, 9, 15)), 1.1075)
+        self.assertEqual(rates.rate("GBP", date(2024, 9, 13)), 0.8431)
+        for currency, day in [("GBP", date(2024, 9, 12)), ("USD", date(2024, 9, 1)), ("USD", date(2024, 10, 20)),
+                              ("CHF", date(2024, 9, 13))]:
+            with self.assertRaises(ValueError):
+                rates.rate(currency, day)
+
+    def test_daily_rate_file(self):
+        daily_file = os.path.join(self.tmpdir.name, "eurofxref.csv")
+        with open(daily_file, "w", encoding="utf-8") as f:
+            f.write("Date, USD, JPY, \n13 September 2024, 1.1075, 155.91, \n")
+        self.assertEqual(load_exchange_rates(daily_file).rate("JPY", date(2024, 9, 16)), 155.91)
+
+    def test_convert_rows(self):
+        rows = list(csv.reader(STATEMENT.splitlines()[1:]))
+        self.assertEqual([detect_currency(row) for row in rows], ["USD"] * 4)
+        self.assertEqual(detect_currency(['"September 10, 2024"', 'Deposit', '£12.00 sent to your bank account']), "GBP")
+
+        converted, currencies = convert_rows(rows, self.rates_file)
+        self.assertEqual(currencies, {"USD": 4})
+        self.assertEqual(converted[0][4:8], ["EUR", "€100.00", "--", "€100.00"])
+        self.assertEqual(converted[1][6], "-€5.00")
+        self.assertEqual(converted[2][6], "-€1.35")  # Rate of Monday
+        self.assertEqual(converted[3][2], "€1000.00 sent to your bank account")
+        self.assertEqual(original_currency(converted[0]), ("USD", 1.1075))
+        self.assertEqual(original_currency(rows[0]), ("EUR", None))
+
+        # Euro statements don't need a rate file
+        euro_rows = [["September 15, 2024", "Sale", "Payment for Order #1001", "", "EUR", "€88.20", "--", "€88.20"]]
+        self.assertIs(convert_rows(euro_rows, "missing.csv")[0], euro_rows)
+
+    def test_invoice_keeps_original_amount(self):
+        row = convert_row(["September 13, 2024", "Sale", "Payment for Order #1001", "", "JPY", "¥1000", "--",
+                           "¥1000"], "JPY", 159.08)
+        self.assertEqual(row[7], "€6.29")
+        self.assertEqual(original_amount(row, 7), 1000)
+        self.assertEqual(original_amount(row, 6), 0)
+        self.assertIsNone(original_amount(["September 13, 2024", "Sale", "", "", "EUR", "€6.29", "--", "€6.29"], 7))
+
+        # €6.29 converted back would be ¥1,000.61
+        country_codes = load_country_codes(os.path.join(REPO_DIR, 'country_codes.csv'))
+        model = build_invoice_model("ETSY-2409-0001", "Etsy Bestellung #1001", 6.29, date(2024, 9, 13),
+                                    "Erika Musterfrau", {"Ship Country": "Germany"}, country_codes, currency="JPY",
+                                    exchange_rate=159.08, currency_amount=original_amount(row, 7))
+        self.assertEqual(f"{model.gross_amount:.2f}", "1000.00")
+        self.assertEqual(model.tax_currency_amount, Decimal("1.00"))
+
+    def test_euro_tax_row_of_converted_sale(self):
+        sale = convert_row(["September 13, 2024", "Sale", "Payment for Order #1001", "", "USD", "$110.75", "--",
+                            "$110.75"], "USD", 1.1075)
+        tax = ["September 13, 2024", "Tax", "Sales tax paid by buyer", "Order #1001", "EUR", "--", "-€5.00", "-€5.00"]
+        self.assertIsNone(original_amount(tax, 6))
+        self.assertEqual(original_amount(tax, 6, 1.1075), Decimal("-5.54"))
+
+        recorder = EventRecorder()
+        country_codes = load_country_codes(os.path.join(REPO_DIR, 'country_codes.csv'))
+        process_sale(sale, [sale, tax], recorder, {"1001": {"Full Name": "Erika Musterfrau", "Ship Country": "Germany"}},
+                     country_codes, recorder, recorder, "ETSY-2409-0001")
+        invoices = [event for event in recorder.drain() if isinstance(event, InvoiceRequest)]
+        self.assertEqual([invoice.currency_amount for invoice in invoices], [Decimal("105.21")])
+
+    def test_convert_usd_statement(self):
+        self.workdir(STATEMENT)
+        ledger = []
+        convert_csv("statement.csv", "output.csv", numbering="monthly", sinks=[LedgerSink(ledger)],
+                    exchange_rates=self.rates_file)
+
+        with open("output.csv", encoding="utf-8") as f:
+            sale = [row for row in csv.reader(f) if row[1] == "Verkauf"][0]
+        self.assertEqual(sale[4], "95,00")
+        self.assertEqual([(record["type"], record["gross"], record["currency"], record["exchange_rate"])
+                          for record in ledger if record["type"] == "Verkauf"], [("Verkauf", 95.0, "USD", 1.1075)])
+
+        # The invoice is in dollars, with the VAT of the booked euro amount
+        invoice = etree.parse(os.path.join("Rechnungen", "ETSY-2409-0001.xml"))
+        self.assertEqual(invoice.findtext("cbc:DocumentCurrencyCode", namespaces=UBL), "USD")
+        self.assertEqual(invoice.findtext("cbc:TaxCurrencyCode", namespaces=UBL), "EUR")
+        self.assertEqual(invoice.findtext("cac:LegalMonetaryTotal/cbc:PayableAmount", namespaces=UBL), "105.21")
+        self.assertEqual([(amount.get("currencyID"), amount.text)
+                          for amount in invoice.findall("cac:TaxTotal/cbc:TaxAmount", namespaces=UBL)],
+                         [("USD", "16.80"), ("EUR", "15.17")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import date
+from decimal import InvalidOperation
+from lxml import etree
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import after modifying sys.path
+from xrechnung_generator import InvoiceSpec, generate_xrechnungen, generate_xrechnung_lxml, load_country_codes
+
+ADDRESS = {"Street 1": "Hauptstr. 1", "Ship City": "Berlin", "Ship Zipcode": "10115", "Ship Country": "Germany"}
+
+
+def specs(count):
+    return [InvoiceSpec(f"ETSY-2409-{n:04d}", f"Bestellung #{1000 + n}", 10.0 + n, date(2024, 9, 15),
+                        "Erika Musterfrau", ADDRESS) for n in range(1, count + 1)]
+
+
+class TestInvoiceBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.country_codes = load_country_codes(os.path.join(os.path.dirname(__file__), '..', 'country_codes.csv'))
+
+    def test_batch_matches_single_invoices(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            single_dir, batch_dir = os.path.join(tmpdir, "single"), os.path.join(tmpdir, "batch")
+            for spec in specs(3):
+                generate_xrechnung_lxml(*spec[:6], self.country_codes, output_dir=single_dir)
+            results = list(generate_xrechnungen(specs(3), self.country_codes, batch_dir))
+            self.assertEqual([os.path.basename(result.path) for result in results], sorted(os.listdir(single_dir)))
+            for filename in os.listdir(single_dir):
+                with open(os.path.join(single_dir, filename), "rb") as single, \
+                        open(os.path.join(batch_dir, filename), "rb") as batch:
+                    self.assertEqual(single.read(), batch.read())
+
+    def test_in_memory_and_compact(self):
+        pretty, compact = (next(generate_xrechnungen(specs(1), self.country_codes, None, pretty=flag))
+                           for flag in (True, False))
+        self.assertIsNone(pretty.path)
+        self.assertLess(len(compact.xml), len(pretty.xml))
+        self.assertNotIn(b"\n  <", compact.xml)
+        self.assertEqual(etree.tostring(etree.fromstring(compact.xml)),
+                         etree.tostring(etree.fromstring(pretty.xml, etree.XMLParser(remove_blank_text=True))))
+
+    def test_single_invoice_in_memory(self):
+        spec = specs(1)[0]
+        xml = generate_xrechnung_lxml(*spec[:6], self.country_codes, output_dir=None)
+        self.assertEqual(xml, next(generate_xrechnungen([spec], self.country_codes, None)).xml)
+        with self.assertRaises(InvalidOperation):
+            generate_xrechnung_lxml(*spec._replace(amount="abc")[:6], self.country_codes, output_dir=None)
+
+    def test_failing_invoice_doesnt_stop_batch(self):
+        batch = specs(3)
+        batch[1] = batch[1]._replace(amount="abc")
+        results = list(generate_xrechnungen(batch, self.country_codes, None))
+        self.assertEqual([result.invoice_number for result in results], [spec.invoice_number for spec in batch])
+        self.assertEqual([result.error is None for result in results], [True, False, True])
+        self.assertIsNone(results[1].format)
+
+    def test_workers_keep_order(self):
+        serial = list(generate_xrechnungen(specs(7), self.country_codes, None))
+        parallel = list(generate_xrechnungen(iter(specs(7)), self.country_codes, None, workers=2, chunk_size=2))
+        self.assertEqual(parallel, serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+from lxml import etree
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import xrechnung_generator  # Import after modifying sys.path
+from xrechnung_generator import build_invoice_model, render_cii, generate_xrechnung_lxml, load_country_codes
+
+RAM = "{urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100}"
+
+
+class TestInvoiceModel(unittest.TestCase):
+
+    def setUp(self):
+        self.country_codes = load_country_codes(os.path.join(os.path.dirname(__file__), '..', 'country_codes.csv'))
+        self.address = {"Street 1": "Hauptstr. 1", "Ship City": "Berlin", "Ship Zipcode": "10115",
+                        "Ship Country": "Germany"}
+
+    def test_cancellation_totals(self):
+        model = build_invoice_model("ETSY-2409-0001-STORNO", "Bestellung #1001", 119.0, date(2024, 9, 15),
+                                    "Erika Musterfrau", self.address, self.country_codes, is_cancellation=True,
+                                    original_invoice_number="ETSY-2409-0001")
+        self.assertEqual(model.type_code, "381")
+        self.assertEqual((model.net_amount, model.tax_amount), (Decimal("-100.00"), Decimal("-19.00")))
+        self.assertEqual(model.quantity, "-1")
+        self.assertEqual(model.buyer.country_code, "DE")
+
+        cii = etree.fromstring(render_cii(model))
+        summation = cii.find(f".//{RAM}SpecifiedTradeSettlementHeaderMonetarySummation")
+        self.assertEqual(summation.findtext(f"{RAM}TaxBasisTotalAmount"), "-100.00")
+        self.assertEqual(summation.findtext(f"{RAM}GrandTotalAmount"), "-119.00")
+        self.assertEqual(cii.findtext(f".//{RAM}TypeCode"), "381")
+        self.assertEqual(cii.findtext(f".//{RAM}InvoiceReferencedDocument/{RAM}IssuerAssignedID"), "ETSY-2409-0001")
+
+    def test_both_formats_share_one_calculation(self):
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                patch.object(xrechnung_generator, "lookup_vat_decision",
+                             wraps=xrechnung_generator.lookup_vat_decision) as lookup:
+            filename = generate_xrechnung_lxml("ETSY-2409-0001", "Bestellung #1001", 119.0, date(2024, 9, 15),
+                                               "Erika Musterfrau", self.address, self.country_codes,
+                                               output_dir=tmpdir, formats=("ubl", "cii"))
+            self.assertEqual(lookup.call_count, 1)
+            self.assertEqual(filename, "ETSY-2409-0001.xml")
+            ubl = etree.parse(os.path.join(tmpdir, filename)).getroot()
+            cii = etree.parse(os.path.join(tmpdir, "CII", filename)).getroot()
+            self.assertEqual(etree.QName(ubl).localname, "Invoice")
+            self.assertEqual(etree.QName(cii).localname, "CrossIndustryInvoice")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from invoice_numbering import plan_invoice_numbers  # Import after modifying sys.path
+
+ORDERS = {
+    "1001": {"Full Name": "Erika Musterfrau"},
+    "1002": {"Full Name": "John Doe"},
+    "1003": {"Full Name": "Etsy Refund"},
+    "1004": {"Full Name": "Max Mustermann"},
+}
+
+
+def row(date, input_type, title):
+    return [date, input_type, title, "", "EUR", "--", "--", "--", "--", "--", "--"]
+
+
+ROWS = [
+    row("September 15, 2024", "Sale", "Payment for Order #1001"),
+    row("September 16, 2024", "Fee", "Listing fee"),
+    row("September 20, 2024", "Sale", "Payment for Order #1002"),
+    row("September 21, 2024", "Sale", "Payment for Order #1003"),
+    row("October 2, 2024", "Refund", "Refund to buyer for Order #1001"),
+    row("October 3, 2024", "Refund", "Refund to buyer for Order #1004"),
+    row("October 5, 2024", "Sale", "Payment for Order #1004"),
+]
+
+
+class TestInvoiceNumbering(unittest.TestCase):
+
+    def test_global_numbering(self):
+        plan = plan_invoice_numbers(ROWS, ORDERS)
+        self.assertEqual(plan.numbers, {
+            0: ("ETSY-2409-0001", None),
+            2: ("ETSY-2409-0002", None),
+            4: ("ETSY-2409-0001-STORNO", "ETSY-2409-0001"),
+            5: ("ETSY-2410-0003-STORNO", None),  # Refund of a sale that is not known yet
+            6: ("ETSY-2410-0004", None),
+        })
+        self.assertEqual(plan.last_counter, 4)
+        self.assertEqual(plan.by_order["1004"], "ETSY-2410-0004")
+
+    def test_monthly_numbering_restarts_every_month(self):
+        plan = plan_invoice_numbers(ROWS, ORDERS, scheme="monthly")
+        self.assertEqual(plan.numbers[2], ("ETSY-2409-0002", None))
+        self.assertEqual(plan.numbers[5], ("ETSY-2410-0001-STORNO", None))
+        self.assertEqual(plan.numbers[6], ("ETSY-2410-0002", None))
+
+    def test_continues_from_earlier_runs(self):
+        plan = plan_invoice_numbers(ROWS[4:], ORDERS, start=7, known_invoices={"1001": "ETSY-2409-0005"})
+        self.assertEqual(plan.numbers[0], ("ETSY-2409-0005-STORNO", "ETSY-2409-0005"))
+        self.assertEqual(plan.numbers[2], ("ETSY-2410-0009", None))
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            plan_invoice_numbers(ROWS, ORDERS, scheme="yearly")
+
+
+if __name__ == '__main__':
+    unittest.main()
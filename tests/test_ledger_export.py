@@ -0,0 +1,95 @@
+import unittest
+import os
+import sys
+from datetime import date
+from unittest.mock import patch
+import pyarrow.parquet as pq
+import pyarrow.ipc as ipc
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from etsy_to_lexoffice import convert_csv  # Import after modifying sys.path
+from ledger_export import LEDGER_COLUMNS
+from helpers import WorkdirTestCase, statement, orders, SALE_1001, TAX_1001, ORDER_1001
+
+STATEMENT = statement(
+    '"September 10, 2024",Deposit,"€123.45 sent to your bank account",,EUR,--,--,--,--,--',
+    SALE_1001,
+    TAX_1001,
+    '"September 15, 2024",Fee,"Transaction fee: Mug","Order #1001",EUR,--,-€2.20,-€2.20,--,--',
+    '"September 16, 2024",Sale,"Payment for Order #1002",,EUR,€20.00,--,€20.00,--,--,--',
+    '"September 20, 2024",Refund,"Refund to buyer for Order #1002",,EUR,--,--,-€20.00,--,--,--',
+    '"September 20, 2024",Fee,"Credit for transaction fee","Order #1002",EUR,--,€0.50,€0.50,--,--',
+    '"September 30, 2024",Marketing,"Etsy Ads","Bill for something",EUR,--,-€5.00,-€5.00,--,--',
+)
+
+ORDERS = orders(ORDER_1001, "1002,09/16/24,John Doe,Main St 2,,Springfield,IL,62701,United States")
+
+
+class TestLedgerExport(WorkdirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.workdir(STATEMENT, ORDERS)
+
+    @patch('etsy_to_lexoffice.get_datetime_filename', return_value='20240930_120000')
+    def test_parquet_ledger(self, _):
+        convert_csv("statement.csv", "output.csv", ledger_file="ledger.parquet")
+        table = pq.read_table("ledger.parquet")
+        self.assertEqual(table.column_names, LEDGER_COLUMNS)
+        self.assertEqual(str(table.schema.field("date").type), "date32[day]")
+        rows = table.to_pylist()
+
+        sale = next(r for r in rows if r["type"] == "Verkauf" and r["order_id"] == "1001")
+        self.assertEqual(sale["date"], date(2024, 9, 15))
+        self.assertEqual(sale["buyer"], "Erika Musterfrau")
+        self.assertEqual(sale["country"], "Germany")
+        self.assertEqual(sale["gross"], 82.70)
+        self.assertEqual(sale["tax"], 5.50)
+
+        refunded_sale = next(r for r in rows if r["type"] == "Verkauf" and r["order_id"] == "1002")
+        refund = next(r for r in rows if r["type"] == "Rückerstattung")
+        self.assertEqual(refund["invoice_number"], refunded_sale["invoice_number"] + "-STORNO")
+        self.assertEqual(refund["gross"], -19.50)
+        self.assertEqual(refund["fee_credit"], 0.50)
+
+        deposit = next(r for r in rows if r["type"] == "Auszahlung")
+        self.assertEqual(deposit["gross"], -123.45)
+        self.assertEqual(sorted(r["description"] for r in rows if r["type"] in ("Gebühr", "Marketing")),
+                         ["Etsy Ads Fees", "Transaction Fees"])
+
+        with open("output.csv", encoding="utf-8") as f:
+            self.assertEqual(len(rows), len(f.readlines()) - 1)
+
+    @patch('etsy_to_lexoffice.get_datetime_filename', return_value='20240930_120000')
+    def test_arrow_ledger(self, _):
+        convert_csv("statement.csv", "output.csv", ledger_file="ledger.arrow")
+        with open("ledger.arrow", "rb") as f:
+            table = ipc.open_file(f).read_all()
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(str(table.schema.field("gross").type), "double")
+
+
+    def test_dry_run_prints_totals_without_writing_files(self):
+        before = sorted(os.listdir("."))
+        with patch('builtins.print') as mock_print:
+            totals = convert_csv("statement.csv", dry_run=True)
+        self.assertEqual(sorted(os.listdir(".")), before)
+        self.assertEqual(totals, {"2024-09": {"Verkauf": 102.70, "Rückerstattung": -19.50, "Gebühr": -1.70,
+                                              "Marketing": -5.00, "Auszahlung": -123.45}})
+        self.assertIn("2024-09", mock_print.call_args.args[0])
+
+    @patch('etsy_to_lexoffice.get_datetime_filename', return_value='20240930_120000')
+    def test_stage_selection(self, _):
+        convert_csv("statement.csv", "output.csv", write_invoices=False)
+        self.assertTrue(os.path.exists("output.csv"))
+        self.assertFalse(os.path.exists("Rechnungen"))
+
+        os.remove("output.csv")
+        os.remove("output-unsorted.csv")
+        convert_csv("statement.csv", write_lexoffice_csv=False)
+        self.assertFalse(os.path.exists("output.csv"))
+        self.assertFalse(os.path.exists("output-unsorted.csv"))
+        self.assertEqual(len(os.listdir("Rechnungen")), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from datetime import date
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ledger_store  # Import after modifying sys.path
+from ledger_store import open_store, store_records, query_records
+from ledger_export import ledger_record
+from statement_dedupe import row_fingerprint
+
+RECORDS = [
+    ledger_record(date(2024, 9, 15), "Verkauf", 88.20, "1001", "ETSY-2409-0001", "Erika Musterfrau", "Germany"),
+    ledger_record(date(2024, 9, 20), "Verkauf", 40.00, "1002", "ETSY-2409-0002", "Max Mustermann", "Germany"),
+    ledger_record(date(2024, 9, 30), "Auszahlung", -100.0, buyer="Etsy Ireland UC"),
+    ledger_record(date(2024, 9, 30), "Auszahlung", -100.0, buyer="Etsy Ireland UC"),
+    ledger_record(date(2024, 10, 2), "Rückerstattung", -88.20, "1001", "ETSY-2409-0001-STORNO",
+                  "Erika Musterfrau", "Germany", description="Full Refund"),
+]
+
+
+class TestLedgerStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "ledger.sqlite")
+        self.connection = open_store(self.path)
+
+    def tearDown(self):
+        self.connection.close()
+        self.tmpdir.cleanup()
+
+    def test_records_are_stored_once(self):
+        self.assertEqual(store_records(self.connection, RECORDS, ["statement.csv"]), 5)
+        # Converting an overlapping statement again only adds the new refund
+        self.assertEqual(store_records(self.connection, RECORDS[:4], ["statement.csv"]), 0)
+        self.assertEqual(len(query_records(self.connection, record_type="Auszahlung")), 2)
+
+    def test_lookups(self):
+        store_records(self.connection, RECORDS)
+        self.assertEqual([row["type"] for row in query_records(self.connection, order_id="#1001")],
+                         ["Verkauf", "Rückerstattung"])
+        self.assertEqual([row["invoice_number"] for row in query_records(self.connection,
+                                                                          invoice_number="ETSY-2409-0001")],
+                         ["ETSY-2409-0001", "ETSY-2409-0001-STORNO"])
+        self.assertEqual(len(query_records(self.connection, buyer="erika")), 2)
+        self.assertEqual(query_records(self.connection, buyer="erika_"), [])
+        rows = query_records(self.connection, date_from="2024-09-16", date_to="2024-09-30")
+        self.assertEqual([row["type"] for row in rows], ["Verkauf", "Auszahlung", "Auszahlung"])
+
+    def test_query_subcommand(self):
+        store_records(self.connection, RECORDS)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            ledger_store.main(["--store", self.path, "--order", "1002"])
+        self.assertIn("ETSY-2409-0002", output.getvalue())
+        self.assertNotIn("ETSY-2409-0001", output.getvalue())
+
+    def test_overlapping_statements(self):
+        sale = ["September 15, 2024", "Sale", "Payment for Order #1001", "", "EUR", "€88.20", "--", "€88.20"]
+        refund = ["October 2, 2024", "Refund", "Refund to buyer for Order #1001", "", "EUR", "-€88.20", "--",
+                  "-€88.20"]
+
+        def statement(sale_number, refund_number=None):
+            # The invoice numbers depend on the statement the rows were converted from
+            records = [ledger_record(date(2024, 9, 15), "Verkauf", 88.20, "1001", sale_number,
+                                     "Erika Musterfrau", "Germany", source=row_fingerprint(sale))]
+            if refund_number:
+                records.append(ledger_record(date(2024, 10, 2), "Rückerstattung", -88.20, "1001", refund_number,
+                                             "Erika Musterfrau", "Germany", description="Full Refund",
+                                             source=row_fingerprint(refund)))
+            return records
+
+        self.assertEqual(store_records(self.connection, statement("ETSY-2409-0001"), ["september.csv"]), 1)
+        self.assertEqual(store_records(self.connection, statement("ETSY-2409-0007", "ETSY-2409-0007-STORNO"),
+                                       ["september.csv", "october.csv"]), 1)
+        self.assertEqual([(row["type"], row["invoice_number"]) for row in query_records(self.connection)],
+                         [("Verkauf", "ETSY-2409-0001"), ("Rückerstattung", "ETSY-2409-0007-STORNO")])
+
+
+if __name__ == '__main__':
+    unittest.main()
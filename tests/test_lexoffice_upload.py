@@ -0,0 +1,172 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import date
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from xrechnung_generator import generate_xrechnung_lxml, load_country_codes  # Import after modifying sys.path
+from lexoffice_upload import upload_invoices, voucher_from_xrechnung
+
+
+class MockLexofficeHandler(BaseHTTPRequestHandler):
+    """Answers like the Lexoffice voucher API, rate limiting the first request.
+
+    With server.drop_responses set, that many created vouchers get no response, as if the
+    connection broke after Lexoffice stored them.
+    """
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.requests.append((self.path, body))
+            if not server.rate_limited:
+                server.rate_limited = True
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            if self.path == "/v1/vouchers":
+                server.voucher_count += 1
+                voucher_id = f"voucher-{server.voucher_count}"
+                server.vouchers[json.loads(body)["voucherNumber"]] = voucher_id
+                if server.drop_responses:
+                    server.drop_responses -= 1
+                    self.close_connection = True
+                    return
+            else:
+                voucher_id = self.path.split("/")[3]
+                server.files.append(voucher_id)
+        self.send_json({"id": voucher_id})
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        with server.lock:
+            server.requests.append((self.path, b""))
+            if url.path == "/v1/vouchers":
+                number = parse_qs(url.query)["voucherNumber"][0]
+                found = [{"id": server.vouchers[number]}] if number in server.vouchers else []
+                self.send_json({"content": found})
+            else:
+                voucher_id = url.path.split("/")[3]
+                self.send_json({"id": voucher_id, "files": [f"file-{voucher_id}"] * server.files.count(voucher_id)})
+
+    def send_json(self, data):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLexofficeUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.invoice_dir = os.path.join(self.tmpdir.name, "Rechnungen")
+        self.country_codes = country_codes = load_country_codes(
+            os.path.join(os.path.dirname(__file__), '..', 'country_codes.csv'))
+        self.address = address = {"Street 1": "Hauptstr. 1", "Ship City": "Berlin", "Ship Zipcode": "10115",
+                                  "Ship Country": "Germany"}
+        generate_xrechnung_lxml("ETSY-2409-0001", "Etsy Bestellung #1", 119.0, date(2024, 9, 15), "Max Mustermann",
+                                address, country_codes, output_dir=self.invoice_dir)
+        generate_xrechnung_lxml("ETSY-2409-0001-STORNO", "Etsy Bestellung #1", 119.0, date(2024, 9, 20),
+                                "Max Mustermann", address, country_codes, is_cancellation=True,
+                                original_invoice_number="ETSY-2409-0001", output_dir=self.invoice_dir)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockLexofficeHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.rate_limited = False
+        self.server.voucher_count = 0
+        self.server.vouchers = {}
+        self.server.files = []
+        self.server.drop_responses = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_voucher_from_xrechnung(self):
+        with open(os.path.join(self.invoice_dir, "ETSY-2409-0001-STORNO.xml"), "rb") as file:
+            voucher = voucher_from_xrechnung(file.read())
+        self.assertEqual(voucher["type"], "salescreditnote")
+        self.assertEqual(voucher["voucherNumber"], "ETSY-2409-0001-STORNO")
+        self.assertEqual(voucher["totalGrossAmount"], 119.0)
+        self.assertEqual(voucher["totalTaxAmount"], 19.0)
+        self.assertEqual(voucher["voucherItems"][0]["taxRatePercent"], 19.0)
+
+    def test_upload_usd_invoice(self):
+        usd_dir = os.path.join(self.tmpdir.name, "USD")
+        generate_xrechnung_lxml("ETSY-2409-0002", "Etsy Bestellung #2", 100.0, date(2024, 9, 15), "Max Mustermann",
+                                self.address, self.country_codes, output_dir=usd_dir, currency="USD",
+                                exchange_rate=1.0837, currency_amount=Decimal("108.37"))
+        summary = upload_invoices(usd_dir, api_url=self.api_url, api_key="test", requests_per_second=0, backoff=0,
+                                  ledger_file=os.path.join(self.tmpdir.name, "ledger.json"))
+        self.assertEqual(summary["uploaded"], ["ETSY-2409-0002"])
+
+        # Booked in euro: the amount of the statement and the VAT in euro, not the dollar amounts
+        voucher = json.loads([body for path, body in self.server.requests if path == "/v1/vouchers"][-1])
+        self.assertEqual(voucher["totalGrossAmount"], 100.0)
+        self.assertEqual(voucher["totalTaxAmount"], 15.97)
+        self.assertEqual(voucher["voucherItems"][0]["amount"], 100.0)
+        self.assertIn("108.37 USD", voucher["remark"])
+
+    def test_no_duplicate_voucher_after_lost_response(self):
+        ledger_file = os.path.join(self.tmpdir.name, "ledger.json")
+        options = {"api_url": self.api_url, "api_key": "test", "ledger_file": ledger_file,
+                   "requests_per_second": 0, "backoff": 0, "max_workers": 1}
+        self.server.drop_responses = 1
+
+        summary = upload_invoices(self.invoice_dir, **options)
+        self.assertEqual(summary["failed"], {})
+        # The lost voucher was found by its number instead of being posted again
+        self.assertEqual(self.server.voucher_count, 2)
+        self.assertEqual(sorted(self.server.files), ["voucher-1", "voucher-2"])
+        with open(ledger_file, encoding="utf-8") as file:
+            ledger = json.load(file)
+        self.assertEqual(ledger["ETSY-2409-0001-STORNO"], {"voucher_id": "voucher-1", "file_uploaded": True})
+
+        # A run that stopped while posting a voucher, or the file of another one, asks Lexoffice first as well
+        self.server.files.remove("voucher-1")
+        ledger["ETSY-2409-0001-STORNO"] = {"pending": "voucher"}
+        ledger["ETSY-2409-0001"] = {"voucher_id": "voucher-2", "pending": "file"}
+        with open(ledger_file, "w", encoding="utf-8") as file:
+            json.dump(ledger, file)
+        summary = upload_invoices(self.invoice_dir, **options)
+        self.assertEqual(summary["uploaded"], ["ETSY-2409-0001", "ETSY-2409-0001-STORNO"])
+        self.assertEqual(self.server.voucher_count, 2)
+        self.assertEqual(sorted(self.server.files), ["voucher-1", "voucher-2"])
+
+    def test_upload_retries_and_is_idempotent(self):
+        ledger_file = os.path.join(self.tmpdir.name, "ledger.json")
+        options = {"api_url": self.api_url, "api_key": "test", "ledger_file": ledger_file,
+                   "requests_per_second": 0, "backoff": 0}
+
+        summary = upload_invoices(self.invoice_dir, **options)
+        self.assertEqual(summary["uploaded"], ["ETSY-2409-0001", "ETSY-2409-0001-STORNO"])
+        self.assertEqual(summary["failed"], {})
+        # Two vouchers and two files, plus the one request that was rate limited
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(sum(path == "/v1/vouchers" for path, _ in self.server.requests), 3)
+
+        summary = upload_invoices(self.invoice_dir, **options)
+        self.assertEqual(summary["uploaded"], [])
+        self.assertEqual(summary["skipped"], ["ETSY-2409-0001", "ETSY-2409-0001-STORNO"])
+        self.assertEqual(len(self.server.requests), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
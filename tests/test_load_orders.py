@@ -0,0 +1,88 @@
+import unittest
+import os
+import sys
+import tempfile
+import gzip
+import hashlib
+import zipfile
+from unittest.mock import patch
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import etsy_to_lexoffice  # Import after modifying sys.path
+from etsy_to_lexoffice import load_orders_file, get_orders_files, get_referenced_orders, calculate_file_hash
+from helpers import ORDERS_HEADER
+
+HEADER = ORDERS_HEADER + "\n"
+
+
+class TestLoadOrders(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.write("EtsySoldOrders2023.csv", "1001,01/05/23,Old Name,Alte Str. 1,,Bonn,,53111,Germany\n"
+                                             "1002,02/05/23,Erika Musterfrau,Hauptstr. 1,,Berlin,,10115,Germany\n")
+        self.write("EtsySoldOrders2024-9.csv", "1001,09/15/24,New Name,Neue Str. 2,,Köln,,50667,Germany\n"
+                                               "1003,09/16/24,Max Mustermann,Marktplatz 2,,Hamburg,,20095,Germany\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, filename, rows):
+        with open(os.path.join(self.tmpdir.name, filename), "w", encoding="utf-8") as f:
+            f.write(HEADER + rows)
+
+    def test_referenced_orders(self):
+        rows = [["September 15, 2024", "Sale", "Payment for Order #1001"],
+                ["September 15, 2024", "Tax", "Sales tax paid by buyer", "Order #1001"],
+                ["October 2, 2024", "Refund", "Refund to buyer for Order #1003"],
+                ["October 2, 2024", "Deposit", "€100.00 sent to your bank account"]]
+        self.assertEqual(get_referenced_orders(rows), {"1001", "1003"})
+
+    def test_only_referenced_orders_are_kept(self):
+        orders = load_orders_file(self.tmpdir.name, order_ids={"1001", "1002"})
+        self.assertEqual(sorted(orders), ["1001", "1002"])
+        self.assertEqual(orders["1001"].get("Full Name"), "New Name")  # The newest file wins
+        self.assertEqual(orders["1002"].get("Ship City"), "Berlin")
+        self.assertEqual(orders["1002"].get("Order ID", "n/a"), "n/a")
+        self.assertEqual(repr(orders["1002"]), repr({"Full Name": "Erika Musterfrau", "Street 1": "Hauptstr. 1",
+                                                     "Street 2": "", "Ship City": "Berlin", "Ship State": "",
+                                                     "Ship Zipcode": "10115", "Ship Country": "Germany"}))
+
+    def test_stops_when_all_orders_are_found(self):
+        filenames, newest_first = get_orders_files(self.tmpdir.name)
+        self.assertTrue(newest_first)
+        self.assertEqual([os.path.basename(f) for f in filenames], ["EtsySoldOrders2024-9.csv",
+                                                                     "EtsySoldOrders2023.csv"])
+
+        with patch.object(etsy_to_lexoffice, 'read_csv_rows', wraps=etsy_to_lexoffice.read_csv_rows) as mock_read:
+            orders = load_orders_file(self.tmpdir.name, order_ids={"1003"})
+        self.assertEqual(list(orders), ["1003"])
+        self.assertEqual(mock_read.call_count, 1)
+
+    def test_compressed_and_zipped_exports(self):
+        os.remove(os.path.join(self.tmpdir.name, "EtsySoldOrders2023.csv"))
+        with gzip.open(os.path.join(self.tmpdir.name, "EtsySoldOrders2022.csv.gz"), "wt", encoding="utf-8") as f:
+            f.write(HEADER + "1004,03/05/22,Anna Beispiel,Weg 3,,Essen,,45127,Germany\n")
+        zip_filename = os.path.join(self.tmpdir.name, "etsy-2023.zip")
+        with zipfile.ZipFile(zip_filename, "w") as archive:
+            archive.writestr("EtsySoldOrders2023.csv", HEADER + "1002,02/05/23,Erika Musterfrau,Hauptstr. 1,,Berlin,,"
+                                                                "10115,Germany\n")
+
+        filenames, newest_first = get_orders_files(self.tmpdir.name)
+        self.assertTrue(newest_first)
+        self.assertEqual([os.path.basename(f) for f in filenames], ["EtsySoldOrders2024-9.csv",
+                                                                     "etsy-2023.zip::EtsySoldOrders2023.csv",
+                                                                     "EtsySoldOrders2022.csv.gz"])
+        orders = load_orders_file(self.tmpdir.name, order_ids={"1002", "1004"})
+        self.assertEqual(orders["1002"].get("Full Name"), "Erika Musterfrau")
+        self.assertEqual(orders["1004"].get("Ship City"), "Essen")
+
+        with open(zip_filename, "rb") as f:
+            self.assertEqual(calculate_file_hash(filenames[1]), hashlib.sha256(f.read()).hexdigest())
+
+    def test_without_order_ids_all_orders_are_loaded(self):
+        self.assertEqual(sorted(load_orders_file(self.tmpdir.name)), ["1001", "1002", "1003"])
+
+
+if __name__ == '__main__':
+    unittest.main()
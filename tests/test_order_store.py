@@ -0,0 +1,93 @@
+import unittest
+import os
+import shutil
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import after modifying sys.path
+from order_store import OrderStore
+from memory_report import MemoryReport, estimate_size
+from etsy_to_lexoffice import OrderRecord, convert_csv
+from pipeline import LedgerSink
+from helpers import WorkdirTestCase, statement, orders, ORDER_1001
+
+STATEMENT = statement(
+    '"September 15, 2024",Sale,"Payment for Order #1001",,EUR,€100.00,--,€100.00,--,--,--',
+    '"September 16, 2024",Sale,"Payment for Order #1002",,EUR,€50.00,--,€50.00,--,--,--',
+    '"October 2, 2024",Refund,"Refund to buyer for Order #1001",,EUR,-€100.00,--,-€100.00,--,--,--',
+)
+
+ORDERS = orders(ORDER_1001, "1002,09/16/24,Jean Dupont,1 Rue de Rivoli,,Paris,,75001,France")
+
+
+class TestOrderStore(WorkdirTestCase):
+
+    def test_spill_above_budget(self):
+        records = {str(order_id): OrderRecord((f"Name {order_id}", "Street", "", "City", "", "12345", "Germany"))
+                   for order_id in range(100)}
+        store = OrderStore(budget=estimate_size(records) // 2, cache_size=10)
+        for order_id, record in records.items():
+            store[order_id] = record
+        self.assertTrue(store.spilled)
+        self.assertTrue(os.path.exists(store.path))
+        self.assertEqual(len(store), 100)
+        for order_id, record in records.items():
+            self.assertEqual(store[order_id], record)
+            self.assertIsInstance(store[order_id], OrderRecord)
+        self.assertNotIn("100", store)
+        self.assertIsNone(store.get("100"))
+        with self.assertRaises(KeyError):
+            _ = store["100"]
+        # Only the cached orders count once the orders are in the file
+        self.assertLess(store.estimated_size(), store.size / 5)
+
+        # Storing an order only replaces its own cache entry
+        self.assertEqual(store["7"], records["7"])
+        cached = list(store.cache)
+        store["7"] = records["8"]
+        self.assertEqual(list(store.cache), [order_id for order_id in cached if order_id != "7"])
+        self.assertEqual(store["7"], records["8"])
+        self.assertLessEqual(len(store.cache), 10)
+        path = store.path
+        store.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_within_budget(self):
+        store = OrderStore(budget=2 ** 20)
+        store["1001"] = OrderRecord(("Erika Musterfrau",) + ("",) * 6)
+        self.assertFalse(store.spilled)
+        self.assertEqual(store.orders, {"1001": store["1001"]})
+        store.close()
+
+    def test_memory_report(self):
+        report = MemoryReport()
+        rows = [["September 15, 2024", "Sale", f"Payment for Order #{order_id}"] for order_id in range(5000)]
+        size = report.measure("Statement rows", rows, "5000 rows")
+        # The sampled estimate is close to a full count
+        self.assertAlmostEqual(size, estimate_size(rows, sample=len(rows)), delta=size * 0.05)
+        text = report.report()
+        self.assertTrue(text.startswith("Memory: peak "))
+        self.assertIn("Statement rows", text)
+        self.assertIn("(5000 rows)", text)
+
+    def test_convert_with_max_memory(self):
+        self.workdir(STATEMENT, ORDERS)
+
+        outputs = []
+        for max_memory in (None, 0):
+            ledger = []
+            convert_csv("statement.csv", "output.csv", numbering="monthly", sinks=[LedgerSink(ledger)],
+                        max_memory=max_memory, memory_report=max_memory is not None)
+            invoices = {}
+            for name in os.listdir("Rechnungen"):
+                with open(os.path.join("Rechnungen", name), "rb") as f:
+                    invoices[name] = f.read()
+            with open("output.csv", encoding="utf-8") as f:
+                outputs.append((f.read(), ledger, invoices))
+            shutil.rmtree("Rechnungen")
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(len(outputs[0][2]), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
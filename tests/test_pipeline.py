@@ -0,0 +1,100 @@
+import unittest
+import os
+import sys
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pipeline import Booking, InvoiceRequest, Sink, ThreadedSink  # Import after modifying sys.path
+from etsy_to_lexoffice import convert_csv, normalize_rows, classify_rows
+from helpers import WorkdirTestCase, statement, SALE_1001, TAX_1001
+
+STATEMENT = statement(
+    '"September 10, 2024",Deposit,"€123.45 sent to your bank account",,EUR,--,--,--,--,--',
+    SALE_1001,
+    TAX_1001,
+    '"September 15, 2024",Fee,"Transaction fee: Mug","Order #1001",EUR,--,-€2.20,-€2.20,--,--',
+    '"October 2, 2024",Refund,"Refund to buyer for Order #1001",,EUR,--,--,-€88.20,--,--,--',
+)
+
+
+class CollectingSink(Sink):
+
+    def __init__(self, gate=None):
+        self.events = []
+        self.closed = False
+        self.gate = gate
+
+    def booking(self, booking):
+        if self.gate is not None:
+            self.gate.wait()
+        self.events.append(booking)
+
+    def invoice(self, request):
+        self.events.append(request)
+
+    def close(self):
+        self.closed = True
+
+
+class FailingSink(Sink):
+
+    def booking(self, booking):
+        raise OSError("disk full")
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_classify_drops_rows_without_handler(self):
+        rows = [["September 15, 2024", "Sale"], ["September 15, 2024", "Tax"], ["October 1, 2024", "Marketing"]]
+        records = list(classify_rows(normalize_rows(rows)))
+        self.assertEqual([(r.index, r.kind, r.month) for r in records], [(0, "sale", (2024, 9)),
+                                                                          (2, "fee", (2024, 10))])
+
+    def test_threaded_sink_blocks_when_queue_is_full(self):
+        gate = threading.Event()
+        sink = CollectingSink(gate)
+        threaded = ThreadedSink(sink, maxsize=1)
+        threaded.booking(Booking(["1"]))  # Taken by the sink thread, which waits for the gate
+        threaded.booking(Booking(["2"]))  # Fills the queue
+
+        producer = threading.Thread(target=threaded.booking, args=(Booking(["3"]),))
+        producer.start()
+        producer.join(0.2)
+        self.assertTrue(producer.is_alive())
+
+        gate.set()
+        producer.join()
+        threaded.close()
+        self.assertEqual([event.row for event in sink.events], [["1"], ["2"], ["3"]])
+        self.assertTrue(sink.closed)
+
+    def test_threaded_sink_raises_sink_errors(self):
+        threaded = ThreadedSink(FailingSink())
+        threaded.booking(Booking(["1"]))
+        with self.assertRaises(OSError):
+            threaded.close()
+
+
+class TestCustomSink(WorkdirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.workdir(STATEMENT)
+
+    def test_custom_sink_receives_every_event(self):
+        sink = CollectingSink()
+        convert_csv("statement.csv", dry_run=True, sinks=[sink])
+        self.assertTrue(sink.closed)
+        self.assertEqual([type(event).__name__ for event in sink.events],
+                         ["Booking", "Booking", "InvoiceRequest", "Booking", "Booking", "InvoiceRequest"])
+        self.assertEqual([event.row[1] for event in sink.events if isinstance(event, Booking)],
+                         ["Auszahlung", "Verkauf", "Gebühr", "Rückerstattung"])
+        storno = sink.events[-1]
+        self.assertIsInstance(storno, InvoiceRequest)
+        self.assertTrue(storno.is_cancellation)
+        self.assertEqual(storno.original_invoice_number + "-STORNO", storno.invoice_number)
+        self.assertFalse(os.path.exists("Rechnungen"))
+
+
+if __name__ == '__main__':
+    unittest.main()
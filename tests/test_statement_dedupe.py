@@ -0,0 +1,77 @@
+import unittest
+import csv
+import os
+import sys
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from statement_dedupe import SqliteFingerprintStore, dedupe_rows, row_fingerprint  # Import after modifying sys.path
+from etsy_to_lexoffice import convert_csv
+from helpers import WorkdirTestCase, statement, SALE_1001 as SALE, TAX_1001 as TAX, REFUND_1001 as REFUND
+
+LISTING_FEE = '"September 16, 2024",Fee,"Listing fee",,EUR,--,-€0.18,-€0.18,--,--,--'
+
+
+def parse(*lines):
+    return list(csv.reader(lines))
+
+
+class TestDedupeRows(unittest.TestCase):
+
+    def test_fingerprint_ignores_status_columns(self):
+        sale = parse(SALE)[0]
+        self.assertEqual(row_fingerprint(sale), row_fingerprint(sale[:8] + ["--", "Paid", "--"]))
+        self.assertNotEqual(row_fingerprint(sale), row_fingerprint(parse(TAX)[0]))
+
+    def test_overlap_is_dropped_and_repeated_fees_are_kept(self):
+        september = parse(SALE, TAX, LISTING_FEE, LISTING_FEE)
+        overlap = parse(LISTING_FEE, LISTING_FEE, LISTING_FEE, REFUND)
+        rows, counts, stats = dedupe_rows([september, overlap])
+        self.assertEqual(rows, september + parse(LISTING_FEE, REFUND))
+        self.assertEqual((stats.rows, stats.duplicates, stats.kept), (8, 2, 6))
+        self.assertEqual(counts[row_fingerprint(parse(LISTING_FEE)[0])], 3)
+
+    def test_store_skips_rows_of_earlier_runs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "seen.sqlite")
+            store = SqliteFingerprintStore(path)
+            _, counts, _ = dedupe_rows([parse(SALE, TAX, LISTING_FEE)], store)
+            store.update(counts)
+            store.close()
+
+            store = SqliteFingerprintStore(path)
+            rows, _, stats = dedupe_rows([parse(TAX, LISTING_FEE, LISTING_FEE, REFUND)], store)
+            store.close()
+            self.assertEqual(rows, parse(LISTING_FEE, REFUND))
+            self.assertEqual(stats.already_booked, 2)
+
+
+class TestOverlappingExports(WorkdirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.workdir()
+        for filename, lines in [("full.csv", [SALE, TAX, LISTING_FEE, LISTING_FEE, REFUND]),
+                                ("september.csv", [SALE, TAX, LISTING_FEE, LISTING_FEE]),
+                                ("mid-september.csv", [LISTING_FEE, LISTING_FEE, REFUND])]:
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(statement(*lines))
+
+    def convert(self, input_file, **kwargs):
+        # Monthly numbering, so the running invoice counter of earlier conversions doesn't matter
+        convert_csv(input_file, "output.csv", numbering="monthly", write_invoices=False, **kwargs)
+        with open("output.csv", encoding="utf-8") as f:
+            return list(csv.reader(f))
+
+    def test_overlapping_exports_convert_like_one_export(self):
+        expected = self.convert("full.csv")
+        self.assertEqual(self.convert(["september.csv", "mid-september.csv"]), expected)
+
+    def test_later_run_only_converts_new_rows(self):
+        self.convert("september.csv", seen_rows="seen.sqlite")
+        rows = self.convert("mid-september.csv", seen_rows="seen.sqlite")
+        self.assertEqual([row[1] for row in rows[1:]], ["Rückerstattung"])
+
+
+if __name__ == '__main__':
+    unittest.main()
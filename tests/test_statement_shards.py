@@ -0,0 +1,73 @@
+import unittest
+import csv
+import os
+import shutil
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from statement_shards import split_month_shards, build_order_index, shard_context  # Import after modifying sys.path
+from etsy_to_lexoffice import convert_csv
+from helpers import WorkdirTestCase, statement, orders, SALE_1001, TAX_1001, REFUND_1001, ORDER_1001, ORDER_1002
+
+STATEMENT = statement(
+    SALE_1001,
+    TAX_1001,
+    '"September 16, 2024",Fee,"Transaction fee: Mug",,EUR,--,-€1.50,-€1.50,--,--,--',
+    '"September 20, 2024",Sale,"Payment for Order #1002",,EUR,€40.00,--,€40.00,--,--,--',
+    '"October 1, 2024",Deposit,"€100.00 sent to your bank account",,EUR,--,--,--,--,--,--',
+    REFUND_1001,
+    '"October 2, 2024",Fee,"Credit for transaction fee","Order #1001",EUR,--,€1.50,€1.50,--,--,--',
+    '"October 5, 2024",Fee,"Listing fee",,EUR,--,-€0.18,-€0.18,--,--,--',
+    '"October 8, 2025",Fee,"Listing fee",,EUR,--,-€0.18,-€0.18,--,--,--',
+)
+
+
+class TestStatementShards(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = list(csv.reader(STATEMENT.splitlines()))[1:]
+
+    def test_split_by_month_and_year(self):
+        shards = split_month_shards(self.rows)
+        self.assertEqual([shard.month for shard in shards], [(2024, 9), (2024, 10), (2025, 10)])
+        self.assertEqual(shards[1].indexes, [4, 5, 6, 7])
+
+    def test_context_contains_rows_of_earlier_months(self):
+        shards = split_month_shards(self.rows)
+        context = shard_context(self.rows, shards[1], build_order_index(self.rows))
+        self.assertEqual(context, self.rows[0:2] + self.rows[4:8])
+
+
+class TestShardedConversion(WorkdirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.workdir(STATEMENT, orders(ORDER_1001, ORDER_1002))
+
+    def convert(self, workers):
+        output_file = f"output-{workers}.csv"
+        convert_csv("statement.csv", output_file, numbering="monthly", workers=workers)
+        invoices = {}
+        for filename in sorted(os.listdir("Rechnungen")):
+            with open(os.path.join("Rechnungen", filename), encoding="utf-8") as f:
+                invoices[filename] = f.read()
+        shutil.rmtree("Rechnungen")
+        with open(output_file, encoding="utf-8") as f:
+            return list(csv.reader(f)), invoices
+
+    def test_parallel_output_matches_single_process(self):
+        rows, invoices = self.convert(workers=1)
+        self.assertEqual(self.convert(workers=2), (rows, invoices))
+
+        self.assertEqual(sorted(invoices), ["ETSY-2409-0001-STORNO.xml", "ETSY-2409-0001.xml", "ETSY-2409-0002.xml"])
+        refund = next(row for row in rows if row[1] == "Rückerstattung")
+        self.assertTrue(refund[3].startswith("Invoice ETSY-2409-0001-STORNO - Full Refund Bestellung #1001"))
+        fee_summaries = [(row[0], row[3]) for row in rows if row[1] == "Gebühr"]
+        self.assertEqual(fee_summaries, [("30.09.2024", "Transaction Fees"),
+                                         ("31.10.2024", "Transaction Fees"),
+                                         ("31.10.2024", "Listing Fees (Listing, Renew Expired, Renew Sold)"),
+                                         ("31.10.2025", "Listing Fees (Listing, Renew Expired, Renew Sold)")])
+
+
+if __name__ == '__main__':
+    unittest.main()
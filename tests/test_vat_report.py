@@ -0,0 +1,84 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from datetime import date
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pandas as pd  # Import after modifying sys.path
+from pipeline import InvoiceRequest
+from ledger_export import ledger_record
+from xrechnung_generator import load_country_codes, UNMAPPED_COUNTRIES
+from vat_report import VatReportSink, aggregate_vat, ledger_vat_figures, write_vat_report
+
+GERMANY = {"Street 1": "Hauptstr. 1", "Ship City": "Berlin", "Ship Zipcode": "10115", "Ship Country": "Germany"}
+USA = {"Street 1": "Main St 1", "Ship City": "Boston", "Ship Zipcode": "02108", "Ship Country": "United States"}
+
+
+class TestVatReport(unittest.TestCase):
+
+    def setUp(self):
+        self.country_codes = load_country_codes(os.path.join(os.path.dirname(__file__), '..', 'country_codes.csv'))
+        # Sale and cancellation in Germany in Q3, two exports to the US in Q3 and Q4, one to nowhere
+        UNMAPPED_COUNTRIES.clear()
+        self.invoices = [
+            ("ETSY-1", 119.0, date(2024, 9, 15), GERMANY, False),
+            ("ETSY-1-STORNO", -119.0, date(2024, 9, 20), GERMANY, True),
+            ("ETSY-2", 60.0, date(2024, 9, 16), USA, False),
+            ("ETSY-3", 30.0, date(2024, 10, 1), USA, False),
+            ("ETSY-4", 10.0, date(2024, 10, 2), dict(USA, **{"Ship Country": "Atlantis"}), False),
+        ]
+
+    def sink_report(self, period="quarter", count_unmapped=False):
+        sink = VatReportSink(self.country_codes, count_unmapped)
+        for invoice_number, amount, invoice_date, address, is_cancellation in self.invoices:
+            # The handlers pass the refund amount negated, the invoice turns it into the cancelled amount
+            sink.invoice(InvoiceRequest(invoice_number, "Bestellung", -amount if is_cancellation else amount,
+                                        invoice_date, "Käufer", address, is_cancellation))
+        return aggregate_vat(sink.figures, period)
+
+    def test_groups_with_cancellations(self):
+        report = self.sink_report()
+        rows = {(row.period, row.country): row for row in report.itertuples()}
+        self.assertEqual(sorted(rows), [("2024Q3", "DE"), ("2024Q3", "US"), ("2024Q4", ""), ("2024Q4", "US")])
+
+        germany = rows[("2024Q3", "DE")]
+        self.assertEqual((germany.invoices, germany.cancellations), (2, 1))
+        self.assertEqual((germany.net, germany.vat, germany.gross), (0.0, 0.0, 0.0))
+        self.assertEqual((germany.cancelled_net, germany.cancelled_vat), (-100.0, -19.0))
+
+        # The XRechnungen count the unmapped country, the report only if it runs without them
+        self.assertEqual(UNMAPPED_COUNTRIES, {})
+        self.sink_report(count_unmapped=True)
+        self.assertEqual(UNMAPPED_COUNTRIES, {"Atlantis": 1})
+
+        export = rows[("2024Q3", "US")]
+        self.assertEqual((export.category, export.rate, export.net, export.vat), ("G", 0.0, 60.0, 0.0))
+        self.assertEqual(len(self.sink_report("month")), 4)
+
+    def test_ledger_gives_the_same_report(self):
+        ledger = pd.DataFrame([
+            ledger_record(invoice_date, "Rückerstattung" if is_cancellation else "Verkauf", amount,
+                          invoice_number=invoice_number, country=address["Ship Country"])
+            for invoice_number, amount, invoice_date, address, is_cancellation in self.invoices
+        ] + [ledger_record(date(2024, 9, 30), "Gebühr", -1.5)])
+        pd.testing.assert_frame_equal(aggregate_vat(ledger_vat_figures(ledger, self.country_codes)),
+                                      self.sink_report())
+
+    def test_write_csv_and_json(self):
+        report = self.sink_report()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_vat_report(report, os.path.join(tmpdir, "oss.csv"))
+            write_vat_report(report, os.path.join(tmpdir, "oss.json"))
+            with open(os.path.join(tmpdir, "oss.csv"), encoding="utf-8") as f:
+                self.assertEqual(f.readline().strip(), "period,country,category,rate,invoices,cancellations,"
+                                                       "net,vat,gross,cancelled_net,cancelled_vat")
+            with open(os.path.join(tmpdir, "oss.json"), encoding="utf-8") as f:
+                self.assertEqual(json.load(f)[1]["net"], 60.0)
+            with self.assertRaises(ValueError):
+                write_vat_report(report, os.path.join(tmpdir, "oss.xlsx"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import os
+import sys
+from decimal import Decimal
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from xrechnung_generator import (  # Import after modifying sys.path
+    load_country_codes, lookup_vat_decision, get_vat_table, get_country_code, UNMAPPED_COUNTRIES
+)
+
+
+class TestVatTable(unittest.TestCase):
+
+    def setUp(self):
+        self.country_codes = load_country_codes(os.path.join(os.path.dirname(__file__), '..', 'country_codes.csv'))
+        UNMAPPED_COUNTRIES.clear()
+
+    def test_decisions(self):
+        germany = lookup_vat_decision("Germany", False, self.country_codes)
+        self.assertEqual((germany.rate, germany.category, germany.country_code), (Decimal("0.19"), "S", "DE"))
+        self.assertEqual(lookup_vat_decision("France", False, self.country_codes).category, "S")
+        self.assertEqual(lookup_vat_decision("France", True, self.country_codes).category, "K")
+        self.assertEqual(lookup_vat_decision("United States", False, self.country_codes).category, "G")
+        self.assertEqual(lookup_vat_decision("United States", True, self.country_codes).category, "Z")
+        # The United Kingdom is not in the EU, its buyers are invoiced as exports
+        self.assertEqual(lookup_vat_decision("United Kingdom", False, self.country_codes).category, "G")
+        self.assertEqual(lookup_vat_decision("United Kingdom", True, self.country_codes).category, "Z")
+        self.assertEqual(lookup_vat_decision("UK", False, self.country_codes).country_code, "GB")
+
+    def test_aliases_and_normalized_spellings(self):
+        self.assertEqual(get_country_code("Czech Republic", self.country_codes), "CZ")
+        self.assertEqual(get_country_code("South Korea", self.country_codes), "KR")
+        self.assertEqual(get_country_code("  cote d'ivoire ", self.country_codes), "CI")
+        self.assertEqual(get_country_code("GERMANY", self.country_codes), "DE")
+        self.assertEqual(UNMAPPED_COUNTRIES, {})
+
+    def test_unmapped_countries_are_reported(self):
+        decision = lookup_vat_decision("Atlantis", False, self.country_codes)
+        lookup_vat_decision("Atlantis", False, self.country_codes)
+        self.assertEqual((decision.country_code, decision.category), ("", "G"))
+        self.assertEqual(UNMAPPED_COUNTRIES, {"Atlantis": 2})
+
+    def test_built_once(self):
+        self.assertIs(load_country_codes(os.path.join(os.path.dirname(__file__), '..', 'country_codes.csv')),
+                      self.country_codes)
+        self.assertIs(get_vat_table(self.country_codes), get_vat_table(self.country_codes))
+
+    def test_table_is_read_only(self):
+        lookup_vat_decision("  GERMANY ", False, self.country_codes)
+        table = get_vat_table(self.country_codes)
+        self.assertEqual(table.by_code[("DE", False)].rate, Decimal("0.19"))
+        with self.assertRaises(TypeError):
+            table.by_code[("DE", False)] = None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import date
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from xrechnung_generator import render_xrechnung_lxml, load_country_codes  # Import after modifying sys.path
+from xrechnung_validator import (
+    validate_xrechnungen, ValidatingInvoiceWriter, ValidationSetupError, get_validators
+)
+
+# Minimal stand-in for the UBL schema: only the Invoice root in the UBL namespace is checked
+TEST_XSD = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+           targetNamespace="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+           elementFormDefault="qualified">
+  <xs:element name="Invoice">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:any namespace="##other" processContents="skip" minOccurs="0" maxOccurs="unbounded"/>
+      </xs:sequence>
+      <xs:anyAttribute namespace="##other" processContents="skip"/>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+TEST_SCHEMATRON = """<?xml version="1.0" encoding="UTF-8"?>
+<schema xmlns="http://purl.oclc.org/dsdl/schematron">
+  <ns prefix="ubl" uri="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"/>
+  <ns prefix="cbc" uri="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"/>
+  <pattern>
+    <rule context="/ubl:Invoice">
+      <assert test="starts-with(cbc:ID, 'ETSY-')">Invoice number must start with ETSY-</assert>
+    </rule>
+  </pattern>
+</schema>
+"""
+
+INVALID_INVOICE = b"""<?xml version='1.0' encoding='UTF-8'?>
+<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"><Bogus/></Invoice>"""
+
+
+class TestXRechnungValidator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.xsd_path = os.path.join(self.tmpdir.name, "invoice.xsd")
+        self.sch_path = os.path.join(self.tmpdir.name, "rules.sch")
+        with open(self.xsd_path, "w", encoding="utf-8") as f:
+            f.write(TEST_XSD)
+        with open(self.sch_path, "w", encoding="utf-8") as f:
+            f.write(TEST_SCHEMATRON)
+        country_codes = load_country_codes(os.path.join(os.path.dirname(__file__), '..', 'country_codes.csv'))
+        self.address = {"Street 1": "Hauptstr. 1", "Ship City": "Berlin", "Ship Zipcode": "10115",
+                        "Ship Country": "Germany"}
+        self.country_codes = country_codes
+
+    def tearDown(self):
+        get_validators.cache_clear()
+        self.tmpdir.cleanup()
+
+    def render(self, invoice_number):
+        return render_xrechnung_lxml(invoice_number, "Etsy Bestellung #1", 119.0, date(2024, 9, 15),
+                                     "Max Mustermann", self.address, self.country_codes)
+
+    def test_validate_batch_reports_failures(self):
+        invoices = [("ETSY-2409-0001", self.render("ETSY-2409-0001")),
+                    ("OTHER-0002", self.render("OTHER-0002")),
+                    ("ETSY-2409-0003", INVALID_INVOICE)]
+        failures = validate_xrechnungen(invoices, xsd_path=self.xsd_path, schematron_path=self.sch_path)
+        self.assertEqual(sorted(failures), ["ETSY-2409-0003", "OTHER-0002"])
+        self.assertIn("Invoice number must start with ETSY-", failures["OTHER-0002"][0])
+        self.assertIn("Bogus", failures["ETSY-2409-0003"][0])
+
+        # The parallel path gives the same result
+        parallel = validate_xrechnungen(invoices, max_workers=2, xsd_path=self.xsd_path,
+                                        schematron_path=self.sch_path, parallel_threshold=0)
+        self.assertEqual(parallel, failures)
+
+    def test_validating_writer_writes_after_validation(self):
+        output_dir = os.path.join(self.tmpdir.name, "Rechnungen")
+        writer = ValidatingInvoiceWriter(output_dir, batch_size=10, xsd_path=self.xsd_path, schematron_path=None)
+        filename = writer("ETSY-2409-0001", "Etsy Bestellung #1", 119.0, date(2024, 9, 15), "Max Mustermann",
+                          self.address, self.country_codes)
+        self.assertEqual(filename, "ETSY-2409-0001.xml")
+        self.assertFalse(os.path.exists(os.path.join(output_dir, filename)))
+
+        writer.flush()
+        self.assertTrue(os.path.exists(os.path.join(output_dir, filename)))
+        self.assertEqual(writer.report(), "XRechnung validation: 1 of 1 invoices valid, 0 failed")
+
+    def test_missing_schema(self):
+        with self.assertRaises(ValidationSetupError):
+            get_validators(os.path.join(self.tmpdir.name, "missing.xsd"), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
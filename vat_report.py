@@ -0,0 +1,152 @@
+# vat_report.py
+import os
+import logging
+import argparse
+from decimal import Decimal
+import pandas as pd
+from pipeline import Sink
+from xrechnung_generator import build_invoice_model, lookup_vat_decision, load_country_codes
+
+# Columns of the VAT report, one row per period, destination country, VAT category and rate
+VAT_REPORT_KEYS = ["period", "country", "category", "rate"]
+VAT_REPORT_COLUMNS = VAT_REPORT_KEYS + ["invoices", "cancellations", "net", "vat", "gross",
+                                        "cancelled_net", "cancelled_vat"]
+
+# Pandas period codes of the report periods
+VAT_REPORT_PERIODS = {"month": "M", "quarter": "Q"}
+
+VAT_REPORT_FORMATS = {".csv": "csv", ".json": "json"}
+
+# Ledger record types that come with an XRechnung
+INVOICE_TYPES = {"Verkauf": False, "Rückerstattung": True}
+
+
+def to_cents(amount):
+    """Rounds an amount to whole cents the way the invoices format it."""
+    return int((Decimal(str(amount)) * 100).to_integral_value())
+
+
+def vat_figures(model):
+    """Returns the VAT figures of an InvoiceModel in cents, so the sums are exact."""
+    return {
+        "date": model.issue_date,
+        "country": model.vat.country_code,
+        "category": model.vat.category,
+        "rate": float(model.vat.rate * 100),
+        "is_cancellation": model.type_code == "381",
+        "net_cents": to_cents(model.net_amount),
+        "vat_cents": to_cents(model.tax_amount),
+        "gross_cents": to_cents(model.gross_amount),
+    }
+
+
+class VatReportSink(Sink):
+    """Collects the VAT figures of every invoice of the conversion.
+
+    The figures come from the same build_invoice_model as the XRechnungen, so the report adds up
+    exactly what the invoices show. Unmapped buyer countries are only counted with count_unmapped,
+    when no XRechnungen are generated that count them already.
+    """
+
+    def __init__(self, country_codes, count_unmapped=False):
+        self.country_codes = country_codes
+        self.count_unmapped = count_unmapped
+        self.figures = []
+
+    def invoice(self, request):
+        model = build_invoice_model(request.invoice_number, request.order_info, request.amount, request.date,
+                                    request.buyer, request.address_details, self.country_codes,
+                                    request.is_cancellation, request.original_invoice_number,
+                                    count_unmapped=self.count_unmapped)
+        self.figures.append(vat_figures(model))
+
+
+def ledger_vat_figures(ledger, country_codes):
+    """Re-derives the VAT figures of all invoices from a normalized ledger DataFrame in bulk.
+
+    The VAT treatment is looked up once per country; the amounts are computed for all rows at once
+    from the ledger's gross amounts, which are rounded to cents.
+    """
+    invoices = ledger[ledger["type"].isin(list(INVOICE_TYPES))]
+    countries = invoices["country"].fillna("").unique()
+    decisions = {country: lookup_vat_decision(country, False, country_codes) for country in countries}
+    country = invoices["country"].fillna("")
+    rate = country.map(lambda name: float(decisions[name].rate))
+    gross_cents = (invoices["gross"] * 100).round().astype("int64")
+    vat_cents = (gross_cents * rate / (1 + rate)).round().astype("int64")
+    return pd.DataFrame({
+        "date": invoices["date"],
+        "country": country.map(lambda name: decisions[name].country_code),
+        "category": country.map(lambda name: decisions[name].category),
+        "rate": rate * 100,
+        "is_cancellation": invoices["type"].map(INVOICE_TYPES),
+        "net_cents": gross_cents - vat_cents,
+        "vat_cents": vat_cents,
+        "gross_cents": gross_cents,
+    })
+
+
+def aggregate_vat(figures, period="quarter"):
+    """Sums net, VAT and gross per period, destination country, VAT category and rate in one groupby.
+
+    Cancellations are included with their negative amounts and also shown separately.
+    """
+    frame = pd.DataFrame(figures, columns=["date", "country", "category", "rate", "is_cancellation",
+                                           "net_cents", "vat_cents", "gross_cents"])
+    if frame.empty:
+        return pd.DataFrame(columns=VAT_REPORT_COLUMNS)
+    frame["period"] = pd.to_datetime(frame["date"]).dt.to_period(VAT_REPORT_PERIODS[period]).astype(str)
+    cancelled = frame["is_cancellation"].astype(bool)
+    frame["cancelled_net_cents"] = frame["net_cents"].where(cancelled, 0)
+    frame["cancelled_vat_cents"] = frame["vat_cents"].where(cancelled, 0)
+
+    report = frame.groupby(VAT_REPORT_KEYS, sort=True).agg(
+        invoices=("net_cents", "size"),
+        cancellations=("is_cancellation", "sum"),
+        net_cents=("net_cents", "sum"),
+        vat_cents=("vat_cents", "sum"),
+        gross_cents=("gross_cents", "sum"),
+        cancelled_net_cents=("cancelled_net_cents", "sum"),
+        cancelled_vat_cents=("cancelled_vat_cents", "sum"),
+    ).reset_index()
+    report["cancellations"] = report["cancellations"].astype("int64")
+    report["net"] = report["net_cents"] / 100
+    report["vat"] = report["vat_cents"] / 100
+    report["gross"] = report["gross_cents"] / 100
+    report["cancelled_net"] = report["cancelled_net_cents"] / 100
+    report["cancelled_vat"] = report["cancelled_vat_cents"] / 100
+    return report[VAT_REPORT_COLUMNS]
+
+
+def write_vat_report(report, filepath):
+    """Writes the VAT report as CSV or JSON, depending on the file extension."""
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in VAT_REPORT_FORMATS:
+        raise ValueError(f"Unsupported VAT report file extension '{extension}', "
+                         f"use one of {', '.join(sorted(VAT_REPORT_FORMATS))}")
+
+    if VAT_REPORT_FORMATS[extension] == "csv":
+        report.to_csv(filepath, index=False, float_format="%.2f")
+    else:
+        report.to_json(filepath, orient="records", indent=2, force_ascii=False, double_precision=2)
+
+    logging.info("Wrote VAT report with %d rows to %s", len(report), filepath)
+    return filepath
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='VAT/OSS report from a ledger file written with --ledger.')
+    parser.add_argument('ledger', help='Ledger file (.parquet or .arrow)')
+    parser.add_argument('-o', '--output', action='append', required=True,
+                        help='Report file (.csv or .json), can be given more than once')
+    parser.add_argument('--period', choices=VAT_REPORT_PERIODS, default='quarter', help='Report period')
+    args = parser.parse_args()
+
+    if os.path.splitext(args.ledger)[1].lower() == ".parquet":
+        ledger_frame = pd.read_parquet(args.ledger)
+    else:
+        ledger_frame = pd.read_feather(args.ledger)
+    totals = aggregate_vat(ledger_vat_figures(ledger_frame, load_country_codes()), args.period)
+    for output in args.output:
+        write_vat_report(totals, output)
+    print(totals.to_string(index=False))
@@ -1,7 +1,15 @@
 # xrechnung_generator.py
 import os
+import re
+import logging
+import functools
+import unicodedata
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from types import MappingProxyType
+from typing import NamedTuple
 from datetime import datetime
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from lxml import etree
 import pandas as pd
 import csv
@@ -9,15 +17,6 @@ import numpy
 import math
 from dotenv import load_dotenv
 
-# Configuration for EU countries and VAT rates
-EU_COUNTRIES = {
-     "AT": "Austria", "BE": "Belgium", "BG": "Bulgaria", "CY": "Cyprus", "CZ": "Czech Republic",
-     "DE": "Germany", "DK": "Denmark", "EE": "Estonia", "ES": "Spain", "FI": "Finland", "FR": "France",
-     "GR": "Greece", "HR": "Croatia", "HU": "Hungary", "IE": "Ireland", "IT": "Italy", "LT": "Lithuania",
-     "LU": "Luxembourg", "LV": "Latvia", "MT": "Malta", "NL": "Netherlands", "PL": "Poland",
-     "PT": "Portugal", "RO": "Romania", "SE": "Sweden", "SI": "Slovenia", "SK": "Slovakia"
-}
-
 load_dotenv()
 
 # Sender address from .env file
@@ -41,8 +40,40 @@ EU_COUNTRIES = {
     "PT": "Portugal", "RO": "Romania", "SE": "Sweden", "SI": "Slovenia", "SK": "Slovakia"
 }
 
+# Etsy spellings of country names that differ from the names in country_codes.csv
+COUNTRY_ALIASES = {
+    "USA": "US", "United States of America": "US", "UK": "GB", "Great Britain": "GB", "England": "GB",
+    "Scotland": "GB", "Wales": "GB", "Northern Ireland": "GB", "Czech Republic": "CZ", "The Netherlands": "NL",
+    "Holland": "NL", "South Korea": "KR", "Korea": "KR", "North Korea": "KP", "Russia": "RU", "Vietnam": "VN",
+    "Bolivia": "BO", "Venezuela": "VE", "Iran": "IR", "Syria": "SY", "Taiwan": "TW", "Tanzania": "TZ",
+    "Moldova": "MD", "Türkiye": "TR", "Turkiye": "TR", "Macedonia": "MK", "North Macedonia": "MK",
+    "Laos": "LA", "Brunei": "BN", "Ivory Coast": "CI", "Palestine": "PS", "Micronesia": "FM",
+    "Vatican City": "VA", "Cape Verde": "CV", "Swaziland": "SZ", "Burma": "MM", "East Timor": "TL",
+    "Falkland Islands": "FK", "Macau": "MO", "British Virgin Islands": "VG", "U.S. Virgin Islands": "VI",
+    "US Virgin Islands": "VI", "Democratic Republic of the Congo": "CD", "Republic of the Congo": "CG",
+    "Kosovo": "XK", "The Bahamas": "BS", "The Gambia": "GM", "St. Lucia": "LC", "St. Kitts and Nevis": "KN",
+    "St. Vincent and the Grenadines": "VC", "Saint Martin": "MF", "Sint Maarten": "SX",
+}
+
+
+class VatDecision(NamedTuple):
+    """VAT treatment of an invoice, precomputed per country and reverse charge flag."""
+    rate: Decimal
+    category: str
+    note: str
+    country_code: str
+
+
 def load_country_codes(csv_filepath="country_codes.csv"):
-    """Loads country codes from a CSV file into a dictionary."""
+    """Loads country codes from a CSV file into a dictionary.
+
+    The file is read once per process, later calls return the same dictionary.
+    """
+    return _load_country_codes(os.path.abspath(csv_filepath))
+
+
+@functools.lru_cache(maxsize=None)
+def _load_country_codes(csv_filepath):
     country_codes = {}
     try:
         with open(csv_filepath, mode='r', encoding='utf-8') as file:
@@ -54,83 +85,421 @@ def load_country_codes(csv_filepath="country_codes.csv"):
         # Consider exiting the program or using default values
     return country_codes
 
-# Load country codes at the beginning
-country_codes = load_country_codes()
-
 def get_country_code(country_name, country_codes):
     """Maps a country name to its ISO 3166-1 alpha-2 code."""
-    return country_codes.get(country_name, "")  # Return empty string if not found
+    return lookup_vat_decision(country_name, False, country_codes).country_code
 
 
-def generate_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
-                            address_details, country_codes, is_cancellation=False,
-                            original_invoice_number=None, output_dir="Rechnungen", reverse_charge=False, buyer_vat_id=""):
-    """Generates an XRechnung XML file."""
+@functools.lru_cache(maxsize=None)
+def normalize_country_name(country_name):
+    """Normalizes a country name for lookups: no accents, case, punctuation or extra whitespace.
 
-    # Create Rechnungen folder if it doesn't exist
-    invoice_folder = output_dir
-    #print(output_dir)
-    if not os.path.exists(invoice_folder):
-        os.makedirs(invoice_folder)
-
-    # Determine VAT rate and note based on country code from mapping
-    country_code = get_country_code(address_details.get("Ship Country", ""), country_codes)
-    if (reverse_charge == False):
-        if country_code == "DE":
-            vat_rate = Decimal("0.19")
-            vat_category = "S"  # Standard rate
-            vat_note = "Lieferung innerhalb Deutschlands mit deutscher Mehrwertsteuer."
-        if country_code == "UK":
-            vat_rate = Decimal("0.00")
-            vat_category = "O"  # Marketplace Sale or below 135 GBP
-            vat_note = "§ 3c UStG i.V.m. Section 14 VAT Act 1994 (VAT durch Marketplace abgeführt)"
-        elif country_code in EU_COUNTRIES:
-            vat_rate = Decimal("0.19")
-            vat_category = "S"
-            vat_note = "Lieferung gemäß § 3a UStG (Umsatz unter 10.000 € grenzüberschreitend)"
-        else:
-            vat_rate = Decimal("0.00")
-            vat_category = "G"  # Export outside the EU
-            vat_note = "Steuerfreie Ausfuhrlieferung nach § 4 Nr. 1a UStG."
-    else:
-        if country_code == "DE":  # In Deutschland gibt es normalerweise kein Reverse Charge!
-            vat_rate = Decimal("0.19")
-            vat_category = "S"  # Standard rate
-            vat_note = "Lieferung innerhalb Deutschlands mit deutscher Mehrwertsteuer. Regelbesteuerung"
-        elif country_code == "UK":
-            vat_rate = Decimal("0.00")
-            vat_category = "K"  # Reverse Charge für UK (Post-Brexit)
-            vat_note = "§ 13b Abs. 2 UStG (Reverse Charge im Bestimmungsland)"
-        elif country_code in EU_COUNTRIES:
-            vat_rate = Decimal("0.00")
-            vat_category = "K"  # Reverse Charge innerhalb der EU
-            vat_note = "Reverse Charge - Steuerschuldnerschaft des Leistungsempfängers gemäß Art. 196 MwStSystRL i.V.m. §13b UStG"
-        else:
-            vat_rate = Decimal("0.00")
-            vat_category = "Z"  # Export außerhalb der EU
-            vat_note = "§ 13b Abs. 2 UStG (Reverse Charge im Bestimmungsland)"
+    Cached, since the same unusual spellings come up on every invoice to that country.
+    """
+    name = unicodedata.normalize("NFKD", str(country_name or ""))
+    name = "".join(c for c in name if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[^\w\s]", " ", name).split())
 
 
-    # Calculate VAT amount and total amount
+def decide_vat(country_code, reverse_charge):
+    """Determines VAT rate, category and note for a destination country, given as ISO code."""
+    if not reverse_charge:
+        if country_code == "DE":
+            return VatDecision(Decimal("0.19"), "S",  # Standard rate
+                               "Lieferung innerhalb Deutschlands mit deutscher Mehrwertsteuer.", country_code)
+        if country_code in EU_COUNTRIES:
+            return VatDecision(Decimal("0.19"), "S",
+                               "Lieferung gemäß § 3a UStG (Umsatz unter 10.000 € grenzüberschreitend)", country_code)
+        return VatDecision(Decimal("0.00"), "G",  # Export outside the EU
+                           "Steuerfreie Ausfuhrlieferung nach § 4 Nr. 1a UStG.", country_code)
+
+    if country_code == "DE":  # In Deutschland gibt es normalerweise kein Reverse Charge!
+        return VatDecision(Decimal("0.19"), "S",  # Standard rate
+                           "Lieferung innerhalb Deutschlands mit deutscher Mehrwertsteuer. Regelbesteuerung",
+                           country_code)
+    if country_code in EU_COUNTRIES:
+        return VatDecision(Decimal("0.00"), "K",  # Reverse Charge innerhalb der EU
+                           "Reverse Charge - Steuerschuldnerschaft des Leistungsempfängers gemäß Art. 196 "
+                           "MwStSystRL i.V.m. §13b UStG", country_code)
+    return VatDecision(Decimal("0.00"), "Z",  # Export außerhalb der EU
+                       "§ 13b Abs. 2 UStG (Reverse Charge im Bestimmungsland)", country_code)
+
+
+class VatTable(NamedTuple):
+    """Lookup tables built once per country code mapping."""
+    decisions: MappingProxyType  # (country name, reverse_charge) -> VatDecision, exact spelling
+    normalized: MappingProxyType  # normalized country name -> ISO code
+    by_code: MappingProxyType  # (ISO code, reverse_charge) -> VatDecision, "" for unmapped countries
+
+
+def build_vat_table(country_codes):
+    """Precomputes the VAT decision of every known country name and alias for both reverse charge flags."""
+    codes_by_name = dict(COUNTRY_ALIASES)
+    codes_by_name.update(country_codes)
+    decisions = {}
+    for country_name, country_code in codes_by_name.items():
+        for reverse_charge in (False, True):
+            decisions[(country_name, reverse_charge)] = decide_vat(country_code, reverse_charge)
+    normalized = {normalize_country_name(name): code for name, code in codes_by_name.items()}
+    by_code = {(country_code, reverse_charge): decide_vat(country_code, reverse_charge)
+               for country_code in set(codes_by_name.values()) | {""} for reverse_charge in (False, True)}
+    return VatTable(MappingProxyType(decisions), MappingProxyType(normalized), MappingProxyType(by_code))
+
+
+# VAT tables per country code mapping, so each mapping is only precomputed once per process
+_vat_tables = {}
+# Country names without a mapping and how many invoices they affected
+UNMAPPED_COUNTRIES = Counter()
+
+
+def get_vat_table(country_codes):
+    """Returns the precomputed VAT table for a country code mapping, building it on first use."""
+    cached = _vat_tables.get(id(country_codes))
+    if cached is None or cached[0] is not country_codes:
+        cached = (country_codes, build_vat_table(country_codes))
+        _vat_tables[id(country_codes)] = cached
+    return cached[1]
+
+
+def lookup_vat_decision(country_name, reverse_charge, country_codes, count_unmapped=True):
+    """Returns the VatDecision for a buyer country name, usually with a single dict lookup.
+
+    Names that are neither in country_codes nor in COUNTRY_ALIASES are matched after normalization.
+    Countries that still cannot be mapped get an empty country code and, with count_unmapped, are
+    logged and counted in UNMAPPED_COUNTRIES.
+    """
+    table = get_vat_table(country_codes)
+    key = (country_name, bool(reverse_charge))
+    decision = table.decisions.get(key)
+    if decision is None:
+        country_code = table.normalized.get(normalize_country_name(country_name), "")
+        decision = table.by_code[(country_code, bool(reverse_charge))]
+    if not decision.country_code and count_unmapped:
+        if not UNMAPPED_COUNTRIES[country_name]:
+            logging.warning("No country code found for '%s'", country_name)
+        UNMAPPED_COUNTRIES[country_name] += 1
+    return decision
+
+
+class Party(NamedTuple):
+    """Seller or buyer of an invoice."""
+    name: str
+    street: str
+    city: str
+    postal_code: str  # None if unknown
+    country_code: str
+    email: str = None
+    phone: str = None
+    vat_id: str = None
+    registration_name: str = None
+    company_id: str = None
+
+
+class InvoiceModel(NamedTuple):
+    """Everything an invoice shows, computed once and rendered as UBL and/or CII."""
+    invoice_number: str
+    type_code: str  # 380 = commercial invoice, 381 = corrected invoice
+    issue_date: object
+    due_date: object
+    order_info: str
+    seller: Party
+    buyer: Party
+    original_invoice_number: str  # Referenced by a cancellation, otherwise None
+    vat: VatDecision
+    net_amount: Decimal
+    tax_amount: Decimal
+    gross_amount: object  # The amount as passed in, negated for cancellations
+    quantity: str
+    price_amount: object
+    currency: str = "EUR"  # Document currency, the currency of all amounts above
+    tax_currency_amount: Decimal = None  # VAT in euro, if the document currency is another one
+    booked_amount: Decimal = None  # Gross amount in euro as booked, if the document currency is another one
+    exchange_rate: float = None
+
+
+# Invoice note (BT-22) of invoices in another currency with the booked euro amount, read by the upload
+BOOKED_AMOUNT_NOTE = "Gebuchter Betrag: {amount:.2f} EUR"
+
+
+# Formats an invoice can be rendered in, and the subfolder of the output folder they are written to.
+# CII files go to their own folder, so the UBL folder keeps one file per invoice for the upload.
+INVOICE_FORMATS = ("ubl", "cii")
+INVOICE_FORMAT_DIRS = {"ubl": "", "cii": "CII"}
+
+
+def _is_missing(value):
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _split_vat(amount, rate):
+    """Returns the VAT and the net amount contained in a gross amount."""
     #vat_amount = (Decimal(str(amount)) * vat_rate).quantize(Decimal("0.01"))
-    vat_amount = (Decimal(amount) * vat_rate) / (1 + vat_rate)
+    vat_amount = (Decimal(amount) * rate) / (1 + rate)
     vat_amount = vat_amount.quantize(Decimal("0.01"))
+    return vat_amount, Decimal(str(amount)) - vat_amount
+
+
+def build_invoice_model(invoice_number, order_info, amount, date, buyer, address_details, country_codes,
+                        is_cancellation=False, original_invoice_number=None, reverse_charge=False, buyer_vat_id="",
+                        currency="EUR", exchange_rate=None, currency_amount=None, count_unmapped=True):
+    """Computes VAT, totals, parties and references of an invoice.
 
-    netto_amount = Decimal(str(amount)) - vat_amount
+    amount is the gross amount in euro. For another currency, currency_amount is the gross amount
+    in that currency as it is on the statement, and exchange_rate its amount per euro: the invoice
+    shows the amounts in that currency and, as the tax currency, the VAT in euro. Without
+    currency_amount, the euro amount is converted with exchange_rate. count_unmapped=False leaves an
+    unmapped buyer country to whoever else computes the same invoice (see lookup_vat_decision).
+    """
+
+    # Determine VAT rate and note based on country code from the precomputed table
+    vat = lookup_vat_decision(address_details.get("Ship Country", ""), reverse_charge, country_codes,
+                              count_unmapped)
+
+    # Calculate VAT amount and total amount
+    vat_amount, netto_amount = _split_vat(amount, vat.rate)
+
+    tax_currency_amount = booked_amount = None
+    if currency != "EUR":
+        if currency_amount is None and not exchange_rate:
+            raise ValueError(f"Invoice {invoice_number} in {currency} needs its amount or the exchange rate to EUR")
+        # The VAT stays the one of the booked euro amount
+        tax_currency_amount = vat_amount
+        booked_amount = Decimal(str(amount)).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        if currency_amount is not None:
+            amount = float(currency_amount)
+        else:
+            amount = float((Decimal(str(amount)) * Decimal(str(exchange_rate))).quantize(Decimal("0.01"),
+                                                                                         ROUND_HALF_UP))
+        vat_amount, netto_amount = _split_vat(amount, vat.rate)
 
     # Negate amounts for cancellation invoices
     if is_cancellation:
         amount = -amount
         vat_amount = -vat_amount
         netto_amount = -netto_amount
+        if tax_currency_amount is not None:
+            tax_currency_amount = -tax_currency_amount
+            booked_amount = -booked_amount
+
+    seller = Party(SENDER_NAME, SENDER_STREET, SENDER_CITY, SENDER_POSTALCODE, SENDER_COUNTRY, SENDER_MAIL,
+                   SENDER_PHONE_NUMBER, SENDER_VAT_ID, SENDER_COMPANY_NAME, SENDER_HRA)
+    zipcode = address_details.get("Ship Zipcode")
+    buyer_party = Party(buyer, address_details.get("Street 1", ""), address_details.get("Ship City", ""),
+                        None if _is_missing(zipcode) else address_details.get("Ship Zipcode", ""),
+                        vat.country_code, email="no-email@domain",
+                        vat_id=buyer_vat_id if buyer_vat_id and not _is_missing(buyer_vat_id) else None)
+
+    return InvoiceModel(
+        invoice_number=invoice_number,
+        type_code="381" if is_cancellation else "380",
+        issue_date=date,
+        due_date=date + pd.DateOffset(days=14),
+        order_info=order_info,
+        seller=seller,
+        buyer=buyer_party,
+        original_invoice_number=original_invoice_number if is_cancellation and original_invoice_number else None,
+        vat=vat,
+        net_amount=netto_amount,
+        tax_amount=vat_amount,
+        gross_amount=amount,
+        quantity="-1" if is_cancellation else "1",
+        price_amount=abs(amount),
+        currency=currency,
+        tax_currency_amount=tax_currency_amount,
+        booked_amount=booked_amount,
+        exchange_rate=exchange_rate,
+    )
+
 
-    # Define namespaces
-    nsmap = {
-        None: "urn:oasis:names:specification:ubl:schema:xsd:Invoice-2",
-        "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
-        "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
-        "xsi": "http://www.w3.org/2001/XMLSchema-instance"
-    }
+class InvoiceSpec(NamedTuple):
+    """The data of one invoice, with the arguments of generate_xrechnung_lxml except the country codes."""
+    invoice_number: str
+    order_info: str
+    amount: object
+    date: object
+    buyer: str
+    address_details: dict
+    is_cancellation: bool = False
+    original_invoice_number: str = None
+    reverse_charge: bool = False
+    buyer_vat_id: str = ""
+    currency: str = "EUR"
+    exchange_rate: float = None
+    currency_amount: Decimal = None
+
+
+class InvoiceResult(NamedTuple):
+    """Outcome of one invoice in one format."""
+    invoice_number: str
+    format: str
+    path: str  # file written, None if output_dir is None or on error
+    xml: bytes  # serialized invoice if output_dir is None, otherwise None
+    error: str  # None on success
+
+
+def generate_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
+                            address_details, country_codes, is_cancellation=False,
+                            original_invoice_number=None, output_dir="Rechnungen", reverse_charge=False, buyer_vat_id="",
+                            formats=("ubl",), currency="EUR", exchange_rate=None, currency_amount=None):
+    """Generates an XRechnung XML file.
+
+    formats selects UBL and/or CII (see INVOICE_FORMATS). The invoice is computed once and rendered
+    in every format. currency, exchange_rate and currency_amount invoice in another currency (see
+    build_invoice_model). Returns the filename of the first format, or its XML bytes with
+    output_dir=None. For many invoices, use generate_xrechnungen.
+    """
+    spec = InvoiceSpec(invoice_number, order_info, amount, date, buyer, address_details, is_cancellation,
+                       original_invoice_number, reverse_charge, buyer_vat_id, currency, exchange_rate,
+                       currency_amount)
+    result = list(generate_xrechnungen([spec], country_codes, output_dir, formats=formats, raise_errors=True))[0]
+    if result.error:
+        raise ValueError(f"Could not generate XRechnung {invoice_number}: {result.error}")
+    return result.xml if result.path is None else os.path.basename(result.path)
+
+
+def _prepare_output_dirs(output_dir, formats):
+    """Creates the folders of all formats once and returns them by format."""
+    folders = {invoice_format: os.path.join(output_dir, INVOICE_FORMAT_DIRS[invoice_format])
+               for invoice_format in formats}
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    return folders
+
+
+def _save_xml(filepath, xml_bytes):
+    with open(filepath, "w", encoding="utf-8") as xml_file:
+        xml_file.write(xml_bytes.decode("utf-8"))
+
+
+def _generate_invoices(specs, country_codes, folders, formats, pretty, raise_errors):
+    """Computes, renders and writes (or returns) the invoices of specs, yielding an InvoiceResult each."""
+    for spec in specs:
+        try:
+            model = build_invoice_model(spec.invoice_number, spec.order_info, spec.amount, spec.date, spec.buyer,
+                                        spec.address_details, country_codes, spec.is_cancellation,
+                                        spec.original_invoice_number, spec.reverse_charge, spec.buyer_vat_id,
+                                        spec.currency, spec.exchange_rate, spec.currency_amount)
+            for invoice_format in formats:
+                xml_bytes = RENDERERS[invoice_format](model, pretty)
+                if folders is None:
+                    yield InvoiceResult(spec.invoice_number, invoice_format, None, xml_bytes, None)
+                else:
+                    filepath = os.path.join(folders[invoice_format], f"{spec.invoice_number}.xml")
+                    _save_xml(filepath, xml_bytes)
+                    yield InvoiceResult(spec.invoice_number, invoice_format, filepath, None, None)
+        except Exception as e:  # Reported in the result, so one bad invoice doesn't stop the batch
+            if raise_errors:
+                raise
+            logging.error("Could not generate XRechnung %s: %s", spec.invoice_number, e)
+            yield InvoiceResult(spec.invoice_number, None, None, None, f"{type(e).__name__}: {e}")
+
+
+# Settings of the batch in a worker process, set once by _init_batch_worker
+_batch_worker_state = {}
+
+
+def _init_batch_worker(country_codes, folders, formats, pretty):
+    _batch_worker_state.update(country_codes=country_codes, folders=folders, formats=formats, pretty=pretty)
+
+
+def _generate_chunk(specs):
+    state = _batch_worker_state
+    return list(_generate_invoices(specs, state["country_codes"], state["folders"], state["formats"],
+                                   state["pretty"], raise_errors=False))
+
+
+def generate_xrechnungen(specs, country_codes, output_dir="Rechnungen", pretty=True, workers=1, formats=("ubl",),
+                         chunk_size=200, raise_errors=False):
+    """Generates the XRechnungen of an iterable of InvoiceSpecs and yields an InvoiceResult per invoice and format.
+
+    The output folders, the VAT table and the namespaces are set up once for the whole batch.
+    With output_dir=None nothing is written and the results carry the XML bytes. pretty=False
+    writes compact XML without indentation. With workers > 1, chunks of chunk_size invoices are
+    rendered in worker processes; the results keep the order of specs either way, and at most
+    two chunks per worker are in flight, so specs can be a generator of any length.
+
+    An invoice that fails is reported with its error and the batch continues, unless raise_errors
+    is set (only in a single process).
+    """
+    folders = _prepare_output_dirs(output_dir, formats) if output_dir is not None else None
+    get_vat_table(country_codes)
+
+    if workers <= 1:
+        yield from _generate_invoices(specs, country_codes, folders, formats, pretty, raise_errors)
+        return
+
+    def chunks():
+        chunk = []
+        for spec in specs:
+            chunk.append(spec)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(country_codes, folders, formats, pretty)) as executor:
+        pending = deque()
+        for chunk in chunks():
+            pending.append(executor.submit(_generate_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_xrechnung(invoice_number, xml_bytes, output_dir="Rechnungen"):
+    """Saves a serialized XRechnung as <invoice_number>.xml and returns the filename."""
+
+    # Create Rechnungen folder if it doesn't exist
+    invoice_folder = output_dir
+    os.makedirs(invoice_folder, exist_ok=True)
+
+    invoice_filename = f"{invoice_number}.xml"
+    _save_xml(os.path.join(invoice_folder, invoice_filename), xml_bytes)
+
+    return invoice_filename
+
+
+def render_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
+                          address_details, country_codes, is_cancellation=False,
+                          original_invoice_number=None, reverse_charge=False, buyer_vat_id="", currency="EUR",
+                          exchange_rate=None, currency_amount=None):
+    """Builds an XRechnung (UBL) in memory and returns the serialized XML bytes."""
+    return render_ubl(build_invoice_model(invoice_number, order_info, amount, date, buyer, address_details,
+                                          country_codes, is_cancellation, original_invoice_number, reverse_charge,
+                                          buyer_vat_id, currency, exchange_rate, currency_amount))
+
+
+# Namespaces of the UBL and CII renderings, shared by all invoices
+UBL_NSMAP = {
+    None: "urn:oasis:names:specification:ubl:schema:xsd:Invoice-2",
+    "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
+    "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+    "xsi": "http://www.w3.org/2001/XMLSchema-instance"
+}
+CII_NSMAP = {
+    "rsm": "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100",
+    "ram": "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100",
+    "qdt": "urn:un:unece:uncefact:data:standard:QualifiedDataType:100",
+    "udt": "urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100",
+}
+
+
+def booked_amount_note(model):
+    """Returns the invoice note with the booked euro amount and the rate of an invoice in another currency."""
+    note = BOOKED_AMOUNT_NOTE.format(amount=model.booked_amount)
+    if model.exchange_rate:
+        note += f" (Kurs {model.exchange_rate} {model.currency} je EUR)"
+    return note
+
+
+def render_ubl(model, pretty=True):
+    """Renders an InvoiceModel as UBL 2.1 invoice and returns the serialized XML bytes."""
+    vat_rate, vat_category, vat_note, country_code = model.vat
+    seller, buyer = model.seller, model.buyer
+    nsmap = UBL_NSMAP
 
     # Create root element using QName and nsmap
     root = etree.Element(etree.QName(nsmap[None], "Invoice"), nsmap=nsmap)
@@ -150,70 +519,74 @@ def generate_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
     profile_id.text = "urn:fdc:peppol.eu:2017:poacc:billing:01:1.0"
 
     # Add invoice number
-    etree.SubElement(root, etree.QName(nsmap["cbc"], "ID")).text = invoice_number
+    etree.SubElement(root, etree.QName(nsmap["cbc"], "ID")).text = model.invoice_number
 
     # Add issue date
-    etree.SubElement(root, etree.QName(nsmap["cbc"], "IssueDate")).text = date.strftime("%Y-%m-%d")
+    etree.SubElement(root, etree.QName(nsmap["cbc"], "IssueDate")).text = model.issue_date.strftime("%Y-%m-%d")
 
     # Add due date
-    due_date = date + pd.DateOffset(days=14)
-    etree.SubElement(root, etree.QName(nsmap["cbc"], "DueDate")).text = due_date.strftime("%Y-%m-%d")
+    etree.SubElement(root, etree.QName(nsmap["cbc"], "DueDate")).text = model.due_date.strftime("%Y-%m-%d")
 
     # Add invoice type code (380 = commercial invoice, 381 = corrected invoice)
-    if is_cancellation:
-        etree.SubElement(root, etree.QName(nsmap["cbc"], "InvoiceTypeCode")).text = "381"
-    else:
-        etree.SubElement(root, etree.QName(nsmap["cbc"], "InvoiceTypeCode")).text = "380"
+    etree.SubElement(root, etree.QName(nsmap["cbc"], "InvoiceTypeCode")).text = model.type_code
+
+    # Invoices in another currency note the booked euro amount
+    if model.booked_amount is not None:
+        etree.SubElement(root, etree.QName(nsmap["cbc"], "Note")).text = booked_amount_note(model)
 
     # Add document currency code
-    etree.SubElement(root, etree.QName(nsmap["cbc"], "DocumentCurrencyCode")).text = "EUR"
+    etree.SubElement(root, etree.QName(nsmap["cbc"], "DocumentCurrencyCode")).text = model.currency
+
+    # The VAT is also stated in euro for invoices in another currency (BT-6)
+    if model.tax_currency_amount is not None:
+        etree.SubElement(root, etree.QName(nsmap["cbc"], "TaxCurrencyCode")).text = "EUR"
 
     # B2C keine Leitweg ID
     etree.SubElement(root, etree.QName(nsmap["cbc"], "BuyerReference")).text = "Keine Referenz"
 
     # Add Billing Reference
-    if is_cancellation and original_invoice_number:
+    if model.original_invoice_number:
         billing_reference = etree.SubElement(root, etree.QName(nsmap["cac"], "BillingReference"))
         invoice_document_reference = etree.SubElement(billing_reference,
                                                        etree.QName(nsmap["cac"], "InvoiceDocumentReference"))
-        etree.SubElement(invoice_document_reference, etree.QName(nsmap["cbc"], "ID")).text = original_invoice_number
+        etree.SubElement(invoice_document_reference, etree.QName(nsmap["cbc"], "ID")).text = model.original_invoice_number
 
     # Add AccountingSupplierParty
     supplier_party = etree.SubElement(root, etree.QName(nsmap["cac"], "AccountingSupplierParty"))
     party = etree.SubElement(supplier_party, etree.QName(nsmap["cac"], "Party"))
 
     # Add seller Email (PEPPOL-EN16931-R020)
-    etree.SubElement(party, etree.QName(nsmap["cbc"], "EndpointID"), attrib={"schemeID": "EM"}).text = SENDER_MAIL
+    etree.SubElement(party, etree.QName(nsmap["cbc"], "EndpointID"), attrib={"schemeID": "EM"}).text = seller.email
 
     # Add seller name
     party_name = etree.SubElement(party, etree.QName(nsmap["cac"], "PartyName"))
-    etree.SubElement(party_name, etree.QName(nsmap["cbc"], "Name")).text = SENDER_NAME
+    etree.SubElement(party_name, etree.QName(nsmap["cbc"], "Name")).text = seller.name
 
     # Add seller postal address
     postal_address = etree.SubElement(party, etree.QName(nsmap["cac"], "PostalAddress"))
-    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "StreetName")).text = SENDER_STREET
-    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "CityName")).text = SENDER_CITY
-    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "PostalZone")).text = SENDER_POSTALCODE
+    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "StreetName")).text = seller.street
+    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "CityName")).text = seller.city
+    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "PostalZone")).text = seller.postal_code
     country = etree.SubElement(postal_address, etree.QName(nsmap["cac"], "Country"))
-    etree.SubElement(country, etree.QName(nsmap["cbc"], "IdentificationCode")).text = SENDER_COUNTRY
+    etree.SubElement(country, etree.QName(nsmap["cbc"], "IdentificationCode")).text = seller.country_code
 
     # Add seller tax scheme
     party_tax_scheme = etree.SubElement(party, etree.QName(nsmap["cac"], "PartyTaxScheme"))
-    etree.SubElement(party_tax_scheme, etree.QName(nsmap["cbc"], "CompanyID")).text = SENDER_VAT_ID
+    etree.SubElement(party_tax_scheme, etree.QName(nsmap["cbc"], "CompanyID")).text = seller.vat_id
     tax_scheme = etree.SubElement(party_tax_scheme, etree.QName(nsmap["cac"], "TaxScheme"))
     etree.SubElement(tax_scheme, etree.QName(nsmap["cbc"], "ID")).text = "VAT"
 
     # Add seller legal entity
     legal_entity = etree.SubElement(party, etree.QName(nsmap["cac"], "PartyLegalEntity"))
-    etree.SubElement(legal_entity, etree.QName(nsmap["cbc"], "RegistrationName")).text = SENDER_COMPANY_NAME
+    etree.SubElement(legal_entity, etree.QName(nsmap["cbc"], "RegistrationName")).text = seller.registration_name
     # etree.SubElement(legal_entity, etree.QName(nsmap["cbc"], "CompanyID"), attrib={"schemeID": "0201"}).text = SENDER_HRA
-    etree.SubElement(legal_entity, etree.QName(nsmap["cbc"], "CompanyID")).text = SENDER_HRA
+    etree.SubElement(legal_entity, etree.QName(nsmap["cbc"], "CompanyID")).text = seller.company_id
 
     # Add seller contact
     contact = etree.SubElement(party, etree.QName(nsmap["cac"], "Contact"))
-    etree.SubElement(contact, etree.QName(nsmap["cbc"], "Name")).text = SENDER_NAME
-    etree.SubElement(contact, etree.QName(nsmap["cbc"], "Telephone")).text = SENDER_PHONE_NUMBER
-    etree.SubElement(contact, etree.QName(nsmap["cbc"], "ElectronicMail")).text = SENDER_MAIL
+    etree.SubElement(contact, etree.QName(nsmap["cbc"], "Name")).text = seller.name
+    etree.SubElement(contact, etree.QName(nsmap["cbc"], "Telephone")).text = seller.phone
+    etree.SubElement(contact, etree.QName(nsmap["cbc"], "ElectronicMail")).text = seller.email
 
     # Add AccountingCustomerParty
     customer_party = etree.SubElement(root, etree.QName(nsmap["cac"], "AccountingCustomerParty"))
@@ -221,39 +594,35 @@ def generate_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
 
     # Lieferdatum hinzufügen
     delivery = etree.SubElement(root, etree.QName(nsmap["cac"], "Delivery"))
-    etree.SubElement(delivery, etree.QName(nsmap["cbc"], "ActualDeliveryDate")).text = date.strftime("%Y-%m-%d")
+    etree.SubElement(delivery, etree.QName(nsmap["cbc"], "ActualDeliveryDate")).text = model.issue_date.strftime("%Y-%m-%d")
 
     # Lieferanschrift hinzufügen (DeliveryLocation + Address)
     delivery_location = etree.SubElement(delivery, etree.QName(nsmap["cac"], "DeliveryLocation"))
     address = etree.SubElement(delivery_location, etree.QName(nsmap["cac"], "Address"))
-    etree.SubElement(address, etree.QName(nsmap["cbc"], "StreetName")).text = address_details.get("Street 1", "")
-    etree.SubElement(address, etree.QName(nsmap["cbc"], "CityName")).text = address_details.get("Ship City", "")
-    zipcode = address_details.get("Ship Zipcode")
-    if not (isinstance(zipcode, float) and math.isnan(zipcode)):
-        etree.SubElement(address, etree.QName(nsmap["cbc"], "PostalZone")).text = address_details.get("Ship Zipcode", "")
+    etree.SubElement(address, etree.QName(nsmap["cbc"], "StreetName")).text = buyer.street
+    etree.SubElement(address, etree.QName(nsmap["cbc"], "CityName")).text = buyer.city
+    if buyer.postal_code is not None:
+        etree.SubElement(address, etree.QName(nsmap["cbc"], "PostalZone")).text = buyer.postal_code
     country = etree.SubElement(address, etree.QName(nsmap["cac"], "Country"))
-    etree.SubElement(country, etree.QName(nsmap["cbc"], "IdentificationCode")).text = get_country_code(
-        address_details.get("Ship Country", ""), country_codes)
+    etree.SubElement(country, etree.QName(nsmap["cbc"], "IdentificationCode")).text = country_code
 
     # Add Buyer Email (PEPPOL-EN16931-R020) - Since we not have we write no-mail@etsy.com
     # NO Buyer Email
-    etree.SubElement(party, etree.QName(nsmap["cbc"], "EndpointID"), attrib={"schemeID": "EM"}).text = "no-email@domain"
+    etree.SubElement(party, etree.QName(nsmap["cbc"], "EndpointID"), attrib={"schemeID": "EM"}).text = buyer.email
 
     # Add buyer postal address
     postal_address = etree.SubElement(party, etree.QName(nsmap["cac"], "PostalAddress"))
-    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "StreetName")).text = address_details.get("Street 1", "")
+    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "StreetName")).text = buyer.street
     
     #street2 = address_details.get("Street 2")
     #if not (isinstance(street2, float) and math.isnan(street2)):
     #    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "AdditionalStreetName")).text = street2
-    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "CityName")).text = address_details.get("Ship City", "")
+    etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "CityName")).text = buyer.city
 
-    zipcode = address_details.get("Ship Zipcode")
-    if not (isinstance(zipcode, float) and math.isnan(zipcode)):
-        etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "PostalZone")).text = address_details.get("Ship Zipcode", "")
+    if buyer.postal_code is not None:
+        etree.SubElement(postal_address, etree.QName(nsmap["cbc"], "PostalZone")).text = buyer.postal_code
     country = etree.SubElement(postal_address, etree.QName(nsmap["cac"], "Country"))
-    etree.SubElement(country, etree.QName(nsmap["cbc"], "IdentificationCode")).text = get_country_code(
-        address_details.get("Ship Country", ""), country_codes)
+    etree.SubElement(country, etree.QName(nsmap["cbc"], "IdentificationCode")).text = country_code
 
     # Add VAT ID Buyer if defined
     #if (buyer_vat_id!=""):
@@ -261,16 +630,16 @@ def generate_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
           #etree.SubElement(party_tax_scheme2, etree.QName(nsmap["cbc"], "CompanyID")).text = buyer_vat_id
           #etree.SubElement(party_tax_scheme2, etree.QName(nsmap["cbc"], "ID")).text = "VAT"
     # Add buyer tax scheme
-    if buyer_vat_id and not (isinstance(buyer_vat_id, float) and math.isnan(buyer_vat_id)):
+    if buyer.vat_id:
         party_tax_scheme = etree.SubElement(party, etree.QName(nsmap["cac"], "PartyTaxScheme"))
-        etree.SubElement(party_tax_scheme, etree.QName(nsmap["cbc"], "CompanyID")).text = buyer_vat_id
+        etree.SubElement(party_tax_scheme, etree.QName(nsmap["cbc"], "CompanyID")).text = buyer.vat_id
         tax_scheme = etree.SubElement(party_tax_scheme, etree.QName(nsmap["cac"], "TaxScheme"))
         etree.SubElement(tax_scheme, etree.QName(nsmap["cbc"], "ID")).text = "VAT"
 
 
     # Add buyer legal entity
     legal_entity = etree.SubElement(party, etree.QName(nsmap["cac"], "PartyLegalEntity"))
-    etree.SubElement(legal_entity, etree.QName(nsmap["cbc"], "RegistrationName")).text = buyer
+    etree.SubElement(legal_entity, etree.QName(nsmap["cbc"], "RegistrationName")).text = buyer.name
 
     # Add payment means (42 = Payment into an account)
     # Etsy pays to my Bank Account, that's why 42 is correct
@@ -279,13 +648,13 @@ def generate_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
 
     # Add tax total
     tax_total = etree.SubElement(root, etree.QName(nsmap["cac"], "TaxTotal"))
-    etree.SubElement(tax_total, etree.QName(nsmap["cbc"], "TaxAmount"), attrib={"currencyID": "EUR"}).text = f"{vat_amount:.2f}"
+    etree.SubElement(tax_total, etree.QName(nsmap["cbc"], "TaxAmount"), attrib={"currencyID": model.currency}).text = f"{model.tax_amount:.2f}"
 
     tax_subtotal = etree.SubElement(tax_total, etree.QName(nsmap["cac"], "TaxSubtotal"))
     etree.SubElement(tax_subtotal, etree.QName(nsmap["cbc"], "TaxableAmount"),
-                     attrib={"currencyID": "EUR"}).text = f"{netto_amount:.2f}"
+                     attrib={"currencyID": model.currency}).text = f"{model.net_amount:.2f}"
     etree.SubElement(tax_subtotal, etree.QName(nsmap["cbc"], "TaxAmount"),
-                     attrib={"currencyID": "EUR"}).text = f"{vat_amount:.2f}"
+                     attrib={"currencyID": model.currency}).text = f"{model.tax_amount:.2f}"
     tax_category = etree.SubElement(tax_subtotal, etree.QName(nsmap["cac"], "TaxCategory"))
     etree.SubElement(tax_category, etree.QName(nsmap["cbc"], "ID")).text = vat_category
     etree.SubElement(tax_category, etree.QName(nsmap["cbc"], "Percent")).text = f"{vat_rate * 100:.2f}"
@@ -297,26 +666,32 @@ def generate_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
     tax_scheme = etree.SubElement(tax_category, etree.QName(nsmap["cac"], "TaxScheme"))
     etree.SubElement(tax_scheme, etree.QName(nsmap["cbc"], "ID")).text = "VAT"
 
+    # Add the VAT in euro, without subtotals (BR-53)
+    if model.tax_currency_amount is not None:
+        tax_total = etree.SubElement(root, etree.QName(nsmap["cac"], "TaxTotal"))
+        etree.SubElement(tax_total, etree.QName(nsmap["cbc"], "TaxAmount"),
+                         attrib={"currencyID": "EUR"}).text = f"{model.tax_currency_amount:.2f}"
+
     # Add legal monetary total
     legal_monetary_total = etree.SubElement(root, etree.QName(nsmap["cac"], "LegalMonetaryTotal"))
     etree.SubElement(legal_monetary_total, etree.QName(nsmap["cbc"], "LineExtensionAmount"),
-                     attrib={"currencyID": "EUR"}).text = f"{netto_amount:.2f}"
+                     attrib={"currencyID": model.currency}).text = f"{model.net_amount:.2f}"
     etree.SubElement(legal_monetary_total, etree.QName(nsmap["cbc"], "TaxExclusiveAmount"),
-                     attrib={"currencyID": "EUR"}).text = f"{netto_amount:.2f}"
+                     attrib={"currencyID": model.currency}).text = f"{model.net_amount:.2f}"
     etree.SubElement(legal_monetary_total, etree.QName(nsmap["cbc"], "TaxInclusiveAmount"),
-                     attrib={"currencyID": "EUR"}).text = f"{amount:.2f}"
+                     attrib={"currencyID": model.currency}).text = f"{model.gross_amount:.2f}"
     etree.SubElement(legal_monetary_total, etree.QName(nsmap["cbc"], "PayableAmount"),
-                     attrib={"currencyID": "EUR"}).text = f"{amount:.2f}"
+                     attrib={"currencyID": model.currency}).text = f"{model.gross_amount:.2f}"
 
     # Add invoice line
     invoice_line = etree.SubElement(root, etree.QName(nsmap["cac"], "InvoiceLine"))
     etree.SubElement(invoice_line, etree.QName(nsmap["cbc"], "ID")).text = "1"
     etree.SubElement(invoice_line, etree.QName(nsmap["cbc"], "InvoicedQuantity"),
-                     attrib={"unitCode": "C62"}).text = "1" if not is_cancellation else "-1"
+                     attrib={"unitCode": "C62"}).text = model.quantity
     etree.SubElement(invoice_line, etree.QName(nsmap["cbc"], "LineExtensionAmount"),
-                     attrib={"currencyID": "EUR"}).text = f"{netto_amount:.2f}"
+                     attrib={"currencyID": model.currency}).text = f"{model.net_amount:.2f}"
     item = etree.SubElement(invoice_line, etree.QName(nsmap["cac"], "Item"))
-    etree.SubElement(item, etree.QName(nsmap["cbc"], "Description")).text = order_info
+    etree.SubElement(item, etree.QName(nsmap["cbc"], "Description")).text = model.order_info
     etree.SubElement(item, etree.QName(nsmap["cbc"], "Name")).text = "Bestellung"
     classified_tax_category = etree.SubElement(item, etree.QName(nsmap["cac"], "ClassifiedTaxCategory"))
     etree.SubElement(classified_tax_category, etree.QName(nsmap["cbc"], "ID")).text = vat_category
@@ -325,17 +700,147 @@ def generate_xrechnung_lxml(invoice_number, order_info, amount, date, buyer,
     etree.SubElement(tax_scheme, etree.QName(nsmap["cbc"], "ID")).text = "VAT"
     price = etree.SubElement(invoice_line, etree.QName(nsmap["cac"], "Price"))
     etree.SubElement(price, etree.QName(nsmap["cbc"], "PriceAmount"),
-                     attrib={"currencyID": "EUR"}).text = "{:.2f}".format(abs(amount))
+                     attrib={"currencyID": model.currency}).text = "{:.2f}".format(model.price_amount)
 
     # Serialize to XML
-    xml_string = etree.tostring(root, pretty_print=True, encoding="UTF-8", xml_declaration=True).decode("utf-8")
-
-    # Save the XRechnung XML
-    invoice_filename = f"{invoice_number}.xml"
-    invoice_filepath = os.path.join(invoice_folder, invoice_filename)
-    with open(invoice_filepath, "w", encoding="utf-8") as xml_file:
-        xml_file.write(xml_string)
-
-    return invoice_filename
-
-    #logging.info("Generated XRechnung: %s", invoice_filename)
+    return etree.tostring(root, pretty_print=pretty, encoding="UTF-8", xml_declaration=True)
+
+
+def _cii_date(parent, tag, value, nsmap):
+    date_time = etree.SubElement(parent, etree.QName(nsmap["ram"], tag))
+    etree.SubElement(date_time, etree.QName(nsmap["udt"], "DateTimeString"), attrib={"format": "102"}).text = \
+        value.strftime("%Y%m%d")
+
+
+def _cii_address(parent, party, nsmap):
+    address = etree.SubElement(parent, etree.QName(nsmap["ram"], "PostalTradeAddress"))
+    if party.postal_code is not None:
+        etree.SubElement(address, etree.QName(nsmap["ram"], "PostcodeCode")).text = party.postal_code
+    etree.SubElement(address, etree.QName(nsmap["ram"], "LineOne")).text = party.street
+    etree.SubElement(address, etree.QName(nsmap["ram"], "CityName")).text = party.city
+    etree.SubElement(address, etree.QName(nsmap["ram"], "CountryID")).text = party.country_code
+
+
+def _cii_trade_tax(parent, model, nsmap, with_amounts):
+    vat_rate, vat_category, vat_note, _ = model.vat
+    trade_tax = etree.SubElement(parent, etree.QName(nsmap["ram"], "ApplicableTradeTax"))
+    if with_amounts:
+        etree.SubElement(trade_tax, etree.QName(nsmap["ram"], "CalculatedAmount")).text = f"{model.tax_amount:.2f}"
+    etree.SubElement(trade_tax, etree.QName(nsmap["ram"], "TypeCode")).text = "VAT"
+    if with_amounts:
+        # Same rule as in the UBL rendering: exemption reason for 0 % rates except for exports
+        if vat_rate == 0 and vat_category != "Z":
+            etree.SubElement(trade_tax, etree.QName(nsmap["ram"], "ExemptionReason")).text = vat_note
+        etree.SubElement(trade_tax, etree.QName(nsmap["ram"], "BasisAmount")).text = f"{model.net_amount:.2f}"
+    etree.SubElement(trade_tax, etree.QName(nsmap["ram"], "CategoryCode")).text = vat_category
+    etree.SubElement(trade_tax, etree.QName(nsmap["ram"], "RateApplicablePercent")).text = f"{vat_rate * 100:.2f}"
+
+
+def render_cii(model, pretty=True):
+    """Renders an InvoiceModel as UN/CEFACT CII invoice (ZUGFeRD/Factur-X, EN 16931) and returns the XML bytes."""
+    nsmap = CII_NSMAP
+    ram = nsmap["ram"]
+    seller, buyer = model.seller, model.buyer
+
+    root = etree.Element(etree.QName(nsmap["rsm"], "CrossIndustryInvoice"), nsmap=nsmap)
+
+    # Same specification and process identifiers as the UBL rendering
+    context = etree.SubElement(root, etree.QName(nsmap["rsm"], "ExchangedDocumentContext"))
+    process = etree.SubElement(context, etree.QName(ram, "BusinessProcessSpecifiedDocumentContextParameter"))
+    etree.SubElement(process, etree.QName(ram, "ID")).text = "urn:fdc:peppol.eu:2017:poacc:billing:01:1.0"
+    guideline = etree.SubElement(context, etree.QName(ram, "GuidelineSpecifiedDocumentContextParameter"))
+    etree.SubElement(guideline, etree.QName(ram, "ID")).text = \
+        "urn:cen.eu:en16931:2017#compliant#urn:xeinkauf.de:kosit:xrechnung_3.0"
+
+    document = etree.SubElement(root, etree.QName(nsmap["rsm"], "ExchangedDocument"))
+    etree.SubElement(document, etree.QName(ram, "ID")).text = model.invoice_number
+    etree.SubElement(document, etree.QName(ram, "TypeCode")).text = model.type_code
+    _cii_date(document, "IssueDateTime", model.issue_date, nsmap)
+    if model.booked_amount is not None:
+        note = etree.SubElement(document, etree.QName(ram, "IncludedNote"))
+        etree.SubElement(note, etree.QName(ram, "Content")).text = booked_amount_note(model)
+
+    transaction = etree.SubElement(root, etree.QName(nsmap["rsm"], "SupplyChainTradeTransaction"))
+
+    # Invoice line
+    line = etree.SubElement(transaction, etree.QName(ram, "IncludedSupplyChainTradeLineItem"))
+    line_document = etree.SubElement(line, etree.QName(ram, "AssociatedDocumentLineDocument"))
+    etree.SubElement(line_document, etree.QName(ram, "LineID")).text = "1"
+    product = etree.SubElement(line, etree.QName(ram, "SpecifiedTradeProduct"))
+    etree.SubElement(product, etree.QName(ram, "Name")).text = "Bestellung"
+    etree.SubElement(product, etree.QName(ram, "Description")).text = model.order_info
+    line_agreement = etree.SubElement(line, etree.QName(ram, "SpecifiedLineTradeAgreement"))
+    net_price = etree.SubElement(line_agreement, etree.QName(ram, "NetPriceProductTradePrice"))
+    etree.SubElement(net_price, etree.QName(ram, "ChargeAmount")).text = "{:.2f}".format(model.price_amount)
+    line_delivery = etree.SubElement(line, etree.QName(ram, "SpecifiedLineTradeDelivery"))
+    etree.SubElement(line_delivery, etree.QName(ram, "BilledQuantity"), attrib={"unitCode": "C62"}).text = \
+        model.quantity
+    line_settlement = etree.SubElement(line, etree.QName(ram, "SpecifiedLineTradeSettlement"))
+    _cii_trade_tax(line_settlement, model, nsmap, with_amounts=False)
+    line_summation = etree.SubElement(line_settlement, etree.QName(ram, "SpecifiedTradeSettlementLineMonetarySummation"))
+    etree.SubElement(line_summation, etree.QName(ram, "LineTotalAmount")).text = f"{model.net_amount:.2f}"
+
+    # Seller and buyer
+    agreement = etree.SubElement(transaction, etree.QName(ram, "ApplicableHeaderTradeAgreement"))
+    etree.SubElement(agreement, etree.QName(ram, "BuyerReference")).text = "Keine Referenz"
+    seller_party = etree.SubElement(agreement, etree.QName(ram, "SellerTradeParty"))
+    etree.SubElement(seller_party, etree.QName(ram, "Name")).text = seller.registration_name
+    legal_organization = etree.SubElement(seller_party, etree.QName(ram, "SpecifiedLegalOrganization"))
+    etree.SubElement(legal_organization, etree.QName(ram, "ID")).text = seller.company_id
+    contact = etree.SubElement(seller_party, etree.QName(ram, "DefinedTradeContact"))
+    etree.SubElement(contact, etree.QName(ram, "PersonName")).text = seller.name
+    telephone = etree.SubElement(contact, etree.QName(ram, "TelephoneUniversalCommunication"))
+    etree.SubElement(telephone, etree.QName(ram, "CompleteNumber")).text = seller.phone
+    email = etree.SubElement(contact, etree.QName(ram, "EmailURIUniversalCommunication"))
+    etree.SubElement(email, etree.QName(ram, "URIID")).text = seller.email
+    _cii_address(seller_party, seller, nsmap)
+    endpoint = etree.SubElement(seller_party, etree.QName(ram, "URIUniversalCommunication"))
+    etree.SubElement(endpoint, etree.QName(ram, "URIID"), attrib={"schemeID": "EM"}).text = seller.email
+    tax_registration = etree.SubElement(seller_party, etree.QName(ram, "SpecifiedTaxRegistration"))
+    etree.SubElement(tax_registration, etree.QName(ram, "ID"), attrib={"schemeID": "VA"}).text = seller.vat_id
+
+    buyer_party = etree.SubElement(agreement, etree.QName(ram, "BuyerTradeParty"))
+    etree.SubElement(buyer_party, etree.QName(ram, "Name")).text = buyer.name
+    _cii_address(buyer_party, buyer, nsmap)
+    endpoint = etree.SubElement(buyer_party, etree.QName(ram, "URIUniversalCommunication"))
+    etree.SubElement(endpoint, etree.QName(ram, "URIID"), attrib={"schemeID": "EM"}).text = buyer.email
+    if buyer.vat_id:
+        tax_registration = etree.SubElement(buyer_party, etree.QName(ram, "SpecifiedTaxRegistration"))
+        etree.SubElement(tax_registration, etree.QName(ram, "ID"), attrib={"schemeID": "VA"}).text = buyer.vat_id
+
+    # Delivery to the buyer address on the invoice date
+    delivery = etree.SubElement(transaction, etree.QName(ram, "ApplicableHeaderTradeDelivery"))
+    ship_to = etree.SubElement(delivery, etree.QName(ram, "ShipToTradeParty"))
+    _cii_address(ship_to, buyer, nsmap)
+    delivery_event = etree.SubElement(delivery, etree.QName(ram, "ActualDeliverySupplyChainEvent"))
+    _cii_date(delivery_event, "OccurrenceDateTime", model.issue_date, nsmap)
+
+    # Payment, tax and totals
+    settlement = etree.SubElement(transaction, etree.QName(ram, "ApplicableHeaderTradeSettlement"))
+    if model.tax_currency_amount is not None:
+        etree.SubElement(settlement, etree.QName(ram, "TaxCurrencyCode")).text = "EUR"
+    etree.SubElement(settlement, etree.QName(ram, "InvoiceCurrencyCode")).text = model.currency
+    payment_means = etree.SubElement(settlement, etree.QName(ram, "SpecifiedTradeSettlementPaymentMeans"))
+    etree.SubElement(payment_means, etree.QName(ram, "TypeCode")).text = "42"
+    _cii_trade_tax(settlement, model, nsmap, with_amounts=True)
+    payment_terms = etree.SubElement(settlement, etree.QName(ram, "SpecifiedTradePaymentTerms"))
+    _cii_date(payment_terms, "DueDateDateTime", model.due_date, nsmap)
+    summation = etree.SubElement(settlement, etree.QName(ram, "SpecifiedTradeSettlementHeaderMonetarySummation"))
+    etree.SubElement(summation, etree.QName(ram, "LineTotalAmount")).text = f"{model.net_amount:.2f}"
+    etree.SubElement(summation, etree.QName(ram, "TaxBasisTotalAmount")).text = f"{model.net_amount:.2f}"
+    etree.SubElement(summation, etree.QName(ram, "TaxTotalAmount"), attrib={"currencyID": model.currency}).text = \
+        f"{model.tax_amount:.2f}"
+    if model.tax_currency_amount is not None:
+        etree.SubElement(summation, etree.QName(ram, "TaxTotalAmount"), attrib={"currencyID": "EUR"}).text = \
+            f"{model.tax_currency_amount:.2f}"
+    etree.SubElement(summation, etree.QName(ram, "GrandTotalAmount")).text = f"{model.gross_amount:.2f}"
+    etree.SubElement(summation, etree.QName(ram, "DuePayableAmount")).text = f"{model.gross_amount:.2f}"
+    if model.original_invoice_number:
+        referenced_document = etree.SubElement(settlement, etree.QName(ram, "InvoiceReferencedDocument"))
+        etree.SubElement(referenced_document, etree.QName(ram, "IssuerAssignedID")).text = \
+            model.original_invoice_number
+
+    return etree.tostring(root, pretty_print=pretty, encoding="UTF-8", xml_declaration=True)
+
+
+RENDERERS = {"ubl": render_ubl, "cii": render_cii}
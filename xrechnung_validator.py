@@ -0,0 +1,158 @@
+# xrechnung_validator.py
+import os
+import logging
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
+from lxml import isoschematron
+from dotenv import load_dotenv
+from xrechnung_generator import build_invoice_model, render_ubl, write_xrechnung, RENDERERS, INVOICE_FORMAT_DIRS
+
+load_dotenv()
+
+# UBL 2.1 schema, e.g. unpacked from http://docs.oasis-open.org/ubl/os-UBL-2.1/UBL-2.1.zip into schemas/UBL-2.1
+UBL_XSD_PATH = os.getenv("XRECHNUNG_XSD_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "schemas", "UBL-2.1", "xsd", "maindoc", "UBL-Invoice-2.1.xsd"))
+# Optional XRechnung Schematron rules (.sch). lxml can only compile XSLT 1.0 based Schematron.
+XRECHNUNG_SCHEMATRON_PATH = os.getenv("XRECHNUNG_SCHEMATRON_PATH")
+
+# Below this many invoices the process pool costs more than it saves
+PARALLEL_THRESHOLD = 200
+
+
+class ValidationSetupError(Exception):
+    """Raised when the validation schema cannot be loaded."""
+
+
+@functools.lru_cache(maxsize=None)
+def get_validators(xsd_path=UBL_XSD_PATH, schematron_path=XRECHNUNG_SCHEMATRON_PATH):
+    """Compiles the XSD and Schematron validators once per process and caches them."""
+    try:
+        schema = etree.XMLSchema(etree.parse(xsd_path))
+    except (OSError, etree.XMLSchemaParseError, etree.XMLSyntaxError) as e:
+        raise ValidationSetupError(f"Could not load UBL schema from {xsd_path}: {e}") from e
+
+    schematron = None
+    if schematron_path:
+        try:
+            schematron = isoschematron.Schematron(etree.parse(schematron_path), store_report=True)
+        except (OSError, etree.LxmlError) as e:
+            logging.warning("Schematron rules %s could not be compiled, only the XSD is checked: %s",
+                            schematron_path, e)
+    return schema, schematron
+
+
+def validate_xrechnung(xml_bytes, xsd_path=UBL_XSD_PATH, schematron_path=XRECHNUNG_SCHEMATRON_PATH):
+    """Validates one serialized XRechnung and returns a list of error messages (empty if valid)."""
+    schema, schematron = get_validators(xsd_path, schematron_path)
+    try:
+        document = etree.fromstring(xml_bytes)
+    except etree.XMLSyntaxError as e:
+        return [f"XML syntax error: {e}"]
+
+    errors = []
+    if not schema.validate(document):
+        errors.extend(f"line {error.line}: {error.message}" for error in schema.error_log)
+    if schematron is not None and not schematron.validate(document):
+        for failed in schematron.validation_report.getroot().iter("{http://purl.oclc.org/dsdl/svrl}failed-assert"):
+            message = "".join(failed.itertext()).strip()
+            errors.append(f"{failed.get('location')}: {message}")
+    return errors
+
+
+def _validate_item(item, xsd_path, schematron_path):
+    invoice_number, xml_bytes = item
+    return invoice_number, validate_xrechnung(xml_bytes, xsd_path, schematron_path)
+
+
+def _init_worker(xsd_path, schematron_path):
+    """Compiles the validators once when a worker process starts."""
+    get_validators(xsd_path, schematron_path)
+
+
+def validate_xrechnungen(invoices, max_workers=None, xsd_path=UBL_XSD_PATH,
+                         schematron_path=XRECHNUNG_SCHEMATRON_PATH, parallel_threshold=PARALLEL_THRESHOLD):
+    """Validates a batch of (invoice_number, xml_bytes) pairs in memory.
+
+    Large batches are spread over worker processes. Returns a dict with the error messages of every
+    invoice that failed, valid invoices are not included.
+    """
+    invoices = list(invoices)
+    validate = functools.partial(_validate_item, xsd_path=xsd_path, schematron_path=schematron_path)
+
+    if len(invoices) < parallel_threshold or max_workers == 1:
+        get_validators(xsd_path, schematron_path)
+        results = map(validate, invoices)
+        return {number: errors for number, errors in results if errors}
+
+    chunksize = max(1, len(invoices) // ((max_workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(xsd_path, schematron_path)) as executor:
+        results = executor.map(validate, invoices, chunksize=chunksize)
+        return {number: errors for number, errors in results if errors}
+
+
+def format_validation_report(failures, total):
+    """Formats the validation result as a human readable summary."""
+    lines = [f"XRechnung validation: {total - len(failures)} of {total} invoices valid, {len(failures)} failed"]
+    for invoice_number in sorted(failures):
+        lines.append(f"{invoice_number}:")
+        lines.extend(f"  {error}" for error in failures[invoice_number])
+    return "\n".join(lines)
+
+
+class ValidatingInvoiceWriter:
+    """Drop-in replacement for generate_xrechnung_lxml that validates invoices before writing them.
+
+    Invoices are rendered in memory and buffered. Every batch_size invoices, and on flush(), the
+    buffer is validated as one batch and written to output_dir. Invalid invoices are still written,
+    so the XML files stay in line with the Lexoffice CSV, and are listed in the report.
+
+    Only the UBL rendering is validated against the UBL schema, other formats are written right away.
+    """
+
+    def __init__(self, output_dir="Rechnungen", batch_size=1000, max_workers=None,
+                 xsd_path=UBL_XSD_PATH, schematron_path=XRECHNUNG_SCHEMATRON_PATH, formats=("ubl",)):
+        self.output_dir = output_dir
+        self.formats = formats
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.xsd_path = xsd_path
+        self.schematron_path = schematron_path
+        self.pending = []
+        self.failures = {}
+        self.total = 0
+        # Fail early if the schema is missing, before any row is processed
+        get_validators(xsd_path, schematron_path)
+
+    def __call__(self, invoice_number, order_info, amount, date, buyer, address_details, country_codes,
+                 is_cancellation=False, original_invoice_number=None, reverse_charge=False, buyer_vat_id="",
+                 currency="EUR", exchange_rate=None, currency_amount=None):
+        model = build_invoice_model(invoice_number, order_info, amount, date, buyer, address_details, country_codes,
+                                    is_cancellation, original_invoice_number, reverse_charge, buyer_vat_id,
+                                    currency, exchange_rate, currency_amount)
+        for invoice_format in self.formats:
+            if invoice_format != "ubl":
+                write_xrechnung(invoice_number, RENDERERS[invoice_format](model),
+                                os.path.join(self.output_dir, INVOICE_FORMAT_DIRS[invoice_format]))
+        if "ubl" in self.formats:
+            self.pending.append((invoice_number, render_ubl(model)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return f"{invoice_number}.xml"
+
+    def flush(self):
+        """Validates and writes all buffered invoices."""
+        if not self.pending:
+            return
+        failures = validate_xrechnungen(self.pending, self.max_workers, self.xsd_path, self.schematron_path)
+        for invoice_number, errors in failures.items():
+            logging.error("XRechnung %s failed validation: %s", invoice_number, "; ".join(errors))
+        self.failures.update(failures)
+        self.total += len(self.pending)
+        for invoice_number, xml_bytes in self.pending:
+            write_xrechnung(invoice_number, xml_bytes, self.output_dir)
+        self.pending = []
+
+    def report(self):
+        return format_validation_report(self.failures, self.total)